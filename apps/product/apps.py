@@ -6,4 +6,6 @@ class ProductConfig(AppConfig):
     name = 'apps.product'
 
     def ready(self):
-        import apps.product.translation  # Bu qismni qo'shib ko'ring
\ No newline at end of file
+        import apps.product.translation  # Bu qismni qo'shib ko'ring
+        import apps.product.signals  # noqa
+        import apps.product.checks  # noqa
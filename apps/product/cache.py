@@ -0,0 +1,322 @@
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils.decorators import method_decorator
+from django.utils.translation import get_language
+from django.views.decorators.http import condition
+from rest_framework.response import Response
+
+from apps.product.models import Product
+
+CATALOG_GENERATION_KEY = "product:catalog:generation"
+CATALOG_MODIFIED_KEY = "product:catalog:modified"
+CATALOG_REFERENCE_VERSION_KEY = "product:catalog:reference-version"
+PRODUCT_VERSION_KEY = "product:detail-version:{}"
+
+# У каждого процесса свой экземпляр: поколение каталога не видно другим воркерам
+LOCAL_CACHE_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def _initial_generation():
+    # Если счётчик вытеснен из кэша, новое значение всё равно больше
+    # прежних, поэтому старые ключи никогда не станут снова актуальными
+    return int(time.time() * 1000)
+
+
+def get_catalog_generation():
+    generation = cache.get(CATALOG_GENERATION_KEY)
+    if generation is None:
+        cache.add(CATALOG_GENERATION_KEY, _initial_generation(), timeout=None)
+        generation = cache.get(CATALOG_GENERATION_KEY)
+    return generation
+
+
+def bump_catalog_generation():
+    """Инвалидирует все закэшированные страницы каталога и поиска."""
+    cache.set(CATALOG_MODIFIED_KEY, time.time(), timeout=None)
+    try:
+        return cache.incr(CATALOG_GENERATION_KEY)
+    except ValueError:
+        generation = _initial_generation()
+        cache.set(CATALOG_GENERATION_KEY, generation, timeout=None)
+        return generation
+
+
+def get_versions(*keys):
+    """Счётчики версий (как поколение каталога); отсутствующие инициализируются."""
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _initial_generation(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = _initial_generation()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def bump_product_versions(product_ids):
+    """Сбрасывает закэшированные детали продуктов (по id, а не slug: slug меняется)."""
+    for product_id in product_ids:
+        bump_version(PRODUCT_VERSION_KEY.format(product_id))
+
+
+def bump_reference_version():
+    """Категории, подкатегории, стоки: их названия входят в деталь продукта."""
+    bump_version(CATALOG_REFERENCE_VERSION_KEY)
+
+
+def get_catalog_last_modified():
+    modified = cache.get(CATALOG_MODIFIED_KEY)
+    if modified is None:
+        # Неизвестно — считаем, что каталог изменился только что
+        modified = time.time()
+        cache.add(CATALOG_MODIFIED_KEY, modified, timeout=None)
+    return datetime.fromtimestamp(modified, tz=timezone.utc)
+
+
+def normalized_query(request):
+    params = sorted(
+        (key, value)
+        for key in request.query_params
+        for value in request.query_params.getlist(key)
+        if value != ""
+    )
+    return urlencode(params)
+
+
+def catalog_cache_key(request, prefix):
+    raw = "|".join(
+        (request.get_host(), request.path, get_language() or "", normalized_query(request))
+    )
+    digest = hashlib.md5(raw.encode("utf-8")).hexdigest()
+    return f"product:{prefix}:{get_catalog_generation()}:{digest}"
+
+
+class CatalogCacheMixin:
+    """
+    Кэширует ответ list() по нормализованной строке запроса и языку.
+
+    Ключ содержит поколение каталога, поэтому при любой записи в каталог
+    (bump_catalog_generation) старые страницы просто перестают читаться.
+    """
+
+    cache_prefix = "catalog"
+
+    def list(self, request, *args, **kwargs):
+        if not settings.CATALOG_CACHE_ENABLED:
+            return super().list(request, *args, **kwargs)
+        key = catalog_cache_key(request, self.cache_prefix)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.CATALOG_CACHE_TIMEOUT)
+        return response
+
+
+def catalog_conditional(prefix):
+    """
+    Условный GET (ETag / Last-Modified) для ответов, зависящих только от
+    каталога и строки запроса. 304 отдаётся до выборки и сериализации.
+    Без CATALOG_CACHE_ENABLED валидаторов нет и 304 не отдаётся.
+    """
+
+    def etag(request, *args, **kwargs):
+        if not settings.CATALOG_CACHE_ENABLED:
+            return None
+        return hashlib.md5(catalog_cache_key(request, prefix).encode("utf-8")).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        if not settings.CATALOG_CACHE_ENABLED:
+            return None
+        return get_catalog_last_modified()
+
+    return method_decorator(condition(etag_func=etag, last_modified_func=last_modified))
+
+
+def _product_updated_at(request, slug):
+    # Один запрос на оба вызова (etag и last_modified) в рамках запроса
+    cached = getattr(request, "_product_updated_at", None)
+    if cached is None or cached[0] != slug:
+        updated_at = (
+            Product.objects.filter(slug=slug).values_list("updated_at", flat=True).first()
+        )
+        cached = request._product_updated_at = (slug, updated_at)
+    return cached[1]
+
+
+def product_etag(request, slug, *args, **kwargs):
+    if not settings.CATALOG_CACHE_ENABLED:
+        return None
+    updated_at = _product_updated_at(request, slug)
+    if updated_at is None:
+        return None
+    raw = "|".join(
+        (
+            slug,
+            updated_at.isoformat(),
+            str(get_catalog_generation()),
+            request.get_host(),
+            get_language() or "",
+        )
+    )
+    return hashlib.md5(raw.encode("utf-8")).hexdigest()
+
+
+def product_last_modified(request, slug, *args, **kwargs):
+    if not settings.CATALOG_CACHE_ENABLED:
+        return None
+    updated_at = _product_updated_at(request, slug)
+    if updated_at is None:
+        return None
+    # В детали есть связанные продукты и категории, поэтому учитываем и каталог
+    return max(updated_at, get_catalog_last_modified())
+
+
+product_conditional = method_decorator(
+    condition(etag_func=product_etag, last_modified_func=product_last_modified)
+)
+
+
+class CatalogMemoryCache:
+    """
+    Объект в памяти процесса (индекс поиска, подсказок), собранный из
+    каталога. build(using) вызывается заново при смене поколения каталога:
+    первый раз — сразу, дальше — в фоне (CATALOG_MEMORY_INDEX_REFRESH), а
+    до готовности отдаётся предыдущий объект. Без общего кэша
+    (CATALOG_CACHE_ENABLED) сдвиги поколения в других процессах не видны,
+    поэтому объект ещё и устаревает через CATALOG_MEMORY_INDEX_MAX_AGE секунд.
+    """
+
+    def __init__(self, build):
+        self.build = build
+        self.lock = threading.Lock()
+        self.key = None
+        self.value = None
+        self.rebuilding = False
+
+    @staticmethod
+    def current_key(using):
+        key = (connections[using].settings_dict["NAME"], get_catalog_generation())
+        if not settings.CATALOG_CACHE_ENABLED:
+            key += (int(time.time() // settings.CATALOG_MEMORY_INDEX_MAX_AGE),)
+        return key
+
+    def get(self, using="default"):
+        key = self.current_key(using)
+        if self.key == key:
+            return self.value
+        with self.lock:
+            if self.key == key:
+                return self.value
+            # Собранного для этой базы ещё нет — отдавать нечего, строим сразу
+            if (
+                self.key is None
+                or self.key[0] != key[0]
+                or settings.CATALOG_MEMORY_INDEX_REFRESH == "sync"
+            ):
+                self.value, self.key = self.build(using), key
+                return self.value
+            if self.rebuilding:
+                return self.value
+            self.rebuilding = True
+        run_in_background(self.rebuild, using, key)
+        return self.value
+
+    def rebuild(self, using, key):
+        try:
+            value = self.build(using)
+            with self.lock:
+                # Пока строили, могли переключиться на другую базу
+                if self.key is not None and self.key[0] == key[0]:
+                    self.value, self.key = value, key
+        finally:
+            self.rebuilding = False
+
+
+def run_in_background(function, *args):
+    def target():
+        try:
+            function(*args)
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=target, daemon=True).start()
+
+
+class ProductDetailCacheMixin:
+    """
+    Кэш итогового JSON детали продукта по slug, языку и хосту.
+
+    Запись сбрасывает запись жёстко, если изменился сам продукт
+    (bump_product_versions) или справочники (bump_reference_version).
+    Если изменилось лишь поколение каталога (связанные продукты) или запись
+    старше PRODUCT_DETAIL_CACHE_FRESH, отдаётся старая версия, а новая
+    собирается в фоне (stale-while-revalidate). Холодные ключи истекают
+    через PRODUCT_DETAIL_CACHE_TIMEOUT.
+    """
+
+    def detail_cache_key(self):
+        raw = "|".join(
+            (self.request.get_host(), self.kwargs[self.lookup_field], get_language() or "")
+        )
+        return f"product:detail:{hashlib.md5(raw.encode('utf-8')).hexdigest()}"
+
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.CATALOG_CACHE_ENABLED:
+            return super().retrieve(request, *args, **kwargs)
+        key = self.detail_cache_key()
+        entry = cache.get(key)
+        if entry is not None:
+            product_version, reference_version = get_versions(
+                PRODUCT_VERSION_KEY.format(entry["product_id"]), CATALOG_REFERENCE_VERSION_KEY
+            )
+            if entry["versions"] == (product_version, reference_version):
+                if (
+                    entry["generation"] != get_catalog_generation()
+                    or entry["fresh_until"] < time.time()
+                ) and cache.add(f"{key}:refreshing", 1, timeout=60):
+                    run_in_background(self.refresh_detail_cache, key)
+                return Response(entry["data"])
+
+        return Response(self.refresh_detail_cache(key))
+
+    def refresh_detail_cache(self, key):
+        instance = self.get_object()
+        # Версии читаются до сериализации: запись во время сборки не потеряется
+        versions = tuple(
+            get_versions(PRODUCT_VERSION_KEY.format(instance.pk), CATALOG_REFERENCE_VERSION_KEY)
+        )
+        generation = get_catalog_generation()
+        data = self.get_serializer(instance).data
+        cache.set(
+            key,
+            {
+                "product_id": instance.pk,
+                "versions": versions,
+                "generation": generation,
+                "fresh_until": time.time() + settings.PRODUCT_DETAIL_CACHE_FRESH,
+                "data": data,
+            },
+            settings.PRODUCT_DETAIL_CACHE_TIMEOUT,
+        )
+        cache.delete(f"{key}:refreshing")
+        return data
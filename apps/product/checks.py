@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+from apps.product.cache import LOCAL_CACHE_BACKENDS
+
+
+@register(Tags.caches)
+def check_catalog_cache_backend(app_configs, **kwargs):
+    # Поколение каталога в кэше процесса: другие воркеры не увидят сброс
+    # и будут отдавать устаревшие страницы и 304
+    backend = settings.CACHES["default"]["BACKEND"]
+    if settings.CATALOG_CACHE_ENABLED and backend in LOCAL_CACHE_BACKENDS:
+        return [
+            Error(
+                f"CATALOG_CACHE_ENABLED requires a cache shared by all workers, not {backend}.",
+                hint="Set CACHE_BACKEND to RedisCache or PyMemcacheCache, or CATALOG_CACHE_ENABLED=false.",
+                id="product.E001",
+            )
+        ]
+    return []
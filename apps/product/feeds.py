@@ -0,0 +1,212 @@
+import csv
+import gzip
+import json
+import os
+import re
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from apps.product.models import Product
+
+FEED_DIRECTORY = "feeds"
+FEED_CHUNK_SIZE = 1000
+FEED_FORMATS = ("csv", "ndjson", "xml")
+
+# Кэш готовых записей (по возрастанию id) и время предыдущего запуска
+RECORDS_FILE = "records.ndjson.gz"
+STATE_FILE = "state.json"
+
+FEED_COLUMNS = (
+    "id",
+    "slug",
+    "title_uz",
+    "title_ru",
+    "description_uz",
+    "description_ru",
+    "price",
+    "sale_price",
+    "availability",
+    "gender",
+    "category_uz",
+    "category_ru",
+    "sub_category_uz",
+    "sub_category_ru",
+    "link",
+    "image_link",
+    "additional_image_links",
+)
+
+# Символы, недопустимые в XML 1.0
+XML_INVALID_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
+def feed_directory():
+    return Path(settings.MEDIA_ROOT) / FEED_DIRECTORY
+
+
+def feed_path(feed_format):
+    return feed_directory() / f"products.{feed_format}.gz"
+
+
+def media_link(path):
+    return f"{settings.PROD_BASE_URL.rstrip('/')}/{settings.MEDIA_URL.strip('/')}/{path}"
+
+
+def feed_records(product_ids):
+    """{id: запись фида} для продуктов; два запроса на пачку."""
+    if not product_ids:
+        return {}
+    images = {}
+    for product_id, path in (
+        Product.images.through.objects.filter(product_id__in=product_ids)
+        .order_by("images_id")
+        .values_list("product_id", "images__image")
+    ):
+        images.setdefault(product_id, []).append(media_link(path))
+
+    records = {}
+    for row in Product.objects.filter(pk__in=product_ids).values(
+        "id",
+        "slug",
+        "title_uz",
+        "title_ru",
+        "description_uz",
+        "description_ru",
+        "price",
+        "sales",
+        "is_available",
+        "gender",
+        category_uz=F("sub_category__category__title_uz"),
+        category_ru=F("sub_category__category__title_ru"),
+        sub_category_uz=F("sub_category__title_uz"),
+        sub_category_ru=F("sub_category__title_ru"),
+    ):
+        links = images.get(row["id"], [])
+        sales = row.pop("sales")
+        records[row["id"]] = {
+            **row,
+            "sale_price": row["price"] - sales if sales else None,
+            "availability": "in stock" if row.pop("is_available") else "out of stock",
+            "link": settings.PRODUCT_FEED_LINK.format(slug=row["slug"]),
+            "image_link": links[0] if links else None,
+            "additional_image_links": ",".join(links[1:]),
+        }
+    # Порядок ключей фиксирован: одинаковые записи дают одинаковые строки кэша
+    return {
+        product_id: {column: record[column] for column in FEED_COLUMNS}
+        for product_id, record in records.items()
+    }
+
+
+def cached_records(path):
+    """(id, запись) из кэша предыдущего запуска, по возрастанию id."""
+    if path is None or not path.exists():
+        return
+    with gzip.open(path, "rt", encoding="utf-8") as stream:
+        for line in stream:
+            record = json.loads(line)
+            yield record["id"], record
+
+
+class FeedWriter:
+    """Пишет фиды всех форматов во временные файлы, по одной записи."""
+
+    def __init__(self, directory, generated_at):
+        self.directory = directory
+        self.files = {
+            name: gzip.open(directory / f".{name}.tmp", "wt", encoding="utf-8", newline="")
+            for name in (*FEED_FORMATS, "records")
+        }
+        self.csv = csv.writer(self.files["csv"])
+        self.csv.writerow(FEED_COLUMNS)
+        self.files["xml"].write(
+            f'<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<products generated_at="{generated_at.isoformat()}">\n'
+        )
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        self.files["records"].write(line + "\n")
+        self.files["ndjson"].write(line + "\n")
+        self.csv.writerow(["" if record[column] is None else record[column] for column in FEED_COLUMNS])
+        self.files["xml"].write(
+            "  <product>"
+            + "".join(
+                f"<{column}>{escape(XML_INVALID_RE.sub('', str(record[column])))}</{column}>"
+                for column in FEED_COLUMNS
+                if record[column] is not None
+            )
+            + "</product>\n"
+        )
+
+    def close(self):
+        self.files["xml"].write("</products>\n")
+        for stream in self.files.values():
+            stream.close()
+        # Подмена целиком: читатели видят либо старый, либо новый файл
+        for name in self.files:
+            target = RECORDS_FILE if name == "records" else feed_path(name).name
+            os.replace(self.directory / f".{name}.tmp", self.directory / target)
+
+
+def generate_feeds(full=False, chunk_size=FEED_CHUNK_SIZE):
+    """
+    Пересобирает фиды в MEDIA_ROOT/feeds. Заново строятся только продукты,
+    у которых updated_at изменился с прошлого запуска (и новые), остальные
+    записи берутся из кэша. full=True — полная пересборка (например, после
+    переименования категорий, которое не меняет updated_at продуктов).
+    """
+    directory = feed_directory()
+    directory.mkdir(parents=True, exist_ok=True)
+    state_path = directory / STATE_FILE
+    records_path = directory / RECORDS_FILE
+
+    since = None
+    if not full and state_path.exists() and records_path.exists():
+        since = datetime.fromisoformat(json.loads(state_path.read_text())["generated_at"])
+    # Время фиксируется до чтения: изменения во время сборки попадут в следующий запуск
+    started = timezone.now()
+
+    changed = set()
+    if since is not None:
+        changed = set(Product.objects.filter(updated_at__gte=since).values_list("pk", flat=True))
+
+    stats = {"total": 0, "rebuilt": 0, "reused": 0}
+    previous = cached_records(records_path if since is not None else None)
+    previous_id, previous_record = next(previous, (None, None))
+
+    writer = FeedWriter(directory, started)
+    ids = Product.objects.order_by("pk").values_list("pk", flat=True).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(ids, chunk_size))
+        if not chunk:
+            break
+
+        reused = {}
+        for product_id in chunk:
+            # Удалённые продукты просто пропускаются
+            while previous_id is not None and previous_id < product_id:
+                previous_id, previous_record = next(previous, (None, None))
+            if previous_id == product_id and product_id not in changed:
+                reused[product_id] = previous_record
+
+        rebuilt = feed_records([pk for pk in chunk if pk not in reused])
+        for product_id in chunk:
+            record = reused.get(product_id) or rebuilt.get(product_id)
+            if record is not None:
+                writer.write(record)
+
+        stats["total"] += len(reused) + len(rebuilt)
+        stats["reused"] += len(reused)
+        stats["rebuilt"] += len(rebuilt)
+
+    previous.close()
+    writer.close()
+    state_path.write_text(json.dumps({"generated_at": started.isoformat(), **stats}))
+    return stats
@@ -1,12 +1,102 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.db.models import Q
 from django_filters import CharFilter, FilterSet, NumberFilter, OrderingFilter
 from django_filters import rest_framework as filters
-from apps.product.models import Product
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import SearchFilter
+from apps.product.models import (Category, IndexCategory, Product, Stock,
+                                 SubCategory)
 from django_filters import FilterSet, CharFilter, NumberFilter, OrderingFilter
 from django.db.models import Q
 from apps.product.models import Product, OrderUser
+from apps.product.fuzzy import fuzzy_search
+from apps.product.normalize import normalize_search_text
+from apps.product.search import full_text_available, full_text_search
+
+TITLE_ID_MAP_TIMEOUT = 60 * 60 * 24
+
+
+def title_id_map_key(model):
+    return f"product:title-id-map:{model._meta.model_name}"
+
+
+def title_id_map(model):
+    """
+    {title в casefold: {id, ...}} по title_ru и title_uz модели.
+
+    Кэшируется и сбрасывается сигналами при изменении модели
+    (apps.product.signals). Без общего кэша (CATALOG_CACHE_ENABLED) сброс
+    в других воркерах не виден, поэтому карта живёт не дольше
+    CATALOG_MEMORY_INDEX_MAX_AGE секунд.
+    """
+    key = title_id_map_key(model)
+    mapping = cache.get(key)
+    if mapping is None:
+        mapping = {}
+        for pk, title_ru, title_uz in model.objects.values_list(
+            "pk", "title_ru", "title_uz"
+        ):
+            for title in (title_ru, title_uz):
+                if title:
+                    mapping.setdefault(title.strip().casefold(), set()).add(pk)
+        timeout = TITLE_ID_MAP_TIMEOUT
+        if not settings.CATALOG_CACHE_ENABLED:
+            timeout = settings.CATALOG_MEMORY_INDEX_MAX_AGE
+        cache.set(key, mapping, timeout)
+    return mapping
+
+
+def invalidate_title_id_map(model):
+    cache.delete(title_id_map_key(model))
+
+
+def resolve_ids(model, value, substring=True):
+    """
+    Переводит значение фильтра "1,2,Krem" в множество id.
+
+    Числа принимаются как id, названия ищутся в кэшированной карте:
+    сначала точное совпадение, затем (если ``substring``) вхождение
+    подстроки, как прежний icontains.
+    """
+    ids = set()
+    mapping = None
+    for token in value.split(","):
+        token = token.strip()
+        if not token:
+            continue
+        if token.isdigit():
+            ids.add(int(token))
+            continue
+
+        if mapping is None:
+            mapping = title_id_map(model)
+        needle = token.casefold()
+        if needle in mapping:
+            ids |= mapping[needle]
+        elif substring:
+            for title, pks in mapping.items():
+                if needle in title:
+                    ids |= pks
+    return ids
+
+# Ценовые интервалы для фасетов: (min включительно, max не включительно)
+PRICE_FACET_BUCKETS = (
+    (0, 50000),
+    (50000, 100000),
+    (100000, 200000),
+    (200000, 500000),
+    (500000, None),
+)
+
 
 class ProductFilter(FilterSet):
+    GENDER_MAP = {
+        'male': 'M', 'erkak': 'M',
+        'female': 'F', 'ayol': 'F',
+        'unisex': 'U'
+    }
+
     category = CharFilter(method="filter_category_title")
     index_category = CharFilter(method="filter_index_category_title")
     sub_category = CharFilter(method="filter_sub_category_title")
@@ -34,12 +124,7 @@ class ProductFilter(FilterSet):
 
     @staticmethod
     def filter_gender(queryset, name, value):
-        gender_map = {
-            'male': 'M', 'erkak': 'M',
-            'female': 'F', 'ayol': 'F',
-            'unisex': 'U'
-        }
-        gender_code = gender_map.get(value.lower(), None)
+        gender_code = ProductFilter.GENDER_MAP.get(value.lower(), None)
         print(f"Received gender value: {value}, Mapped gender code: {gender_code}")  # Debug line
         if gender_code:
             return queryset.filter(gender=gender_code)
@@ -47,37 +132,23 @@ class ProductFilter(FilterSet):
 
     @staticmethod
     def filter_category_title(queryset, name, value):
-        categories = value.split(",")
-        category_filters = Q()
-        for category in categories:
-            category_filters |= Q(
-                sub_category__category__title_ru__icontains=category
-            ) | Q(sub_category__category__title_uz__icontains=category)
-        return queryset.filter(category_filters)
+        return queryset.filter(category_id__in=resolve_ids(Category, value))
 
     @staticmethod
     def filter_index_category_title(queryset, name, value):
-        index_categories = value.split(",")
-        index_category_filters = Q()
-        for index_category in index_categories:
-            index_category_filters |= Q(
-                index_category__title_uz__icontains=index_category
-            ) | Q(index_category__title_ru__icontains=index_category)
-        return queryset.filter(index_category_filters)
+        return queryset.filter(
+            index_category_id__in=resolve_ids(IndexCategory, value)
+        )
 
     @staticmethod
     def filter_sub_category_title(queryset, name, value):
-        sub_categories = value.split(",")
-        sub_category_filters = Q()
-        for sub_category in sub_categories:
-            sub_category_filters |= Q(
-                sub_category__title_ru__icontains=sub_category
-            ) | Q(sub_category__title_uz__icontains=sub_category)
-        return queryset.filter(sub_category_filters)
+        return queryset.filter(sub_category_id__in=resolve_ids(SubCategory, value))
 
     @staticmethod
     def filter_stock(queryset, name, value):
-        return queryset.filter(stock__title=value)
+        return queryset.filter(
+            stock_id__in=resolve_ids(Stock, value, substring=False)
+        )
 
     @staticmethod
     def filter_has_sale(queryset, name, value):
@@ -93,6 +164,22 @@ class ProductFilter(FilterSet):
             return queryset.order_by("-id")
         return queryset
 
+    @classmethod
+    def facet_queryset(cls, data, exclude=(), request=None):
+        """
+        Queryset продуктов со всеми активными фильтрами, кроме ``exclude``.
+
+        Сортировка сбрасывается, чтобы не попадать в GROUP BY.
+        """
+        data = data.copy()
+        for name in (*exclude, "order_by", "is_new"):
+            data.pop(name, None)
+
+        filterset = cls(data=data, queryset=Product.objects.all(), request=request)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        return filterset.qs.order_by()
+
     class Meta:
         model = Product
         fields = [
@@ -110,6 +197,34 @@ class ProductFilter(FilterSet):
         ]
 
 
+def normalized_search(queryset, text):
+    # Запрос нормализуется так же, как индексируемые названия
+    return queryset.filter(
+        *(Q(search_text__contains=term) for term in normalize_search_text(text).split())
+    )
+
+
+class ProductFullTextSearchFilter(SearchFilter):
+    """
+    ?search= через tsvector и GIN-индекс в PostgreSQL, с сортировкой по
+    ts_rank, или FTS5 в SQLite. Без них — вхождение всех нормализованных
+    слов в Product.search_text. ?fuzzy=true — поиск с опечатками по
+    названиям (триграммы).
+    """
+
+    fuzzy_param = "fuzzy"
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if terms and request.query_params.get(self.fuzzy_param) in ("true", "1"):
+            return fuzzy_search(queryset, " ".join(terms))
+        if not terms:
+            return queryset
+        if not full_text_available(queryset):
+            return normalized_search(queryset, " ".join(terms))
+        return full_text_search(queryset, " ".join(terms))
+
+
 class ProductSearchFilter(FilterSet):
     class Meta:
         model = Product
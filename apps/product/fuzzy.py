@@ -0,0 +1,109 @@
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.postgres.lookups import TrigramWordSimilar
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connections, transaction
+from django.db.models import Case, F, Value, When
+
+from apps.product.cache import CatalogMemoryCache
+from apps.product.models import Product
+from apps.product.normalize import normalize_search_text
+
+# Не больше стольких результатов нечёткого поиска (лучшие по оценке)
+FUZZY_MAX_RESULTS = 200
+# Нормализованные названия uz/ru: латиница и кириллица сравниваются одинаково
+FUZZY_FIELD = "search_text"
+
+WORD_RE = re.compile(r"[^\W_]+")
+
+
+def trigrams(text):
+    """Триграммы как в pg_trgm: по словам, слово дополнено "  " слева и " " справа."""
+    result = set()
+    for word in WORD_RE.findall((text or "").casefold()):
+        padded = f"  {word} "
+        result.update(padded[index:index + 3] for index in range(len(padded) - 2))
+    return result
+
+
+class TrigramIndex:
+    """
+    Обратный индекс триграмм search_text для баз без pg_trgm. Оценка — доля
+    триграмм запроса, найденных где угодно в названии. Это не word_similarity
+    из pg_trgm (там считается лучший непрерывный фрагмент названия), так что
+    один и тот же порог на PostgreSQL отбирает не ровно те же продукты.
+    """
+
+    def __init__(self, rows):
+        self.postings = {}
+        for product_id, text in rows:
+            for trigram in trigrams(text):
+                self.postings.setdefault(trigram, []).append(product_id)
+
+    def search(self, text, threshold, limit=FUZZY_MAX_RESULTS):
+        """[(product_id, score), ...] по убыванию оценки, затем id."""
+        query = trigrams(text)
+        if not query:
+            return []
+        shared = Counter()
+        for trigram in query:
+            shared.update(self.postings.get(trigram, ()))
+
+        minimum = math.ceil(threshold * len(query) - 1e-9)
+        ranked = sorted(
+            (
+                (-count, -product_id)
+                for product_id, count in shared.items()
+                if count >= minimum
+            )
+        )[:limit]
+        return [(-product_id, -count / len(query)) for count, product_id in ranked]
+
+
+def build_trigram_index(using):
+    rows = Product.objects.using(using).values_list("pk", FUZZY_FIELD)
+    return TrigramIndex(rows.iterator(chunk_size=2000))
+
+
+trigram_index = CatalogMemoryCache(build_trigram_index)
+
+
+def postgresql_fuzzy_search(queryset, text, threshold, limit=FUZZY_MAX_RESULTS):
+    """
+    [(product_id, score), ...]: оператор %> по GIN-индексу gin_trgm_ops,
+    ранжирование по word_similarity. Порог оператора — настройка pg_trgm;
+    она задаётся только на транзакцию, чтобы не остаться на соединении из пула.
+    """
+    with transaction.atomic(using=queryset.db):
+        with connections[queryset.db].cursor() as cursor:
+            cursor.execute(
+                "SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)", [str(threshold)]
+            )
+        return list(
+            queryset.filter(TrigramWordSimilar(F(FUZZY_FIELD), Value(text)))
+            .annotate(fuzzy_score=TrigramWordSimilarity(Value(text), FUZZY_FIELD))
+            .order_by("-fuzzy_score", "-id")
+            .values_list("pk", "fuzzy_score")[:limit]
+        )
+
+
+def fuzzy_search(queryset, text, threshold=None):
+    """Поиск с опечатками по названиям (uz/ru) в любой письменности."""
+    threshold = settings.PRODUCT_FUZZY_SEARCH_THRESHOLD if threshold is None else threshold
+    text = normalize_search_text(text)
+    if not text:
+        return queryset
+    if connections[queryset.db].vendor == "postgresql":
+        # Выборка выполняется сразу: в той же транзакции, что и порог
+        ranked = postgresql_fuzzy_search(queryset, text, threshold)
+    else:
+        ranked = trigram_index.get(queryset.db).search(text, threshold)
+    return queryset.filter(pk__in=[product_id for product_id, _ in ranked]).alias(
+        fuzzy_rank=Case(
+            *(When(pk=product_id, then=Value(rank)) for rank, (product_id, _) in enumerate(ranked)),
+            default=Value(len(ranked)),
+        )
+    ).order_by("fuzzy_rank")
@@ -0,0 +1,138 @@
+import hashlib
+
+import numpy
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import (Count, F, FloatField, Func, IntegerField, Max,
+                              Min, Value)
+from django.db.models.functions import Cast, Coalesce, Least
+
+from apps.product.cache import get_catalog_generation
+
+PRICE_HISTOGRAM_BUCKETS = 10
+MAX_PRICE_HISTOGRAM_BUCKETS = 50
+
+# Гистограмма строится по цене и по цене со скидкой (Product.discounted_price)
+PRICE_EXPRESSIONS = {
+    "price": F("price"),
+    "effective_price": F("price") - Coalesce(F("sales"), 0),
+}
+
+
+class WidthBucket(Func):
+    function = "WIDTH_BUCKET"
+    output_field = IntegerField()
+
+
+def bucket_edges(low, high, buckets):
+    return [low + (high - low) * index / buckets for index in range(buckets + 1)]
+
+
+def histogram_data(low, high, counts):
+    if low is None:
+        return {"min_price": None, "max_price": None, "buckets": []}
+
+    edges = bucket_edges(low, high, len(counts))
+    return {
+        "min_price": low,
+        "max_price": high,
+        "buckets": [
+            {
+                "min_price": round(edges[index], 2),
+                "max_price": round(edges[index + 1], 2),
+                "count": count,
+            }
+            for index, count in enumerate(counts)
+        ],
+    }
+
+
+def price_histogram(queryset, buckets=PRICE_HISTOGRAM_BUCKETS):
+    """
+    Гистограммы price и effective_price для отфильтрованного queryset.
+
+    PostgreSQL считает корзины в SQL (WIDTH_BUCKET + GROUP BY), остальные
+    базы — NumPy по закэшированному массиву цен.
+    """
+    queryset = queryset.order_by()
+    if connections[queryset.db].vendor == "postgresql":
+        return sql_price_histogram(queryset, buckets)
+    return numpy_price_histogram(queryset, buckets)
+
+
+def sql_price_histogram(queryset, buckets):
+    aggregates = {"total": Count("id")}
+    for name, expression in PRICE_EXPRESSIONS.items():
+        aggregates[f"{name}_min"] = Min(expression)
+        aggregates[f"{name}_max"] = Max(expression)
+    bounds = queryset.aggregate(**aggregates)
+
+    result = {}
+    for name, expression in PRICE_EXPRESSIONS.items():
+        low, high = bounds[f"{name}_min"], bounds[f"{name}_max"]
+        if low is None or low == high:
+            result[name] = histogram_data(low, high, [bounds["total"]])
+            continue
+
+        # WIDTH_BUCKET возвращает buckets + 1 для значения, равного high
+        bucket = Least(
+            WidthBucket(
+                Cast(expression, FloatField()),
+                Value(float(low)),
+                Value(float(high)),
+                Value(buckets),
+            ),
+            Value(buckets),
+        )
+        counts = [0] * buckets
+        for row in (
+            queryset.annotate(bucket=bucket)
+            .values("bucket")
+            .annotate(count=Count("id"))
+            .order_by("bucket")
+        ):
+            counts[row["bucket"] - 1] = row["count"]
+        result[name] = histogram_data(low, high, counts)
+    return result
+
+
+def price_arrays(queryset):
+    """
+    Массивы цен выборки; кэшируются по SQL запроса и поколению каталога.
+    Без общего кэша (CATALOG_CACHE_ENABLED) сдвиги поколения в других
+    воркерах не видны: массивы живут не дольше CATALOG_MEMORY_INDEX_MAX_AGE.
+    """
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.md5(f"{sql}|{params}".encode("utf-8")).hexdigest()
+    key = f"product:price-array:{get_catalog_generation()}:{digest}"
+
+    arrays = cache.get(key)
+    if arrays is None:
+        rows = numpy.array(
+            list(queryset.values_list(*PRICE_EXPRESSIONS.values())), dtype=numpy.int64
+        ).reshape(-1, len(PRICE_EXPRESSIONS))
+        arrays = dict(zip(PRICE_EXPRESSIONS, rows.T))
+        timeout = settings.CATALOG_CACHE_TIMEOUT
+        if not settings.CATALOG_CACHE_ENABLED:
+            timeout = settings.CATALOG_MEMORY_INDEX_MAX_AGE
+        cache.set(key, arrays, timeout)
+    return arrays
+
+
+def numpy_price_histogram(queryset, buckets):
+    result = {}
+    for name, prices in price_arrays(queryset).items():
+        if not len(prices):
+            result[name] = histogram_data(None, None, [])
+            continue
+
+        low, high = prices.min().item(), prices.max().item()
+        if low == high:
+            result[name] = histogram_data(low, high, [len(prices)])
+            continue
+
+        # Последняя корзина NumPy включает правую границу, как Least(...) в SQL
+        counts, _ = numpy.histogram(prices, bins=bucket_edges(low, high, buckets))
+        result[name] = histogram_data(low, high, counts.tolist())
+    return result
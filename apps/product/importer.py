@@ -0,0 +1,357 @@
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.core.validators import slug_re
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
+
+from apps.product.models import (SLUG_SAVE_ATTEMPTS, Category, Images,
+                                 IndexCategory, Product, ShortDescription,
+                                 Stock, SubCategory, allocate_slugs)
+from apps.product.signals import products_changed
+
+IMPORT_BATCH_SIZE = 500
+READ_CHUNK_SIZE = 64 * 1024
+
+TEXT_FIELDS = ("title_uz", "title_ru", "description_uz", "description_ru")
+FOREIGN_KEYS = {
+    "category": Category,
+    "sub_category": SubCategory,
+    "index_category": IndexCategory,
+    "stock": Stock,
+}
+REQUIRED_FOREIGN_KEYS = ("category", "sub_category")
+SHORT_DESCRIPTION_FIELDS = ("key_uz", "key_ru", "value_uz", "value_ru")
+MAX_IMAGES = 3
+
+
+def iter_records(stream):
+    """
+    Потоковое чтение JSON-массива (как keraksiz.json) или NDJSON из
+    текстового потока: в памяти только текущий объект и буфер чтения.
+    Отдаёт (номер записи с 1, объект).
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    array = None
+    number = 0
+
+    while True:
+        # Пропускаем пробелы, запятые и скобки массива
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position == len(buffer):
+                chunk = stream.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    return
+                buffer, position = chunk, 0
+                continue
+            if array is None:
+                array = buffer[position] == "["
+                if array:
+                    position += 1
+                    continue
+            if array and buffer[position] == "]":
+                return
+            break
+
+        while True:
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+                break
+            except json.JSONDecodeError:
+                chunk = stream.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    raise
+                buffer, position = buffer[position:] + chunk, 0
+
+        number += 1
+        yield number, record
+        buffer, position = buffer[end:], 0
+
+
+class ProductImporter:
+    """
+    Импорт продуктов пачками: проверка в памяти по заранее загруженным id,
+    затем bulk_create/bulk_update продуктов, описаний и связей с картинками
+    в одной транзакции на пачку. Запись со slug существующего продукта
+    обновляет его (upsert), без slug — создаёт новый. Пачка, которую
+    не удалось записать и после повторов, попадает в отчёт как ошибки строк.
+    """
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.known_ids = {
+            field: set(model.objects.values_list("pk", flat=True))
+            for field, model in FOREIGN_KEYS.items()
+        }
+        self.report = {"created": 0, "updated": 0, "errors": []}
+
+    def run(self, stream):
+        batch = []
+        for number, record in iter_records(stream):
+            batch.append((number, record))
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+        return self.report
+
+    def validate(self, record, image_ids):
+        if not isinstance(record, dict):
+            return None, {api_settings.NON_FIELD_ERRORS_KEY: ["Expected a JSON object."]}
+
+        errors = {}
+        values = {}
+        for field in TEXT_FIELDS:
+            value = record.get(field)
+            if value is not None and not isinstance(value, str):
+                errors[field] = ["Not a valid string."]
+            elif value and any(char in value for char in "\\<>&"):
+                errors[field] = [f"Field '{field}' contains disallowed symbols."]
+            else:
+                values[field] = value
+        if not (values.get("title_uz") or values.get("title_ru")):
+            errors.setdefault("title_uz", ["title_uz or title_ru is required."])
+
+        for field in ("price", "sales"):
+            value = record.get(field)
+            if value is None and field == "sales":
+                values[field] = None
+            elif isinstance(value, bool) or not isinstance(value, int) or value < 0:
+                errors[field] = ["A valid non-negative integer is required."]
+            else:
+                values[field] = value
+
+        is_available = record.get("is_available", True)
+        if not isinstance(is_available, bool):
+            errors["is_available"] = ["Must be a valid boolean."]
+        values["is_available"] = is_available
+
+        gender = record.get("gender", "U")
+        if gender not in dict(Product.GENDER_CHOICES):
+            errors["gender"] = [f'"{gender}" is not a valid choice.']
+        values["gender"] = gender
+
+        for field in FOREIGN_KEYS:
+            value = record.get(field)
+            if value is None:
+                if field in REQUIRED_FOREIGN_KEYS:
+                    errors[field] = ["This field is required."]
+                values[f"{field}_id"] = None
+            elif value not in self.known_ids[field]:
+                errors[field] = [f'Invalid pk "{value}" - object does not exist.']
+            else:
+                values[f"{field}_id"] = value
+
+        images = record.get("image_ids") or []
+        if not isinstance(images, list):
+            errors["image_ids"] = ["Expected a list of items."]
+        elif len(set(images)) > MAX_IMAGES:
+            errors["image_ids"] = [f"Cannot have more than {MAX_IMAGES} images for a product."]
+        elif any(image_id not in image_ids for image_id in images):
+            errors["image_ids"] = ["Invalid pk - object does not exist."]
+
+        descriptions = record.get("short_descriptions") or []
+        if not isinstance(descriptions, list) or not all(
+            isinstance(description, dict)
+            and all(isinstance(description.get(key, ""), str) for key in SHORT_DESCRIPTION_FIELDS)
+            for description in descriptions
+        ):
+            errors["short_descriptions"] = ["Expected a list of key/value objects."]
+
+        slug = record.get("slug")
+        if slug is not None and (
+            not isinstance(slug, str)
+            or not slug_re.match(slug)
+            or len(slug) > Product._meta.get_field("slug").max_length
+        ):
+            # Те же правила, что у SlugField
+            errors["slug"] = ["Not a valid slug."]
+
+        if errors:
+            return None, errors
+
+        # Базовые поля modeltranslation берутся из ru: пустой ru заполняется из uz
+        values["title_ru"] = values["title_ru"] or values["title_uz"]
+        values["description_ru"] = values["description_ru"] or values["description_uz"] or ""
+        product = Product(**values)
+        try:
+            # Те же правила, что и при сохранении через API
+            product.clean()
+        except ValidationError as error:
+            return None, {api_settings.NON_FIELD_ERRORS_KEY: error.detail}
+
+        return {
+            "product": product,
+            "slug": slug,
+            "image_ids": list(dict.fromkeys(images)),
+            "short_descriptions": [
+                {key: description.get(key, "") for key in SHORT_DESCRIPTION_FIELDS}
+                for description in descriptions
+            ],
+        }, None
+
+    def import_batch(self, batch):
+        image_ids = set(
+            Images.objects.filter(
+                pk__in={
+                    image_id
+                    for _, record in batch
+                    if isinstance(record, dict) and isinstance(record.get("image_ids"), list)
+                    for image_id in record["image_ids"]
+                    if isinstance(image_id, int)
+                }
+            ).values_list("pk", flat=True)
+        )
+
+        rows = []
+        seen_slugs = set()
+        for number, record in batch:
+            row, errors = self.validate(record, image_ids)
+            if row and row["slug"] and row["slug"] in seen_slugs:
+                row, errors = None, {"slug": ["Duplicate slug in the same batch."]}
+            if errors:
+                slug = record.get("slug") if isinstance(record, dict) else None
+                self.report["errors"].append({"row": number, "slug": slug, "errors": errors})
+                continue
+            seen_slugs.add(row["slug"])
+            row["row"] = number
+            rows.append(row)
+
+        if not rows:
+            return
+        for attempt in range(SLUG_SAVE_ATTEMPTS):
+            try:
+                # write — атомарный блок (savepoint внутри внешней транзакции):
+                # при ошибке пачка откатывается целиком
+                self.write(rows)
+                break
+            except IntegrityError as error:
+                # Параллельная запись заняла slug между allocate_slugs и
+                # bulk_create: повтор распределит slug заново
+                if attempt == SLUG_SAVE_ATTEMPTS - 1:
+                    errors = {api_settings.NON_FIELD_ERRORS_KEY: [f"Batch not written: {error}"]}
+                    self.report["errors"].extend(
+                        {"row": row["row"], "slug": row["slug"], "errors": errors} for row in rows
+                    )
+
+    @transaction.atomic
+    def write(self, rows):
+        existing = Product.objects.in_bulk(
+            [row["slug"] for row in rows if row["slug"]], field_name="slug"
+        )
+        to_create = [row for row in rows if row["slug"] not in existing]
+        to_update = [row for row in rows if row["slug"] in existing]
+
+        # Явные slug пачки не должны достаться записям без slug
+        new_slugs = iter(
+            allocate_slugs(
+                [row["product"].title_ru or row["product"].title_uz for row in to_create if not row["slug"]],
+                reserved=[row["slug"] for row in to_create if row["slug"]],
+            )
+        )
+        for row in to_create:
+            # После отката прошлой попытки у продукта может остаться pk
+            row["product"].pk = None
+            row["product"].slug = row["slug"] or next(new_slugs)
+        Product.objects.bulk_create([row["product"] for row in to_create])
+
+        update_fields = [
+            *TEXT_FIELDS, "title", "description", "price", "sales", "is_available", "gender",
+            *(f"{field}_id" for field in FOREIGN_KEYS), "updated_at",
+        ]
+        # bulk_update не заполняет auto_now
+        now = timezone.now()
+        for row in to_update:
+            product = row["product"]
+            product.pk = existing[row["slug"]].pk
+            product.slug = row["slug"]
+            product.updated_at = now
+        Product.objects.bulk_update(
+            [row["product"] for row in to_update], update_fields, batch_size=self.batch_size
+        )
+
+        # Вложенные данные обновлённых продуктов заменяются целиком
+        updated_ids = [row["product"].pk for row in to_update]
+        ShortDescription.objects.filter(product_id__in=updated_ids).delete()
+        Product.images.through.objects.filter(product_id__in=updated_ids).delete()
+
+        ShortDescription.objects.bulk_create(
+            ShortDescription(product_id=row["product"].pk, **description)
+            for row in rows
+            for description in row["short_descriptions"]
+        )
+        Product.images.through.objects.bulk_create(
+            Product.images.through(product_id=row["product"].pk, images_id=image_id)
+            for row in rows
+            for image_id in row["image_ids"]
+        )
+
+        # bulk-операции обходят сигналы: read-модель и кэши обновляются явно
+        products_changed(row["product"].pk for row in rows)
+        self.report["created"] += len(to_create)
+        self.report["updated"] += len(to_update)
+
+
+EXPORT_CHUNK_SIZE = 500
+EXPORT_FIELDS = (
+    "id", "slug", *TEXT_FIELDS, "price", "sales", "is_available", "gender",
+    *(f"{field}_id" for field in FOREIGN_KEYS),
+)
+
+
+def export_records(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Продукты в формате импорта (со slug — повторный импорт обновляет их).
+    Строки читаются через iterator(), картинки и описания — двумя запросами
+    на пачку, так что память не зависит от размера каталога.
+    """
+    rows = queryset.values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+
+        ids = [row["id"] for row in chunk]
+        images = defaultdict(list)
+        for product_id, image_id in (
+            Product.images.through.objects.filter(product_id__in=ids)
+            .order_by("images_id")
+            .values_list("product_id", "images_id")
+        ):
+            images[product_id].append(image_id)
+        descriptions = defaultdict(list)
+        for description in (
+            ShortDescription.objects.filter(product_id__in=ids)
+            .order_by("id")
+            .values("product_id", *SHORT_DESCRIPTION_FIELDS)
+        ):
+            descriptions[description.pop("product_id")].append(description)
+
+        for row in chunk:
+            for field in FOREIGN_KEYS:
+                row[field] = row.pop(f"{field}_id")
+            row["image_ids"] = images[row["id"]]
+            row["short_descriptions"] = descriptions[row["id"]]
+            yield row
+
+
+def stream_export(queryset, export_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Части ответа: JSON-массив или NDJSON (по объекту на строку)."""
+    records = export_records(queryset, chunk_size)
+    if export_format == "ndjson":
+        for record in records:
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+        return
+
+    yield "["
+    for index, record in enumerate(records):
+        yield ("," if index else "") + "\n" + json.dumps(record, ensure_ascii=False)
+    yield "\n]\n"
@@ -0,0 +1,58 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIRequestFactory
+
+from apps.product.models import Product
+from apps.product.serializers import (ProductCatalogSerializer,
+                                      ProductCatalogValuesSerializer,
+                                      ProductSearchSerializer,
+                                      ProductSearchValuesSerializer)
+
+PAIRS = (
+    ("catalog", ProductCatalogSerializer, ProductCatalogValuesSerializer),
+    ("search", ProductSearchSerializer, ProductSearchValuesSerializer),
+)
+
+
+class Command(BaseCommand):
+    help = 'Compare DRF catalog/search serializers with the values() fast path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100, help='Products per page')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per serializer')
+
+    def handle(self, *args, **kwargs):
+        size, repeat = kwargs["size"], kwargs["repeat"]
+        request = APIRequestFactory().get("/api/products-catalog")
+        queryset = Product.objects.order_by("-id")
+
+        if not queryset.exists():
+            raise CommandError("No products to serialize")
+
+        for name, slow, fast in PAIRS:
+            slow_data, slow_time = self.measure(slow, queryset, size, repeat, request)
+            fast_data, fast_time = self.measure(fast, queryset, size, repeat, request)
+
+            if json.dumps(slow_data) != json.dumps(fast_data):
+                raise CommandError(f"{name}: fast serializer output differs")
+
+            self.stdout.write(
+                f"{name}: {len(slow_data)} rows, "
+                f"{slow.__name__} {slow_time * 1000:.1f} ms, "
+                f"{fast.__name__} {fast_time * 1000:.1f} ms, "
+                f"x{slow_time / fast_time:.1f}"
+            )
+
+    @staticmethod
+    def measure(serializer_class, queryset, size, repeat, request):
+        # Лучшее время из repeat прогонов: выборка страницы и сериализация
+        best, data = None, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            page = serializer_class.setup_eager_loading(queryset)[:size]
+            data = serializer_class(page, many=True, context={"request": request}).data
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return data, best
@@ -0,0 +1,78 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.product.filters import normalized_search
+from apps.product.fuzzy import WORD_RE, fuzzy_search
+from apps.product.models import Product
+from apps.product.search import full_text_available, full_text_search
+
+TOP_N = 10
+
+
+def misspell(word, rng):
+    """Одна опечатка: пропуск, перестановка, замена или удвоение буквы."""
+    index = rng.randrange(len(word))
+    kind = rng.choice(("delete", "swap", "substitute", "double"))
+    if kind == "delete":
+        return word[:index] + word[index + 1:]
+    if kind == "swap" and index < len(word) - 1:
+        return word[:index] + word[index + 1] + word[index] + word[index + 2:]
+    if kind == "substitute":
+        return word[:index] + rng.choice("aeiouklmnrst") + word[index + 1:]
+    return word[:index] + word[index] + word[index:]
+
+
+def exact_search(queryset, text):
+    # То же, что ?search= без fuzzy: полнотекстовый индекс или search_text
+    if full_text_available(queryset):
+        return full_text_search(queryset, text)
+    return normalized_search(queryset, text)
+
+
+class Command(BaseCommand):
+    help = 'Measure recall and latency of exact vs fuzzy product search on generated misspellings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=200, help='Misspelled queries to run')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the corpus')
+
+    def handle(self, *args, **kwargs):
+        rng = random.Random(kwargs["seed"])
+        titles = list(Product.objects.values_list("pk", "title_uz", "title_ru"))
+        if not titles:
+            raise CommandError("No products to search")
+
+        # Корпус: (id продукта, название с одной опечаткой в самом длинном слове)
+        corpus = []
+        for product_id, *product_titles in rng.sample(titles, min(kwargs["samples"], len(titles))):
+            words = WORD_RE.findall(rng.choice([title for title in product_titles if title] or [""]))
+            if not words:
+                continue
+            longest = max(range(len(words)), key=lambda index: len(words[index]))
+            if len(words[longest]) < 4:
+                continue
+            words[longest] = misspell(words[longest], rng)
+            corpus.append((product_id, " ".join(words)))
+        if not corpus:
+            raise CommandError("No titles long enough to misspell")
+
+        queryset = Product.objects.order_by("-id")
+        # Прогрев: индекс в памяти строится при первом запросе
+        list(fuzzy_search(queryset, corpus[0][1]).values_list("pk", flat=True)[:TOP_N])
+
+        for name, search in (("exact", exact_search), ("fuzzy", fuzzy_search)):
+            hits, timings = 0, []
+            for product_id, text in corpus:
+                started = time.perf_counter()
+                found = list(search(queryset, text).values_list("pk", flat=True)[:TOP_N])
+                timings.append(time.perf_counter() - started)
+                hits += product_id in found
+            timings.sort()
+            self.stdout.write(
+                f"{name}: recall@{TOP_N} {hits / len(corpus):.1%} ({hits}/{len(corpus)}), "
+                f"p50 {statistics.median(timings) * 1000:.1f} ms, "
+                f"p95 {timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000:.1f} ms"
+            )
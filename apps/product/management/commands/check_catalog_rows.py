@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.product.models import ProductCatalogRow
+
+
+class Command(BaseCommand):
+    help = 'Check that ProductCatalogRow matches the products it mirrors'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true', help='Resync missing and stale rows'
+        )
+
+    def handle(self, *args, **kwargs):
+        report = ProductCatalogRow.check_consistency()
+        broken = report["missing"] + report["stale"]
+
+        self.stdout.write(f"Missing rows: {len(report['missing'])} {report['missing'][:20]}")
+        self.stdout.write(f"Stale rows: {len(report['stale'])} {report['stale'][:20]}")
+
+        if not broken:
+            self.stdout.write(self.style.SUCCESS("Catalog rows are consistent"))
+            return
+
+        if kwargs["fix"]:
+            ProductCatalogRow.sync(broken)
+            self.stdout.write(self.style.SUCCESS(f"Resynced {len(broken)} rows"))
+        else:
+            raise CommandError("Catalog rows are inconsistent, run with --fix")
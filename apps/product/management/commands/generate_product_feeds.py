@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from apps.product.feeds import FEED_CHUNK_SIZE, feed_directory, generate_feeds
+
+
+class Command(BaseCommand):
+    help = 'Write gzipped CSV/NDJSON/XML product feeds to MEDIA_ROOT/feeds (incremental by updated_at)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild every row instead of changed ones')
+        parser.add_argument(
+            '--chunk-size', type=int, default=FEED_CHUNK_SIZE, help='Products read per round trip'
+        )
+
+    def handle(self, *args, **kwargs):
+        stats = generate_feeds(full=kwargs["full"], chunk_size=kwargs["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {stats['total']} products to {feed_directory()} "
+            f"({stats['rebuilt']} rebuilt, {stats['reused']} reused)"
+        ))
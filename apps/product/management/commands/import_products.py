@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.product.importer import IMPORT_BATCH_SIZE, ProductImporter
+
+
+class Command(BaseCommand):
+    help = 'Import products from a JSON array or NDJSON file (upsert by slug)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to a .json or .ndjson file')
+        parser.add_argument(
+            '--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+            help='Rows validated and written per transaction',
+        )
+
+    def handle(self, *args, **kwargs):
+        try:
+            with open(kwargs["path"], encoding="utf-8") as stream:
+                report = ProductImporter(kwargs["batch_size"]).run(stream)
+        except (OSError, json.JSONDecodeError) as error:
+            raise CommandError(error)
+
+        for error in report["errors"]:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'], ensure_ascii=False)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report['created']}, updated {report['updated']}, "
+            f"failed {len(report['errors'])}"
+        ))
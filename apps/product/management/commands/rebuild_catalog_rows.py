@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from apps.product.models import ProductCatalogRow
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized catalog read model (ProductCatalogRow)'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write("Rebuilding catalog rows...")
+        count = ProductCatalogRow.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Catalog rows rebuilt: {count}"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from apps.product.recommendations import ORDER_CHUNK_SIZE, rebuild_companions
+
+
+class Command(BaseCommand):
+    help = 'Rebuild "frequently bought together" companions from order history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='Companions per product (default COMPANIONS_LIMIT)')
+        parser.add_argument(
+            '--min-support', type=int, help='Minimum shared orders per pair (default COMPANIONS_MIN_SUPPORT)'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=ORDER_CHUNK_SIZE, help='Order rows fetched per round trip'
+        )
+
+    def handle(self, *args, **kwargs):
+        count = rebuild_companions(
+            limit=kwargs["limit"],
+            min_support=kwargs["min_support"],
+            chunk_size=kwargs["chunk_size"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt companions for {count} products"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from apps.product.recommendations import rebuild_related_products
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed RelatedProduct table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, help='Related products per product (default RELATED_PRODUCTS_LIMIT)'
+        )
+
+    def handle(self, *args, **kwargs):
+        count = rebuild_related_products(limit=kwargs["limit"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt related products for {count} products"))
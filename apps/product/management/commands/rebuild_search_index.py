@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from apps.product.models import Product
+from apps.product.search import (SEARCH_CHUNK_SIZE, full_text_available,
+                                 rebuild_search_index)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild Product.search_text and the full-text index (PostgreSQL tsvector or SQLite FTS5)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=SEARCH_CHUNK_SIZE, help='Products updated per statement'
+        )
+
+    def handle(self, *args, **kwargs):
+        if not full_text_available(Product.objects.all()):
+            # search_text нужен и без полнотекстового индекса (нечёткий поиск)
+            self.stdout.write(
+                self.style.WARNING("No PostgreSQL or SQLite FTS5: only search_text is rebuilt")
+            )
+        count = rebuild_search_index(kwargs["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt search index for {count} products"))
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0006_remove_order_products'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCatalogRow',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='catalog_row', serialize=False, to='product.product')),
+                ('title_uz', models.CharField(blank=True, max_length=255, null=True)),
+                ('title_ru', models.CharField(blank=True, max_length=255, null=True)),
+                ('price', models.IntegerField()),
+                ('sales', models.IntegerField(blank=True, null=True)),
+                ('slug', models.SlugField(max_length=255)),
+                ('gender', models.CharField(max_length=1)),
+                ('is_available', models.BooleanField(default=True)),
+                ('stock_title_uz', models.CharField(blank=True, max_length=50, null=True)),
+                ('stock_title_ru', models.CharField(blank=True, max_length=50, null=True)),
+                ('images', models.JSONField(default=list)),
+                ('short_descriptions', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='product.category')),
+                ('index_category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='product.indexcategory')),
+                ('stock', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='product.stock')),
+                ('sub_category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='product.subcategory')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['price', 'product'], name='catalog_row_price_idx'), models.Index(fields=['title_ru', 'product'], name='catalog_row_title_ru_idx'), models.Index(fields=['title_uz', 'product'], name='catalog_row_title_uz_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0008_product_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_links', to='product.product')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_to_links', to='product.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['related', 'product'], name='related_product_related_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='relatedproduct',
+            constraint=models.UniqueConstraint(fields=('product', 'rank'), name='related_product_rank_uniq'),
+        ),
+    ]
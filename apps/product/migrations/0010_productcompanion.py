@@ -0,0 +1,30 @@
+# Generated by Django 5.0.7 on 2026-10-18 13:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0009_relatedproduct'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCompanion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('support', models.PositiveIntegerField()),
+                ('confidence', models.FloatField()),
+                ('lift', models.FloatField()),
+                ('companion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='product.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='companion_links', to='product.product')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='productcompanion',
+            constraint=models.UniqueConstraint(fields=('product', 'rank'), name='product_companion_rank_uniq'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.7 on 2026-10-18 13:13
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # GIN-индекс — только в PostgreSQL (в SQLite столбец пустой). Миграция
+    # только меняет схему: search_vector заполняет команда rebuild_search_index
+    # после migrate (см. README)
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS product_search_vector_idx "
+        "ON product_product USING gin (search_vector)"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS product_search_vector_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0010_productcompanion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
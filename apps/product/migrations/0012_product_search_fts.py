@@ -0,0 +1,43 @@
+from django.db import migrations
+
+FTS_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_search_fts USING fts5("
+    "title_uz, title_ru, short_descriptions_uz, short_descriptions_ru, "
+    "description_uz, description_ru, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+
+def fts5_available(connection):
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(value)")
+        except Exception:
+            return False
+        cursor.execute("DROP TABLE temp.fts5_probe")
+    return True
+
+
+def create_search_fts(apps, schema_editor):
+    # Только SQLite; без FTS5 поиск остаётся на SearchFilter (LIKE)
+    # Таблицу заполняет миграция 0016
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite" or not fts5_available(connection):
+        return
+    schema_editor.execute(FTS_SQL)
+
+
+def drop_search_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS product_search_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0011_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_fts, drop_search_fts),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+TRIGRAM_FIELDS = ("title_uz", "title_ru")
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # pg_trgm есть только в PostgreSQL; на других базах — индекс в памяти (apps.product.fuzzy)
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for field in TRIGRAM_FIELDS:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS product_{field}_trgm_idx "
+            f"ON product_product USING gin ({field} gin_trgm_ops)"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        for field in TRIGRAM_FIELDS:
+            schema_editor.execute(f"DROP INDEX IF EXISTS product_{field}_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0012_product_search_fts'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
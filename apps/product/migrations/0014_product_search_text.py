@@ -0,0 +1,64 @@
+# Generated by Django 5.0.7 on 2026-10-18 13:36
+
+from django.db import migrations, models
+
+TITLE_TRIGRAM_FIELDS = ("title_uz", "title_ru")
+
+FTS_SQL = (
+    "CREATE VIRTUAL TABLE product_search_fts USING fts5("
+    "title_uz, title_ru, short_descriptions_uz, short_descriptions_ru, "
+    "description_uz, description_ru{extra}, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+
+def fts_table_exists(connection):
+    return "product_search_fts" in connection.introspection.table_names()
+
+
+def index_search_text(apps, schema_editor):
+    # Только схема: search_text, tsvector и FTS5 заполняет миграция 0016
+    connection = schema_editor.connection
+    if connection.vendor == "postgresql":
+        # Триграммы теперь по search_text вместо названий (0013)
+        for field in TITLE_TRIGRAM_FIELDS:
+            schema_editor.execute(f"DROP INDEX IF EXISTS product_{field}_trgm_idx")
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS product_search_text_trgm_idx "
+            "ON product_product USING gin (search_text gin_trgm_ops)"
+        )
+    elif connection.vendor == "sqlite" and fts_table_exists(connection):
+        # В FTS5 нельзя добавить колонку: таблица создаётся заново
+        schema_editor.execute("DROP TABLE product_search_fts")
+        schema_editor.execute(FTS_SQL.format(extra=", search_text"))
+
+
+def unindex_search_text(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS product_search_text_trgm_idx")
+        for field in TITLE_TRIGRAM_FIELDS:
+            schema_editor.execute(
+                f"CREATE INDEX IF NOT EXISTS product_{field}_trgm_idx "
+                f"ON product_product USING gin ({field} gin_trgm_ops)"
+            )
+    elif connection.vendor == "sqlite" and fts_table_exists(connection):
+        # Таблица остаётся пустой до rebuild_search_index на старом коде
+        schema_editor.execute("DROP TABLE product_search_fts")
+        schema_editor.execute(FTS_SQL.format(extra=""))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0013_product_title_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_text',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.RunPython(index_search_text, unindex_search_text),
+    ]
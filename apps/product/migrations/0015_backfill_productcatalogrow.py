@@ -0,0 +1,78 @@
+from django.db import migrations, transaction
+
+CHUNK_SIZE = 500
+
+
+def backfill_catalog_rows(apps, schema_editor):
+    """
+    Заполняет ProductCatalogRow для существующих продуктов (как
+    ProductCatalogRow.from_product, но по историческим моделям), чтобы
+    CATALOG_READ_MODEL можно было включить сразу после migrate.
+    Уже существующие строки не трогаются.
+    """
+    Product = apps.get_model("product", "Product")
+    ProductCatalogRow = apps.get_model("product", "ProductCatalogRow")
+    ShortDescription = apps.get_model("product", "ShortDescription")
+    using = schema_editor.connection.alias
+
+    product_ids = list(
+        Product.objects.using(using)
+        .filter(catalog_row__isnull=True)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+    for start in range(0, len(product_ids), CHUNK_SIZE):
+        chunk = product_ids[start:start + CHUNK_SIZE]
+        images = {}
+        for product_id, image_id, path in (
+            Product.images.through.objects.using(using)
+            .filter(product_id__in=chunk)
+            .order_by("images_id")
+            .values_list("product_id", "images_id", "images__image")
+        ):
+            images.setdefault(product_id, []).append([image_id, path])
+        descriptions = {}
+        for description in (
+            ShortDescription.objects.using(using)
+            .filter(product_id__in=chunk)
+            .order_by("id")
+            .values("id", "product_id", "key_uz", "key_ru", "value_uz", "value_ru")
+        ):
+            descriptions.setdefault(description.pop("product_id"), []).append(description)
+
+        rows = []
+        for product in (
+            Product.objects.using(using)
+            .filter(pk__in=chunk)
+            .values(
+                "pk", "title_uz", "title_ru", "price", "sales", "slug", "gender",
+                "is_available", "category_id", "sub_category_id", "index_category_id",
+                "stock_id", "stock__title_uz", "stock__title_ru",
+            )
+        ):
+            product_id = product.pop("pk")
+            rows.append(
+                ProductCatalogRow(
+                    product_id=product_id,
+                    stock_title_uz=product.pop("stock__title_uz"),
+                    stock_title_ru=product.pop("stock__title_ru"),
+                    images=images.get(product_id, []),
+                    short_descriptions=descriptions.get(product_id, []),
+                    **product,
+                )
+            )
+        with transaction.atomic(using=using):
+            ProductCatalogRow.objects.using(using).bulk_create(rows, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+    # Пачки коммитятся по отдельности: без одной транзакции на всю таблицу
+    atomic = False
+
+    dependencies = [
+        ('product', '0014_product_search_text'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_catalog_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,142 @@
+import re
+import unicodedata
+
+from django.db import migrations, transaction
+
+CHUNK_SIZE = 500
+
+# Копия apps.product.normalize на момент миграции: миграции не импортируют
+# живой код, который может измениться
+APOSTROPHES_RE = re.compile("['`´ʹʻʼʽ‘’′ъ]")
+TRANSLITERATION = str.maketrans({
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "yo",
+    "ж": "j", "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m",
+    "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "x", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sh", "ы": "i",
+    "ь": "", "э": "e", "ю": "yu", "я": "ya", "ў": "o", "қ": "q", "ғ": "g",
+    "ҳ": "h",
+})
+WORD_RE = re.compile(r"[^\W_]+")
+
+FTS_TABLE = "product_search_fts"
+FTS_COLUMNS = (
+    "title_uz", "title_ru", "short_descriptions_uz", "short_descriptions_ru",
+    "description_uz", "description_ru", "search_text",
+)
+
+# Как apps.product.search.search_vector: (источник, словарь, вес)
+VECTOR_SQL = " || ".join(
+    f"setweight(to_tsvector('{config}'::regconfig, COALESCE({source}, '')), '{weight}')"
+    for source, config, weight in (
+        ("title_uz", "simple", "A"),
+        ("title_ru", "russian", "A"),
+        ("({short_uz})", "simple", "B"),
+        ("({short_ru})", "russian", "B"),
+        ("description_uz", "simple", "C"),
+        ("description_ru", "russian", "C"),
+        ("search_text", "simple", "A"),
+    )
+)
+SHORT_DESCRIPTIONS_SQL = (
+    "SELECT STRING_AGG(value_{language}, ' ' ORDER BY id) FROM {table} "
+    "WHERE {table}.product_id = {products}.id"
+)
+
+
+def normalize_search_text(text):
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = APOSTROPHES_RE.sub("", text).translate(TRANSLITERATION)
+    text = "".join(
+        char for char in unicodedata.normalize("NFKD", text) if not unicodedata.combining(char)
+    )
+    return " ".join(WORD_RE.findall(text))
+
+
+def product_search_text(*titles):
+    return " ".join(dict.fromkeys(filter(None, map(normalize_search_text, titles))))
+
+
+def backfill_search_index(apps, schema_editor):
+    """
+    Заполняет search_text (0014) и полнотекстовый индекс существующих
+    продуктов: tsvector в PostgreSQL (0011) или таблицу FTS5 в SQLite (0012).
+    Иначе поиск и нечёткий поиск ничего не находят до rebuild_search_index.
+    """
+    Product = apps.get_model("product", "Product")
+    ShortDescription = apps.get_model("product", "ShortDescription")
+    connection = schema_editor.connection
+    using = connection.alias
+    fts = connection.vendor == "sqlite" and FTS_TABLE in connection.introspection.table_names()
+    vector_sql = VECTOR_SQL.format(**{
+        f"short_{language}": SHORT_DESCRIPTIONS_SQL.format(
+            language=language,
+            table=ShortDescription._meta.db_table,
+            products=Product._meta.db_table,
+        )
+        for language in ("uz", "ru")
+    })
+
+    product_ids = list(Product.objects.using(using).order_by("pk").values_list("pk", flat=True))
+    for start in range(0, len(product_ids), CHUNK_SIZE):
+        chunk = product_ids[start:start + CHUNK_SIZE]
+        products = list(
+            Product.objects.using(using).filter(pk__in=chunk).only(
+                "pk", "title_uz", "title_ru", "description_uz", "description_ru"
+            )
+        )
+        for product in products:
+            product.search_text = product_search_text(product.title_uz, product.title_ru)
+
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            Product.objects.using(using).bulk_update(products, ["search_text"])
+            placeholders = ", ".join(["%s"] * len(chunk))
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    f"UPDATE {Product._meta.db_table} SET search_vector = {vector_sql} "
+                    f"WHERE id IN ({placeholders})",
+                    chunk,
+                )
+            elif fts:
+                values = {"uz": {}, "ru": {}}
+                for product_id, value_uz, value_ru in (
+                    ShortDescription.objects.using(using)
+                    .filter(product_id__in=chunk)
+                    .order_by("id")
+                    .values_list("product_id", "value_uz", "value_ru")
+                ):
+                    for language, value in (("uz", value_uz), ("ru", value_ru)):
+                        if value:
+                            values[language].setdefault(product_id, []).append(value)
+                rows = []
+                for product in products:
+                    row = {
+                        "title_uz": product.title_uz,
+                        "title_ru": product.title_ru,
+                        "description_uz": product.description_uz,
+                        "description_ru": product.description_ru,
+                        "search_text": product.search_text,
+                    }
+                    for language in ("uz", "ru"):
+                        row[f"short_descriptions_{language}"] = " ".join(
+                            values[language].get(product.pk, [])
+                        )
+                    rows.append((product.pk, *(row[column] or "" for column in FTS_COLUMNS)))
+                cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", chunk)
+                cursor.executemany(
+                    f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) "
+                    f"VALUES ({', '.join(['%s'] * (len(FTS_COLUMNS) + 1))})",
+                    rows,
+                )
+
+
+class Migration(migrations.Migration):
+    # Пачки коммитятся по отдельности: без одной транзакции на всю таблицу
+    atomic = False
+
+    dependencies = [
+        ('product', '0015_backfill_productcatalogrow'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_index, migrations.RunPython.noop),
+    ]
@@ -1,18 +1,28 @@
+import re
+
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
 from django.db.models import (CASCADE, SET_NULL, BigIntegerField, BooleanField,
-                              CharField, DateTimeField, ForeignKey, ImageField,
-                              IntegerField, ManyToManyField, Max, Min, Model,
-                              SlugField, TextField)
+                              CharField, DateTimeField, FloatField, ForeignKey,
+                              ImageField, Index, IntegerField, JSONField,
+                              ManyToManyField, Max, Min, Model, OneToOneField,
+                              PositiveIntegerField, PositiveSmallIntegerField,
+                              Prefetch, Q, SlugField, TextField,
+                              UniqueConstraint)
+from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 from slugify import slugify
 
+from apps.product.normalize import product_search_text
 from apps.utils import generate_unique_filename
 
 
 def calculate_price_range(queryset, field_name="price"):
-    prices = queryset.values_list(field_name, flat=True)
-    min_price = min(prices) if prices else None
-    max_price = max(prices) if prices else None
+    # Один агрегирующий запрос вместо выборки всех цен в Python
+    prices = queryset.aggregate(min_price=Min(field_name), max_price=Max(field_name))
+    min_price = prices["min_price"]
+    max_price = prices["max_price"]
 
     return {
         "min_price": 0 if min_price == max_price else min_price,
@@ -20,6 +30,56 @@ def calculate_price_range(queryset, field_name="price"):
     }
 
 
+# Запас под суффикс "-N" в пределах Product.slug max_length
+SLUG_BASE_LENGTH = 240
+SLUG_SAVE_ATTEMPTS = 5
+# Столько префиксов в одном запросе allocate_slugs
+SLUG_PREFIX_BATCH = 100
+
+
+def slug_base(title):
+    return slugify(title or "", max_length=SLUG_BASE_LENGTH) or "product"
+
+
+def allocate_slugs(titles, reserved=()):
+    """
+    Свободные уникальные slug для списка названий: base, base-1, base-2, ...
+
+    Занятые slug читаются одним запросом на пачку префиксов, повторы внутри
+    списка получают следующие суффиксы. reserved — slug, которые запишутся
+    вместе с этими (явные slug той же пачки). Подходит для bulk_create, где
+    save() не вызывается; гонку с параллельной записью ловит уникальный индекс.
+    """
+    bases = [slug_base(title) for title in titles]
+    unique_bases = list(dict.fromkeys(bases))
+
+    taken = set(reserved)
+    for start in range(0, len(unique_bases), SLUG_PREFIX_BATCH):
+        condition = Q()
+        for base in unique_bases[start:start + SLUG_PREFIX_BATCH]:
+            condition |= Q(slug=base) | Q(slug__startswith=f"{base}-")
+        taken.update(Product.objects.filter(condition).values_list("slug", flat=True))
+
+    used = set(taken)
+    next_suffix = {}
+    slugs = []
+    for base in bases:
+        slug = base
+        if slug in used:
+            if base not in next_suffix:
+                pattern = re.compile(rf"{re.escape(base)}-(\d+)")
+                next_suffix[base] = 1 + max(
+                    (int(match.group(1)) for match in map(pattern.fullmatch, taken) if match),
+                    default=0,
+                )
+            while f"{base}-{next_suffix[base]}" in used:
+                next_suffix[base] += 1
+            slug = f"{base}-{next_suffix[base]}"
+        used.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
 class Category(Model):
     title = CharField(max_length=255, unique=True)
     is_index = BooleanField(default=False)
@@ -27,7 +87,7 @@ class Category(Model):
 
     @property
     def price_range(self):
-        return calculate_price_range(self.sub_categories.all(), "price")
+        return calculate_price_range(self.sub_categories.all(), "products__price")
 
     @property
     def sub_category_count(self):
@@ -94,23 +154,52 @@ class Product(Model):
 
     created_at = DateTimeField(auto_now_add=True)
     updated_at = DateTimeField(auto_now=True)
+    # Полнотекстовый поиск (PostgreSQL): заполняется apps.product.search после
+    # изменения продукта, GIN-индекс создаёт миграция 0011
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Названия uz/ru в виде apps.product.normalize (латиница, без регистра и
+    # апострофов): по нему ищут FTS, триграммы и запасной поиск
+    search_text = TextField(default="", editable=False)
+
+    class Meta:
+        # Индексы под реальные комбинации ProductFilter и сортировки каталога
+        # (-id, price, title_ru, title_uz); проверяются EXPLAIN-тестами в tests.py
+        indexes = [
+            Index(fields=["category", "-id"], name="product_category_id_idx"),
+            Index(fields=["category", "price"], name="product_category_price_idx"),
+            Index(fields=["sub_category", "-id"], name="product_subcat_id_idx"),
+            Index(fields=["sub_category", "price"], name="product_subcat_price_idx"),
+            Index(fields=["index_category", "-id"], name="product_indexcat_id_idx"),
+            Index(fields=["stock", "-id"], name="product_stock_id_idx"),
+            Index(fields=["gender", "-id"], name="product_gender_id_idx"),
+            Index(fields=["price", "id"], name="product_price_id_idx"),
+            Index(fields=["title_ru", "id"], name="product_title_ru_id_idx"),
+            Index(fields=["title_uz", "id"], name="product_title_uz_id_idx"),
+            Index(
+                fields=["-id"], condition=~Q(sales=0), name="product_on_sale_id_idx"
+            ),
+            Index(
+                fields=["-id"], condition=Q(sales=0), name="product_no_sale_id_idx"
+            ),
+        ]
 
     def save(self, *args, **kwargs):
-        if not self.pk:
-            self.slug = slugify(self.title)
-
-        while Product.objects.filter(slug=self.slug).exclude(pk=self.pk).exists():
-            if "-" in self.slug:
-                parts = self.slug.split("-")
-                if parts[-1].isdigit():
-                    count = int(parts[-1])
-                    self.slug = "-".join(parts[:-1]) + "-" + str(count + 1)
-                else:
-                    self.slug += "-1"
-            else:
-                self.slug += "-1"
-
-        super().save(*args, **kwargs)
+        adding = not self.pk
+        if adding:
+            self.slug = allocate_slugs([self.title])[0]
+        self.search_text = product_search_text(self.title_uz, self.title_ru)
+
+        for attempt in range(SLUG_SAVE_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                break
+            except IntegrityError:
+                # Параллельная запись заняла тот же slug — берём следующий свободный
+                taken = Product.objects.filter(slug=self.slug).exclude(pk=self.pk).exists()
+                if not taken or attempt == SLUG_SAVE_ATTEMPTS - 1:
+                    raise
+                self.slug = allocate_slugs([self.title if adding else self.slug])[0]
 
     # Validate the number of images after saving
         if self.images.count() > 3:
@@ -282,3 +371,228 @@ class Order(Model):
     # total_price = BigIntegerField()
     order = ForeignKey(OrderUser, CASCADE, related_name="user_orders")
     created_at = DateTimeField(auto_now_add=True)
+
+
+class ProductCatalogRow(Model):
+    """
+    Плоская read-модель каталога: ровно то, что отдаёт ProductCatalogSerializer,
+    плюс ключи фильтрации и сортировки. Поддерживается сигналами
+    (apps.product.signals), перестраивается командой rebuild_catalog_rows.
+    """
+
+    product = OneToOneField(
+        Product, on_delete=CASCADE, primary_key=True, related_name="catalog_row"
+    )
+    title_uz = CharField(max_length=255, null=True, blank=True)
+    title_ru = CharField(max_length=255, null=True, blank=True)
+    price = IntegerField()
+    sales = IntegerField(null=True, blank=True)
+    slug = SlugField(max_length=255)
+    gender = CharField(max_length=1)
+    is_available = BooleanField(default=True)
+    category = ForeignKey(Category, on_delete=CASCADE, related_name="+")
+    sub_category = ForeignKey(SubCategory, on_delete=CASCADE, related_name="+")
+    index_category = ForeignKey(
+        IndexCategory, on_delete=SET_NULL, related_name="+", null=True, blank=True
+    )
+    stock = ForeignKey(
+        Stock, on_delete=SET_NULL, related_name="+", null=True, blank=True
+    )
+    stock_title_uz = CharField(max_length=50, null=True, blank=True)
+    stock_title_ru = CharField(max_length=50, null=True, blank=True)
+    # [[image_id, image_path], ...] в порядке id
+    images = JSONField(default=list)
+    # Вывод ShortDescriptionSerializer
+    short_descriptions = JSONField(default=list)
+    updated_at = DateTimeField(auto_now=True)
+
+    SYNC_FIELDS = (
+        "title_uz",
+        "title_ru",
+        "price",
+        "sales",
+        "slug",
+        "gender",
+        "is_available",
+        "category",
+        "sub_category",
+        "index_category",
+        "stock",
+        "stock_title_uz",
+        "stock_title_ru",
+        "images",
+        "short_descriptions",
+    )
+    # Поля массового изменения цен (ProductPriceBulkListSerializer)
+    PRICE_FIELDS = ("price", "sales", "is_available")
+    CHUNK_SIZE = 500
+
+    class Meta:
+        indexes = [
+            Index(fields=["price", "product"], name="catalog_row_price_idx"),
+            Index(fields=["title_ru", "product"], name="catalog_row_title_ru_idx"),
+            Index(fields=["title_uz", "product"], name="catalog_row_title_uz_idx"),
+        ]
+
+    @staticmethod
+    def source_queryset():
+        return Product.objects.select_related("stock").prefetch_related(
+            Prefetch("images", queryset=Images.objects.order_by("id")),
+            Prefetch(
+                "short_descriptions", queryset=ShortDescription.objects.order_by("id")
+            ),
+        )
+
+    @classmethod
+    def from_product(cls, product):
+        stock = product.stock
+        return cls(
+            product_id=product.pk,
+            title_uz=product.title_uz,
+            title_ru=product.title_ru,
+            price=product.price,
+            sales=product.sales,
+            slug=product.slug,
+            gender=product.gender,
+            is_available=product.is_available,
+            category_id=product.category_id,
+            sub_category_id=product.sub_category_id,
+            index_category_id=product.index_category_id,
+            stock_id=product.stock_id,
+            stock_title_uz=stock.title_uz if stock else None,
+            stock_title_ru=stock.title_ru if stock else None,
+            images=[[image.id, image.image.name] for image in product.images.all()],
+            short_descriptions=[
+                {
+                    "id": short_description.id,
+                    "key_uz": short_description.key_uz,
+                    "key_ru": short_description.key_ru,
+                    "value_uz": short_description.value_uz,
+                    "value_ru": short_description.value_ru,
+                }
+                for short_description in product.short_descriptions.all()
+            ],
+        )
+
+    @classmethod
+    def sync(cls, product_ids):
+        """Пересобирает строки для указанных продуктов (upsert)."""
+        product_ids = sorted(set(product_ids))
+        for start in range(0, len(product_ids), cls.CHUNK_SIZE):
+            chunk = product_ids[start:start + cls.CHUNK_SIZE]
+            rows = [
+                cls.from_product(product)
+                for product in cls.source_queryset().filter(pk__in=chunk)
+            ]
+            with transaction.atomic():
+                cls.objects.bulk_create(
+                    rows,
+                    update_conflicts=True,
+                    unique_fields=["product"],
+                    update_fields=[*cls.SYNC_FIELDS, "updated_at"],
+                )
+
+    @classmethod
+    def sync_prices(cls, products):
+        """
+        Переносит в строки только цены и наличие (PRICE_FIELDS) продуктов,
+        без чтения картинок и характеристик. Продукты без строки
+        пересобираются целиком через sync.
+        """
+        products = sorted(products, key=lambda product: product.pk)
+        now = timezone.now()
+        missing = []
+        for start in range(0, len(products), cls.CHUNK_SIZE):
+            chunk = products[start:start + cls.CHUNK_SIZE]
+            existing = set(
+                cls.objects.filter(pk__in=[product.pk for product in chunk])
+                .values_list("pk", flat=True)
+            )
+            rows = [
+                cls(
+                    product_id=product.pk,
+                    updated_at=now,
+                    **{field: getattr(product, field) for field in cls.PRICE_FIELDS},
+                )
+                for product in chunk
+                if product.pk in existing
+            ]
+            cls.objects.bulk_update(rows, [*cls.PRICE_FIELDS, "updated_at"])
+            missing.extend(product.pk for product in chunk if product.pk not in existing)
+        cls.sync(missing)
+
+    @classmethod
+    def rebuild(cls):
+        """Полная пересборка таблицы. Возвращает количество строк."""
+        product_ids = list(Product.objects.order_by("pk").values_list("pk", flat=True))
+        cls.sync(product_ids)
+        return len(product_ids)
+
+    @classmethod
+    def check_consistency(cls):
+        """
+        Сравнивает таблицу с источником.
+
+        Возвращает словарь со списками id продуктов: ``missing`` (нет строки)
+        и ``stale`` (строка расходится с продуктом).
+        """
+        missing = list(
+            Product.objects.filter(catalog_row__isnull=True)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        stale = []
+        row_ids = list(cls.objects.order_by("pk").values_list("pk", flat=True))
+        for start in range(0, len(row_ids), cls.CHUNK_SIZE):
+            chunk = row_ids[start:start + cls.CHUNK_SIZE]
+            rows = cls.objects.in_bulk(chunk)
+            for product in cls.source_queryset().filter(pk__in=chunk):
+                expected = cls.from_product(product)
+                row = rows[product.pk]
+                if any(
+                    getattr(row, field.attname) != getattr(expected, field.attname)
+                    for field in map(cls._meta.get_field, cls.SYNC_FIELDS)
+                ):
+                    stale.append(product.pk)
+
+        return {"missing": missing, "stale": stale}
+
+
+class RelatedProduct(Model):
+    """
+    Предрасчитанные связанные продукты: не больше RELATED_PRODUCTS_LIMIT
+    на продукт, rank 1 — самый близкий. Заполняется apps.product.recommendations.
+    """
+
+    product = ForeignKey(Product, on_delete=CASCADE, related_name="related_links")
+    related = ForeignKey(Product, on_delete=CASCADE, related_name="related_to_links")
+    rank = PositiveSmallIntegerField()
+    score = FloatField()
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=["product", "rank"], name="related_product_rank_uniq"),
+        ]
+        indexes = [
+            Index(fields=["related", "product"], name="related_product_related_idx"),
+        ]
+
+
+class ProductCompanion(Model):
+    """
+    "Часто покупают вместе": top-K продуктов, встречавшихся с product в
+    одних заказах. Пересобирается командой rebuild_companions.
+    """
+
+    product = ForeignKey(Product, on_delete=CASCADE, related_name="companion_links")
+    companion = ForeignKey(Product, on_delete=CASCADE, related_name="+")
+    rank = PositiveSmallIntegerField()
+    # Заказов с обоими продуктами, P(companion | product), P(оба) / (P(product) P(companion))
+    support = PositiveIntegerField()
+    confidence = FloatField()
+    lift = FloatField()
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=["product", "rank"], name="product_companion_rank_uniq"),
+        ]
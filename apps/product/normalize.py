@@ -0,0 +1,39 @@
+import re
+import unicodedata
+
+# Варианты апострофа в узбекской латинице (o‘, g‘, ma'lum) и твёрдый знак
+# в кириллице (маълум) убираются: o‘ и o дают один ключ
+APOSTROPHES_RE = re.compile("['`´ʹʻʼʽ‘’′ъ]")
+
+# Кириллица (узбекская и русская) → латиница по правилам узбекской латиницы
+CYRILLIC_TO_LATIN = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "yo",
+    "ж": "j", "з": "z", "и": "i", "й": "y", "к": "k", "л": "l", "м": "m",
+    "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "x", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sh", "ы": "i",
+    "ь": "", "э": "e", "ю": "yu", "я": "ya", "ў": "o", "қ": "q", "ғ": "g",
+    "ҳ": "h",
+}
+TRANSLITERATION = str.maketrans(CYRILLIC_TO_LATIN)
+
+WORD_RE = re.compile(r"[^\W_]+")
+
+
+def normalize_search_text(text):
+    """
+    Ключ поиска, не зависящий от письменности: регистр сложен, апострофы
+    убраны, кириллица переведена в латиницу, диакритика снята, слова через
+    один пробел. Применяется и к индексируемому тексту, и к запросам.
+    """
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    # Транслитерация до NFKD: иначе й и ё распались бы на и/е и диакритику
+    text = APOSTROPHES_RE.sub("", text).translate(TRANSLITERATION)
+    text = "".join(
+        char for char in unicodedata.normalize("NFKD", text) if not unicodedata.combining(char)
+    )
+    return " ".join(WORD_RE.findall(text))
+
+
+def product_search_text(*titles):
+    """Значение Product.search_text: нормализованные названия без повторов."""
+    return " ".join(dict.fromkeys(filter(None, map(normalize_search_text, titles))))
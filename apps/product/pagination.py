@@ -1,7 +1,182 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = "page_size"
     max_page_size = 100
+
+
+class CatalogCursorPagination(BasePagination):
+    """
+    Keyset (cursor) pagination for the catalog.
+
+    Pages are addressed by the sort key of the last row seen instead of an
+    OFFSET, so a deep page costs the same as the first one and no COUNT(*)
+    is issued. The keyset follows the ordering returned by
+    ``view.get_ordering()``, with the primary key as tie-breaker.
+    """
+
+    cursor_query_param = "cursor"
+    page_size = CustomPagination.page_size
+    page_size_query_param = CustomPagination.page_size_query_param
+    max_page_size = CustomPagination.max_page_size
+    invalid_cursor_message = "Invalid cursor"
+    default_ordering = "-id"
+
+    # ordering -> ((field, descending, nullable), ...)
+    keysets = {
+        "-id": (("pk", True, False),),
+        "price": (("price", False, False), ("pk", False, False)),
+        "-price": (("price", True, False), ("pk", True, False)),
+        "title_ru": (("title_ru", False, True), ("pk", False, False)),
+        "-title_ru": (("title_ru", True, True), ("pk", True, False)),
+        "title_uz": (("title_uz", False, True), ("pk", False, False)),
+        "-title_uz": (("title_uz", True, True), ("pk", True, False)),
+    }
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        # NULL сортируется как максимум (PostgreSQL) или минимум (SQLite);
+        # порядок не переопределяется, чтобы работали обычные btree-индексы
+        self.nulls_largest = connections[queryset.db].features.nulls_order_largest
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        ordering = getattr(view, "get_ordering", lambda: self.default_ordering)()
+        if ordering not in self.keysets:
+            ordering = self.default_ordering
+        self.ordering = ordering
+        self.keys = self.keysets[ordering]
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor["r"])
+
+        queryset = queryset.order_by(*self._order_by(reverse))
+        if cursor:
+            queryset = queryset.filter(self._seek(cursor["p"], reverse))
+
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+        if reverse:
+            results.reverse()
+
+        if reverse:
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.first_position = self._position(results[0]) if results else None
+        self.last_position = self._position(results[-1]) if results else None
+        return results
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                size = int(request.query_params[self.page_size_query_param])
+                if size > 0:
+                    return min(size, self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_next_link(self):
+        if not self.has_next or self.last_position is None:
+            return None
+        return self.encode_cursor(self.last_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first_position is None:
+            return None
+        return self.encode_cursor(self.first_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps(
+            {"o": self.ordering, "p": position, "r": int(reverse)},
+            separators=(",", ":"),
+        )
+        encoded = urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            padded = encoded + "=" * (-len(encoded) % 4)
+            cursor = json.loads(urlsafe_b64decode(padded.encode("ascii")))
+            valid = (
+                cursor["o"] == self.ordering
+                and isinstance(cursor["p"], list)
+                and len(cursor["p"]) == len(self.keys)
+            )
+        except (TypeError, ValueError, KeyError):
+            valid = False
+
+        if not valid:
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def _position(self, obj):
+        if isinstance(obj, dict):
+            # Строки values(): первичный ключ приходит как "id"
+            return [obj["id" if field == "pk" else field] for field, _, _ in self.keys]
+        return [getattr(obj, field) for field, _, _ in self.keys]
+
+    def _order_by(self, reverse):
+        return [
+            f"-{field}" if descending != reverse else field
+            for field, descending, _ in self.keys
+        ]
+
+    def _seek(self, position, reverse):
+        # Lexicographic "strictly after position": (a > x) OR (a = x AND b > y) ...
+        condition = Q()
+        equal = Q()
+        for (field, descending, nullable), value in zip(self.keys, position):
+            beyond = self._beyond(field, descending != reverse, nullable, value)
+            if beyond is not None:
+                condition |= equal & beyond
+            equal &= Q(**{f"{field}__isnull": True}) if value is None else Q(**{field: value})
+        return condition if condition else Q(pk__in=[])
+
+    def _beyond(self, field, descending, nullable, value):
+        # NULL лежит "за" значением, если идём в ту сторону, где NULL сортируется
+        nulls_ahead = descending != self.nulls_largest
+        if value is None:
+            return None if nulls_ahead else Q(**{f"{field}__isnull": False})
+
+        beyond = Q(**{f"{field}__lt" if descending else f"{field}__gt": value})
+        if nullable and nulls_ahead:
+            beyond |= Q(**{f"{field}__isnull": True})
+        return beyond
@@ -0,0 +1,383 @@
+import heapq
+import math
+import re
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from itertools import combinations
+
+import numpy
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+
+from apps.product.cache import (bump_catalog_generation, bump_product_versions,
+                                run_in_background)
+from apps.product.models import (Order, Product, ProductCatalogRow,
+                                 ProductCompanion, RelatedProduct,
+                                 ShortDescription)
+
+# Векторы признаков хэшируются в пространство фиксированной размерности
+SIMILARITY_DIMENSIONS = 1024
+# Не больше стольких элементов в одной матрице сходства (batch x категория)
+SIMILARITY_BATCH_ELEMENTS = 1 << 24
+# Ценовой диапазон: логарифмическая шкала с шагом 1.5x
+PRICE_BAND_BASE = 1.5
+
+# Заказы читаются потоком по столько строк
+ORDER_CHUNK_SIZE = 5000
+# Корзины крупнее (оптовые заказы) не учитываются в парах: O(n^2) и мало сигнала
+COMPANION_MAX_BASKET = 50
+
+WORD_RE = re.compile(r"\w*[^\W\d_]\w*")
+
+
+def price_band(price):
+    return int(math.log(price, PRICE_BAND_BASE)) if price and price > 0 else 0
+
+
+def product_tokens(title_uz, title_ru, gender, price, descriptions):
+    """Признаки продукта: слова названий, пары ключ=значение, цена и пол."""
+    title = f"{title_uz or ''} {title_ru or ''}".casefold()
+    tokens = [f"w:{word}" for word in WORD_RE.findall(title) if len(word) > 1]
+    tokens.extend(f"d:{key}={value}" for key, value in descriptions)
+    tokens.append(f"p:{price_band(price)}")
+    tokens.append(f"g:{gender}")
+    return tokens
+
+
+def category_tokens(category_id):
+    """(ids, tokens): продукты категории по возрастанию id и их признаки."""
+    descriptions = defaultdict(list)
+    for product_id, *pairs in ShortDescription.objects.filter(
+        product__sub_category__category_id=category_id
+    ).values_list("product_id", "key_uz", "value_uz", "key_ru", "value_ru"):
+        for key, value in zip(pairs[::2], pairs[1::2]):
+            if key and value:
+                descriptions[product_id].append((key.casefold(), value.casefold()))
+
+    ids, tokens = [], []
+    for product_id, title_uz, title_ru, gender, price in (
+        Product.objects.filter(sub_category__category_id=category_id)
+        .order_by("id")
+        .values_list("id", "title_uz", "title_ru", "gender", "price")
+    ):
+        ids.append(product_id)
+        tokens.append(
+            product_tokens(title_uz, title_ru, gender, price, descriptions[product_id])
+        )
+    return ids, tokens
+
+
+def token_column(token):
+    # crc32 стабилен между процессами (в отличие от hash())
+    digest = zlib.crc32(token.encode("utf-8"))
+    return digest % SIMILARITY_DIMENSIONS, 1.0 if digest & (1 << 31) else -1.0
+
+
+def tfidf_matrix(tokens):
+    """L2-нормированная матрица TF-IDF (len(tokens) x SIMILARITY_DIMENSIONS)."""
+    counts = [Counter(product) for product in tokens]
+    document_frequency = Counter(token for product in counts for token in product)
+    total = len(counts)
+    idf = {
+        token: math.log((1 + total) / (1 + frequency)) + 1
+        for token, frequency in document_frequency.items()
+    }
+    columns = {token: token_column(token) for token in document_frequency}
+
+    rows, cols, values = [], [], []
+    for row, product in enumerate(counts):
+        for token, frequency in product.items():
+            column, sign = columns[token]
+            rows.append(row)
+            cols.append(column)
+            values.append(sign * frequency * idf[token])
+
+    matrix = numpy.zeros((total, SIMILARITY_DIMENSIONS), dtype=numpy.float32)
+    numpy.add.at(matrix, (rows, cols), values)
+    norms = numpy.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def top_neighbours(ids, matrix, rows, limit):
+    """{product_id: [(related_id, score), ...]} для строк rows, пачками."""
+    ranked = {}
+    k = min(limit, len(ids) - 1)
+    if k <= 0:
+        return {ids[row]: [] for row in rows}
+
+    id_array = numpy.asarray(ids)
+    batch_size = max(1, SIMILARITY_BATCH_ELEMENTS // len(ids))
+    for start in range(0, len(rows), batch_size):
+        batch = numpy.asarray(rows[start:start + batch_size])
+        similarity = matrix[batch] @ matrix.T
+        similarity[numpy.arange(len(batch)), batch] = -numpy.inf
+
+        top = numpy.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        scores = numpy.take_along_axis(similarity, top, axis=1)
+        # По убыванию сходства, при равенстве — меньший id
+        order = numpy.lexsort((top, -scores), axis=1)
+        top = numpy.take_along_axis(top, order, axis=1)
+        scores = numpy.take_along_axis(scores, order, axis=1)
+
+        for row, neighbours, neighbour_scores in zip(batch, top, scores):
+            ranked[ids[row]] = [
+                (int(related_id), round(float(score), 4))
+                for related_id, score in zip(id_array[neighbours], neighbour_scores)
+            ]
+    return ranked
+
+
+def write_related(ranked):
+    with transaction.atomic():
+        RelatedProduct.objects.filter(product_id__in=list(ranked)).delete()
+        RelatedProduct.objects.bulk_create(
+            (
+                RelatedProduct(product_id=product_id, related_id=related_id, rank=rank, score=score)
+                for product_id, items in ranked.items()
+                for rank, (related_id, score) in enumerate(items, start=1)
+            ),
+            batch_size=1000,
+        )
+
+
+def rebuild_related_products(limit=None):
+    """Полная пересборка RelatedProduct по категориям. Возвращает количество продуктов."""
+    limit = limit or settings.RELATED_PRODUCTS_LIMIT
+    total = 0
+    category_ids = (
+        Product.objects.order_by()
+        .values_list("sub_category__category_id", flat=True)
+        .distinct()
+    )
+    for category_id in list(category_ids):
+        if category_id is None:
+            continue
+        ids, tokens = category_tokens(category_id)
+        matrix = tfidf_matrix(tokens)
+        write_related(top_neighbours(ids, matrix, list(range(len(ids))), limit))
+        total += len(ids)
+
+    # Продукты без категории не участвуют
+    RelatedProduct.objects.filter(product__sub_category__isnull=True).delete()
+    return total
+
+
+def refresh_related_products(product_ids, limit=None):
+    """
+    Инкрементальное обновление после изменения продуктов: пересчитываются
+    только сами продукты и те, у кого они в списке. Продукты, в чей top-K
+    изменённый продукт прошёл бы только теперь, подхватит периодический
+    rebuild_related_products. Возвращает id пересчитанных продуктов.
+    """
+    limit = limit or settings.RELATED_PRODUCTS_LIMIT
+    product_ids = set(product_ids)
+    affected = dict(
+        RelatedProduct.objects.filter(related_id__in=product_ids).values_list(
+            "product_id", "product__sub_category__category_id"
+        )
+    )
+    current = dict(
+        Product.objects.filter(pk__in=product_ids).values_list(
+            "pk", "sub_category__category_id"
+        )
+    )
+    affected.update(current)
+
+    ranked = {}
+    for category_id in set(affected.values()) - {None}:
+        ids, tokens = category_tokens(category_id)
+        index = {product_id: row for row, product_id in enumerate(ids)}
+        rows = sorted(index[pk] for pk in affected if pk in index)
+        ranked.update(top_neighbours(ids, tfidf_matrix(tokens), rows, limit))
+
+    # Продукт без категории больше ни с чем не связан
+    ranked.update(
+        {product_id: [] for product_id, category_id in current.items() if category_id is None}
+    )
+    if ranked:
+        write_related(ranked)
+    return list(ranked)
+
+
+def refresh_related_and_invalidate(product_ids):
+    refreshed = refresh_related_products(product_ids)
+    if refreshed:
+        bump_product_versions(refreshed)
+        bump_catalog_generation()
+
+
+_pending_refresh = set()
+_refresh_lock = threading.Lock()
+_refresh_running = False
+
+
+def drain_related_refresh():
+    """Фоновый поток: после паузы забирает накопленные id одним проходом."""
+    global _refresh_running
+    while True:
+        time.sleep(settings.RELATED_PRODUCTS_REFRESH_DELAY)
+        with _refresh_lock:
+            product_ids = set(_pending_refresh)
+            _pending_refresh.clear()
+            if not product_ids:
+                _refresh_running = False
+                return
+        try:
+            refresh_related_and_invalidate(product_ids)
+        except Exception:
+            with _refresh_lock:
+                _refresh_running = False
+            raise
+
+
+def schedule_related_refresh(product_ids):
+    """
+    Пересчёт связанных вне запроса (RELATED_PRODUCTS_REFRESH): матрица
+    категории строится в фоне, частые правки одной категории объединяются.
+    """
+    global _refresh_running
+    mode = settings.RELATED_PRODUCTS_REFRESH
+    if mode == "sync":
+        refresh_related_and_invalidate(product_ids)
+    elif mode == "background":
+        with _refresh_lock:
+            _pending_refresh.update(product_ids)
+            if _refresh_running:
+                return
+            _refresh_running = True
+        run_in_background(drain_related_refresh)
+
+
+def related_rows_by_product(product_ids):
+    """
+    {product_id: [строка каталога, ...]} в порядке rank для пачки продуктов
+    (деталь или страница списка): связи одним запросом, строки — одним
+    запросом к read-модели или, без неё, из Product с prefetch.
+    """
+    links = defaultdict(list)
+    for product_id, related_id in (
+        RelatedProduct.objects.filter(product_id__in=product_ids)
+        .order_by("product_id", "rank")
+        .values_list("product_id", "related_id")
+    ):
+        links[product_id].append(related_id)
+
+    related_ids = {related_id for ids in links.values() for related_id in ids}
+    if not related_ids:
+        rows = {}
+    elif settings.CATALOG_READ_MODEL:
+        rows = ProductCatalogRow.objects.in_bulk(related_ids)
+    else:
+        rows = {
+            pk: ProductCatalogRow.from_product(product)
+            for pk, product in ProductCatalogRow.source_queryset().in_bulk(related_ids).items()
+        }
+    return {
+        product_id: [rows[pk] for pk in links[product_id] if pk in rows]
+        for product_id in product_ids
+    }
+
+
+def related_rows(product_id):
+    """Строки каталога для связанных продуктов одного продукта, в порядке rank."""
+    return related_rows_by_product([product_id])[product_id]
+
+
+def order_baskets(chunk_size=ORDER_CHUNK_SIZE):
+    """Множества id продуктов по заказам (OrderUser), потоком по chunk_size строк."""
+    rows = (
+        Order.objects.filter(product_id__isnull=False)
+        .order_by("order_id")
+        .values_list("order_id", "product_id")
+        .iterator(chunk_size=chunk_size)
+    )
+    basket_id, basket = None, set()
+    for order_id, product_id in rows:
+        if order_id != basket_id:
+            if basket:
+                yield basket
+            basket_id, basket = order_id, set()
+        basket.add(product_id)
+    if basket:
+        yield basket
+
+
+def rank_companions(baskets, limit, min_support):
+    """
+    Разреженная матрица совместных покупок -> {product_id: [(companion_id,
+    support, confidence, lift), ...]}, по убыванию confidence, затем lift.
+    """
+    item_counts = Counter()
+    pair_counts = defaultdict(Counter)
+    total = 0
+    for basket in baskets:
+        total += 1
+        item_counts.update(basket)
+        if len(basket) <= COMPANION_MAX_BASKET:
+            for first, second in combinations(sorted(basket), 2):
+                pair_counts[first][second] += 1
+
+    candidates = defaultdict(list)
+    for first, partners in pair_counts.items():
+        for second, together in partners.items():
+            if together < min_support:
+                continue
+            lift = together * total / (item_counts[first] * item_counts[second])
+            for product, companion in ((first, second), (second, first)):
+                confidence = together / item_counts[product]
+                candidates[product].append((confidence, lift, -companion, together))
+
+    return {
+        product: [
+            (-negative_id, together, round(confidence, 4), round(lift, 4))
+            for confidence, lift, negative_id, together in heapq.nlargest(limit, items)
+        ]
+        for product, items in candidates.items()
+    }
+
+
+def rebuild_companions(limit=None, min_support=None, chunk_size=ORDER_CHUNK_SIZE):
+    """Пересобирает ProductCompanion из истории заказов. Возвращает число продуктов."""
+    limit = limit or settings.COMPANIONS_LIMIT
+    min_support = min_support or settings.COMPANIONS_MIN_SUPPORT
+    ranked = rank_companions(order_baskets(chunk_size), limit, min_support)
+
+    with transaction.atomic():
+        ProductCompanion.objects.all().delete()
+        ProductCompanion.objects.bulk_create(
+            (
+                ProductCompanion(
+                    product_id=product_id,
+                    companion_id=companion_id,
+                    rank=rank,
+                    support=support,
+                    confidence=confidence,
+                    lift=lift,
+                )
+                for product_id, items in ranked.items()
+                for rank, (companion_id, support, confidence, lift) in enumerate(items, start=1)
+            ),
+            batch_size=1000,
+        )
+    transaction.on_commit(bump_catalog_generation)
+    return len(ranked)
+
+
+def companion_ids(product_ids, limit=None):
+    """
+    Компаньоны для набора продуктов (корзина или один продукт): confidence
+    суммируется по продуктам набора, сами продукты набора исключаются.
+    """
+    limit = limit or settings.COMPANIONS_LIMIT
+    return list(
+        ProductCompanion.objects.filter(product_id__in=product_ids)
+        .exclude(companion_id__in=product_ids)
+        .values("companion_id")
+        .annotate(score=Sum("confidence"))
+        .order_by("-score", "companion_id")
+        .values_list("companion_id", flat=True)[:limit]
+    )
@@ -0,0 +1,252 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections, transaction
+from django.db.models import (Aggregate, F, OuterRef, Subquery, TextField,
+                              Value)
+from django.db.models.expressions import RawSQL
+
+from apps.product.models import Product, ShortDescription
+from apps.product.normalize import normalize_search_text, product_search_text
+
+SEARCH_CHUNK_SIZE = 1000
+# Не больше стольких id в одном запросе к FTS5: SQLITE_MAX_VARIABLE_NUMBER до 3.32 — 999
+FTS_CHUNK_SIZE = 500
+
+# Для узбекского в PostgreSQL нет словаря: simple (без стемминга)
+LANGUAGE_CONFIGS = {"uz": "simple", "ru": "russian"}
+
+# (поле, вес): названия важнее значений характеристик, те — описаний
+SEARCH_FIELDS = (
+    ("title", "A"),
+    ("short_descriptions", "B"),
+    ("description", "C"),
+)
+
+# Нормализованные названия (Product.search_text) — в PostgreSQL со словарём simple
+NORMALIZED_FIELD = "search_text"
+NORMALIZED_CONFIG = "simple"
+
+# SQLite: виртуальная таблица FTS5 (rowid = id продукта), создаётся миграцией 0012,
+# колонка search_text добавлена миграцией 0014
+FTS_TABLE = "product_search_fts"
+FTS_COLUMNS = tuple(
+    f"{field}_{language}" for field, _ in SEARCH_FIELDS for language in LANGUAGE_CONFIGS
+) + (NORMALIZED_FIELD,)
+# Веса колонок для bm25 (аналог A/B/C в PostgreSQL)
+FTS_WEIGHTS = {"title": 10.0, "short_descriptions": 4.0, "description": 1.0, NORMALIZED_FIELD: 10.0}
+
+TERM_RE = re.compile(r"[^\W_]+")
+
+_fts_tables = {}
+
+
+class StringAgg(Aggregate):
+    # django.contrib.postgres.aggregates тянет psycopg при импорте модуля
+    function = "STRING_AGG"
+    output_field = TextField()
+
+
+def search_backend(queryset):
+    """
+    "postgresql", "sqlite" или None: движок выбирается по базе (DB_ENGINE);
+    в SQLite — только если таблица FTS5 создана.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql":
+        return "postgresql"
+    if connection.vendor == "sqlite":
+        key = (queryset.db, connection.settings_dict["NAME"])
+        if key not in _fts_tables:
+            _fts_tables[key] = FTS_TABLE in connection.introspection.table_names()
+        return "sqlite" if _fts_tables[key] else None
+    return None
+
+
+def clear_search_backend_cache():
+    # После создания или удаления таблицы FTS5 (post_migrate, apps.product.signals)
+    _fts_tables.clear()
+
+
+def full_text_available(queryset):
+    return search_backend(queryset) is not None
+
+
+def short_description_values(language):
+    return Subquery(
+        ShortDescription.objects.filter(product=OuterRef("pk"))
+        .order_by()
+        .values("product")
+        .annotate(text=StringAgg(f"value_{language}", Value(" ")))
+        .values("text")
+    )
+
+
+def search_vector():
+    """Выражение tsvector продукта: каждое поле со своим словарём и весом."""
+    vector = None
+    for field, weight in SEARCH_FIELDS:
+        for language, config in LANGUAGE_CONFIGS.items():
+            if field == "short_descriptions":
+                source = short_description_values(language)
+            else:
+                source = F(f"{field}_{language}")
+            part = SearchVector(source, config=config, weight=weight)
+            vector = part if vector is None else vector + part
+    return vector + SearchVector(NORMALIZED_FIELD, config=NORMALIZED_CONFIG, weight="A")
+
+
+def sync_search_text(product_ids):
+    """Пересчёт Product.search_text: bulk-записи и update() обходят save()."""
+    changed = []
+    for product in Product.objects.filter(pk__in=product_ids).only(
+        "pk", "title_uz", "title_ru", NORMALIZED_FIELD
+    ):
+        value = product_search_text(product.title_uz, product.title_ru)
+        if product.search_text != value:
+            product.search_text = value
+            changed.append(product)
+    Product.objects.bulk_update(changed, [NORMALIZED_FIELD])
+
+
+def fts_rows(product_ids):
+    """Строки FTS5 (rowid, *FTS_COLUMNS) для существующих продуктов."""
+    values = {"uz": {}, "ru": {}}
+    for product_id, value_uz, value_ru in (
+        ShortDescription.objects.filter(product_id__in=product_ids)
+        .order_by("id")
+        .values_list("product_id", "value_uz", "value_ru")
+    ):
+        for language, value in (("uz", value_uz), ("ru", value_ru)):
+            if value:
+                values[language].setdefault(product_id, []).append(value)
+
+    for row in Product.objects.filter(pk__in=product_ids).values(
+        "id", "title_uz", "title_ru", "description_uz", "description_ru", NORMALIZED_FIELD
+    ):
+        for language in LANGUAGE_CONFIGS:
+            row[f"short_descriptions_{language}"] = " ".join(values[language].get(row["id"], []))
+        yield (row["id"], *(row[column] or "" for column in FTS_COLUMNS))
+
+
+def update_search_index(product_ids):
+    """
+    Обновление поискового индекса после изменения продуктов: search_text,
+    затем tsvector в PostgreSQL (один UPDATE) или строки FTS5 в SQLite
+    (удалённые продукты из индекса убираются).
+    """
+    product_ids = list(product_ids)
+    sync_search_text(product_ids)
+    queryset = Product.objects.filter(pk__in=product_ids)
+    backend = search_backend(queryset)
+    if backend == "postgresql":
+        queryset.update(search_vector=search_vector())
+    elif backend == "sqlite":
+        with transaction.atomic(using=queryset.db), connections[queryset.db].cursor() as cursor:
+            for start in range(0, len(product_ids), FTS_CHUNK_SIZE):
+                chunk = product_ids[start:start + FTS_CHUNK_SIZE]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", chunk)
+                cursor.executemany(
+                    f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) "
+                    f"VALUES ({', '.join(['%s'] * (len(FTS_COLUMNS) + 1))})",
+                    list(fts_rows(chunk)),
+                )
+
+
+def rebuild_search_index(chunk_size=SEARCH_CHUNK_SIZE):
+    """Полный пересчёт пачками по chunk_size продуктов. Возвращает их количество."""
+    ids = list(Product.objects.order_by("pk").values_list("pk", flat=True))
+    if search_backend(Product.objects.all()) == "sqlite":
+        with connections[Product.objects.db].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    for start in range(0, len(ids), chunk_size):
+        update_search_index(ids[start:start + chunk_size])
+    return len(ids)
+
+
+def search_query(text):
+    """
+    tsquery для поиска по мере ввода: все слова обязательны, последнее —
+    префикс; запрос в исходном виде или нормализованный (по search_text).
+    В словах только буквы и цифры, поэтому raw-синтаксис безопасен.
+    None, если слов нет.
+    """
+    terms = TERM_RE.findall(text)
+    if not terms:
+        return None
+    raw = " & ".join(terms[:-1] + [f"{terms[-1]}:*"])
+    query = None
+    for config in dict.fromkeys(LANGUAGE_CONFIGS.values()):
+        part = SearchQuery(raw, config=config, search_type="raw")
+        query = part if query is None else query | part
+    normalized = normalize_search_text(text).split()
+    if normalized:
+        raw = " & ".join(normalized[:-1] + [f"{normalized[-1]}:*"])
+        query |= SearchQuery(raw, config=NORMALIZED_CONFIG, search_type="raw")
+    return query
+
+
+def fts_match(text):
+    """
+    Запрос MATCH для FTS5: все слова обязательны, последнее — префикс;
+    исходные слова или нормализованные (совпадут с колонкой search_text).
+    Слова в кавычках, поэтому синтаксис FTS5 из ввода не исполняется.
+    """
+    variants = []
+    for terms in (TERM_RE.findall(text), normalize_search_text(text).split()):
+        if terms and terms not in variants:
+            variants.append(terms)
+    if not variants:
+        return None
+    queries = [" ".join(f'"{term}"' for term in terms) + "*" for terms in variants]
+    if len(queries) == 1:
+        return queries[0]
+    return " OR ".join(f"({query})" for query in queries)
+
+
+def postgresql_search(queryset, text):
+    """Совпадения по GIN-индексу search_vector, по убыванию ts_rank."""
+    query = search_query(text)
+    if query is None:
+        return queryset
+    return (
+        queryset.filter(search_vector=query)
+        .alias(search_rank=SearchRank(F("search_vector"), query))
+        .order_by("-search_rank", "-id")
+    )
+
+
+def sqlite_search(queryset, text):
+    """
+    Совпадения по индексу FTS5, по bm25 (меньше — лучше). id отбираются
+    одним MATCH; bm25 считается только для найденных строк (поиск FTS5 по
+    rowid и тому же MATCH).
+    """
+    match = fts_match(text)
+    if match is None:
+        return queryset
+    weights = ", ".join(
+        str(FTS_WEIGHTS.get(column) or FTS_WEIGHTS[column.rsplit("_", 1)[0]]) for column in FTS_COLUMNS
+    )
+    table = queryset.model._meta.db_table
+    # У виртуальной таблицы FTS5 нет модели: подзапросы RawSQL
+    return (
+        queryset.filter(
+            pk__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (match,))
+        )
+        .alias(
+            search_rank=RawSQL(
+                f"SELECT bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+                f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = "{table}"."id"',
+                (match,),
+            )
+        )
+        .order_by("search_rank", "-id")
+    )
+
+
+def full_text_search(queryset, text):
+    if search_backend(queryset) == "postgresql":
+        return postgresql_search(queryset, text)
+    return sqlite_search(queryset, text)
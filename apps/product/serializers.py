@@ -2,19 +2,31 @@ from typing import Any, Dict, List, Optional
 
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import transaction
-from django.db.models import Max, Min, Count
+from django.db.models import Max, Min, Count, Prefetch
 from rest_framework import serializers
 from rest_framework.fields import ImageField, ListField, SerializerMethodField
 from rest_framework.relations import PrimaryKeyRelatedField
 from rest_framework.serializers import ModelSerializer
+from rest_framework.settings import api_settings
+
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.utils import timezone
+from django.utils.encoding import filepath_to_uri
 
 from apps.product.models import (Banner, Category,
                                  Images, IndexCategory, Order, OrderUser,
-                                 Product, ShortDescription, Stock, SubCategory)
-from apps.utils import SymbolValidationMixin
+                                 Product, ProductCatalogRow, ShortDescription,
+                                 Stock, SubCategory)
+from apps.product.recommendations import related_rows, related_rows_by_product
+from apps.product.signals import prices_changed, products_touched
+from apps.utils import (EagerLoadingMixin, RowsWrittenCounter,
+                        SymbolValidationMixin)
 from config import settings
 from drf_spectacular.utils import extend_schema_field
 
+# Поля, которые меняются массово (акции): ProductPriceBulkSerializer
+PRICE_BULK_FIELDS = ProductCatalogRow.PRICE_FIELDS
+
 
 
 class ImageModelSerializer(ModelSerializer):
@@ -340,7 +352,7 @@ class IndexCategorySerializer(ModelSerializer):
             return {"id": stock.id, "stock_type": stock.title}
         return None
 
-class ProductSearchSerializer(ModelSerializer):
+class ProductSearchSerializer(EagerLoadingMixin, ModelSerializer):
     sub_categories = SerializerMethodField()
     categories = SerializerMethodField()
     image = SerializerMethodField()
@@ -359,6 +371,8 @@ class ProductSearchSerializer(ModelSerializer):
             "slug",
             "gender",  # Add gender field here
         )
+        select_related = ("category", "sub_category")
+        prefetch_related = (Prefetch("images", queryset=Images.objects.order_by("id")),)
 
     @staticmethod
     def get_sub_categories(obj: Product) -> Optional[Dict[str, str]]:
@@ -386,7 +400,8 @@ class ProductSearchSerializer(ModelSerializer):
 
     def get_image(self, instance: "Product") -> Dict[str, Any]:
         request = self.context.get("request")
-        first_image = instance.images.first()
+        # min() по уже загруженным (prefetch) картинкам вместо first() с новым запросом
+        first_image = min(instance.images.all(), key=lambda image: image.pk, default=None)
 
         if (first_image):
             image_url = request.build_absolute_uri(first_image.image.url)
@@ -395,7 +410,18 @@ class ProductSearchSerializer(ModelSerializer):
             return {"id": None, "image": None}
 
 
-class ProductSerializer(SymbolValidationMixin, ModelSerializer):
+class ProductListSerializer(serializers.ListSerializer):
+    """Связанные продукты всей страницы читаются пачкой, а не на каждый продукт."""
+
+    def to_representation(self, data):
+        instances = list(data.all() if hasattr(data, "all") else data)
+        self.child.context["related_rows"] = related_rows_by_product(
+            [instance.pk for instance in instances]
+        )
+        return super().to_representation(instances)
+
+
+class ProductSerializer(EagerLoadingMixin, SymbolValidationMixin, ModelSerializer):
     related_products = SerializerMethodField()
     sub_categories = SerializerMethodField()
     categories = SerializerMethodField()
@@ -434,6 +460,9 @@ class ProductSerializer(SymbolValidationMixin, ModelSerializer):
             "gender",  # Gender field added here
             "related_products",
         )
+        select_related = ("stock", "sub_category__category", "category", "index_category")
+        prefetch_related = ("images", "short_descriptions")
+        list_serializer_class = ProductListSerializer
 
     def create(self, validated_data):
         image_ids = validated_data.pop("image_ids", [])
@@ -448,86 +477,140 @@ class ProductSerializer(SymbolValidationMixin, ModelSerializer):
 
         return product
 
+    # Поля продукта, которые меняет update(); переводимые тянут за собой базовое поле
+    UPDATE_FIELDS = (
+        "title_uz",
+        "title_ru",
+        "price",
+        "sales",
+        "description_uz",
+        "description_ru",
+        "is_available",
+        "sub_category",
+        "stock",
+        "gender",
+        "index_category",
+    )
+    SHORT_DESCRIPTION_FIELDS = ("key_uz", "key_ru", "value_uz", "value_ru")
+
     @transaction.atomic
     def update(self, instance, validated_data):
-        instance.images.set(validated_data.pop("image_ids", []))
-
-        # Update simple fields
-        instance.title_uz = validated_data.get("title_uz", instance.title_uz)
-        instance.title_ru = validated_data.get("title_ru", instance.title_ru)
-        instance.price = validated_data.get("price", instance.price)
-        instance.sales = validated_data.get("sales", instance.sales)
-        instance.description_uz = validated_data.get("description_uz", instance.description_uz)
-        instance.description_ru = validated_data.get("description_ru", instance.description_ru)
-        instance.is_available = validated_data.get("is_available", instance.is_available)
-        instance.sub_category = validated_data.get("sub_category", instance.sub_category)
-        instance.stock = validated_data.get("stock", instance.stock)
-        instance.gender = validated_data.get("gender", instance.gender)  # Update gender
-
-        # Update or create short_descriptions
-        short_descriptions_data = validated_data.pop("short_descriptions", [])
-        instance.short_descriptions.all().delete()
-        for short_description_data in short_descriptions_data:
-            ShortDescription.objects.create(product=instance, **short_description_data)
-
-        # Update index_category
-        index_category_data = validated_data.get("index_category")
-        if index_category_data:
-            if instance.index_category:
-                instance.index_category = IndexCategory.objects.update_or_create(
-                    defaults=index_category_data, id=instance.index_category.id)[0]
-            else:
-                instance.index_category = IndexCategory.objects.create(**index_category_data)
-        elif instance.index_category:
-            instance.index_category.delete()
-            instance.index_category = None
-
-        instance.save()
-        instance.refresh_from_db()
+        # Записываются только отличающиеся поля и строки; без refresh_from_db()
+        with RowsWrittenCounter() as written:
+            changed_fields = [
+                field
+                for field in self.UPDATE_FIELDS
+                if (field in validated_data or (field == "index_category" and not self.partial))
+                and getattr(instance, field) != validated_data.get(field)
+            ]
+            for field in changed_fields:
+                setattr(instance, field, validated_data.get(field))
+
+            if "image_ids" in validated_data or not self.partial:
+                image_ids = {image.pk for image in validated_data.get("image_ids", [])}
+                if len(image_ids) > 3:
+                    raise serializers.ValidationError(
+                        "Cannot have more than 3 images for a product."
+                    )
+                current_ids = set(instance.images.values_list("pk", flat=True))
+                if image_ids != current_ids:
+                    # set() сам добавляет/удаляет только разницу; updated_at и
+                    # кэши обновляет сигнал m2m_changed (products_touched)
+                    instance.images.set(image_ids)
+
+            descriptions_changed = False
+            if "short_descriptions" in validated_data or not self.partial:
+                descriptions_changed = self.update_short_descriptions(
+                    instance, validated_data.get("short_descriptions", [])
+                )
+
+            if changed_fields:
+                base_fields = {
+                    field[:-3] for field in changed_fields if field[-3:] in ("_uz", "_ru")
+                }
+                instance.save(update_fields=[*changed_fields, *base_fields, "updated_at"])
+            elif descriptions_changed:
+                # bulk-операции обходят сигналы ShortDescription
+                products_touched([instance.pk])
 
+        self.rows_written = written.rows
         return instance
 
+    def update_short_descriptions(self, instance, descriptions_data):
+        """
+        Сопоставляет новые описания существующим по порядку: меняются только
+        отличающиеся строки (bulk_update), лишние удаляются, новые — bulk_create.
+        """
+        existing = list(instance.short_descriptions.order_by("id"))
+        to_update = []
+        for description, data in zip(existing, descriptions_data):
+            changed = False
+            for field in self.SHORT_DESCRIPTION_FIELDS:
+                if field in data and getattr(description, field) != data[field]:
+                    setattr(description, field, data[field])
+                    changed = True
+            if changed:
+                to_update.append(description)
+
+        to_create = [
+            ShortDescription(product=instance, **data)
+            for data in descriptions_data[len(existing):]
+        ]
+        to_delete = [description.pk for description in existing[len(descriptions_data):]]
+
+        if to_update:
+            ShortDescription.objects.bulk_update(
+                to_update, [*self.SHORT_DESCRIPTION_FIELDS, "key", "value"]
+            )
+        if to_create:
+            ShortDescription.objects.bulk_create(to_create)
+        if to_delete:
+            ShortDescription.objects.filter(pk__in=to_delete).delete()
+
+        if hasattr(instance, "_prefetched_objects_cache"):
+            instance._prefetched_objects_cache.pop("short_descriptions", None)
+        return bool(to_update or to_create or to_delete)
+
 
     
 
-    @staticmethod
-    def get_related_products(instance):
+    def get_related_products(self, instance) -> Optional[List[Dict[str, Any]]]:
         sub_category = instance.sub_category
-        if sub_category:
-            category = sub_category.category
-            if category:
-                related_products = Product.objects.filter(
-                    sub_category__category=category
-                ).exclude(id=instance.id)
-                return related_products
-        return None
+        if sub_category is None or sub_category.category_id is None:
+            return None
+
+        # Предрасчитанный список (RelatedProduct); для списка — загружен пачкой
+        request = self.context.get("request")
+        media_url = media_url_builder(request)
+        page_rows = self.context.get("related_rows")
+        rows = page_rows.get(instance.pk, []) if page_rows is not None else related_rows(instance.pk)
+        return [
+            {
+                "id": row.product_id,
+                "title_uz": row.title_uz,
+                "title_ru": row.title_ru,
+                "images": [
+                    {"id": image_id, "image": media_url(path) if path else None}
+                    for image_id, path in row.images
+                ]
+                if request
+                else [],
+                "price": row.price,
+                "sales": row.sales,
+                "slug": row.slug,
+                "short_descriptions": row.short_descriptions,
+            }
+            for row in rows
+        ]
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
 
-        related_products = self.get_related_products(instance)
-
-        if related_products is not None:
-            related_products_data = [
-                {
-                    "id": product.id,
-                    "title_uz": product.title_uz,
-                    "title_ru": product.title_ru,
-                    "images": self.get_images(product),
-                    "price": product.price,
-                    "sales": product.sales,
-                    "slug": product.slug,
-                    "short_descriptions": ShortDescriptionSerializer(
-                        product.short_descriptions, many=True
-                    ).data,
-                }
-                for product in related_products
-            ]
+        if representation.get("related_products") is not None:
             short_descriptions_data = ShortDescriptionSerializer(
                 instance.short_descriptions.all(), many=True
             ).data
             representation["short_descriptions"] = short_descriptions_data
-            representation["related_products"] = related_products_data
             representation["stock"] = self.get_stock(instance)
             request_method = self.context["request"].method
             if request_method != "GET":
@@ -610,7 +693,7 @@ class ProductSerializer(SymbolValidationMixin, ModelSerializer):
 
 
 
-class ProductCatalogSerializer(ModelSerializer):
+class ProductCatalogSerializer(EagerLoadingMixin, ModelSerializer):
     images = SerializerMethodField()
     stock = StockSerializer()
     short_descriptions = ShortDescriptionSerializer(many=True, required=False)
@@ -629,15 +712,23 @@ class ProductCatalogSerializer(ModelSerializer):
             "slug",
             "gender",  # Add gender field here
         )
-
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        short_descriptions_data = ShortDescriptionSerializer(
-            instance.short_descriptions.all(), many=True
-        ).data
-        representation["short_descriptions"] = short_descriptions_data
-
-        return representation
+        select_related = ("stock",)
+        prefetch_related = (
+            Prefetch("images", queryset=Images.objects.order_by("id")),
+            "short_descriptions",
+        )
+        only = (
+            "id",
+            "title_uz",
+            "title_ru",
+            "price",
+            "sales",
+            "slug",
+            "gender",
+            "stock__id",
+            "stock__title_uz",
+            "stock__title_ru",
+        )
 
     def get_images(self, instance: "Product") -> List[Dict[str, Any]]:
         request = self.context.get("request")
@@ -652,6 +743,309 @@ class ProductCatalogSerializer(ModelSerializer):
 
 
 
+class ProductCatalogRowSerializer(ProductCatalogSerializer):
+    """
+    Сериализатор read-модели каталога. Выдаёт тот же JSON, что и
+    ProductCatalogSerializer, без обращений к связанным таблицам; поля
+    родителя остаются для схемы API.
+    """
+
+    id = serializers.IntegerField(source="product_id", read_only=True)
+
+    class Meta(ProductCatalogSerializer.Meta):
+        model = ProductCatalogRow
+        select_related = ()
+        prefetch_related = ()
+        only = ()
+
+    def to_representation(self, row):
+        media_url = media_url_builder(self.context.get("request"))
+        return {
+            "id": row.product_id,
+            "title_uz": row.title_uz,
+            "title_ru": row.title_ru,
+            "price": row.price,
+            "sales": row.sales,
+            "stock": {
+                "id": row.stock_id,
+                "title_uz": row.stock_title_uz,
+                "title_ru": row.stock_title_ru,
+            }
+            if row.stock_id
+            else None,
+            "images": [
+                {"id": image_id, "image": media_url(path) if path else None}
+                for image_id, path in row.images
+            ],
+            "short_descriptions": row.short_descriptions,
+            "slug": row.slug,
+            "gender": row.gender,
+        }
+
+
+class ValuesListSerializer(serializers.ListSerializer):
+    """
+    Список для сериализаторов, работающих со строками values(): связанные
+    данные всей страницы дочитываются пачкой в child.load_related().
+    """
+
+    def to_representation(self, data):
+        rows = list(data.all() if hasattr(data, "all") else data)
+        self.child.load_related(rows)
+        return [self.child.to_representation(row) for row in rows]
+
+
+class ProductCatalogValuesSerializer(ProductCatalogSerializer):
+    """
+    Быстрый read-only путь ProductCatalogSerializer: тот же JSON, собранный
+    из values()-строк обычными dict, без полей DRF на каждую строку.
+    """
+
+    values = (
+        "id",
+        "title_uz",
+        "title_ru",
+        "price",
+        "sales",
+        "slug",
+        "gender",
+        "stock_id",
+        "stock__title_uz",
+        "stock__title_ru",
+    )
+
+    class Meta(ProductCatalogSerializer.Meta):
+        list_serializer_class = ValuesListSerializer
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        return queryset.values(*cls.values)
+
+    def load_related(self, rows):
+        ids = [row["id"] for row in rows]
+        self._media_url = media_url_builder(self.context.get("request"))
+        self._images = product_images(ids)
+        self._short_descriptions = {}
+        for description in (
+            ShortDescription.objects.filter(product_id__in=ids)
+            .order_by("id")
+            .values("id", "product_id", "key_uz", "key_ru", "value_uz", "value_ru")
+        ):
+            product_id = description.pop("product_id")
+            self._short_descriptions.setdefault(product_id, []).append(description)
+
+    def to_representation(self, row):
+        if not hasattr(self, "_images"):
+            self.load_related([row])
+        media_url = self._media_url
+        return {
+            "id": row["id"],
+            "title_uz": row["title_uz"],
+            "title_ru": row["title_ru"],
+            "price": row["price"],
+            "sales": row["sales"],
+            "stock": {
+                "id": row["stock_id"],
+                "title_uz": row["stock__title_uz"],
+                "title_ru": row["stock__title_ru"],
+            }
+            if row["stock_id"]
+            else None,
+            "images": [
+                {"id": image_id, "image": media_url(path) if path else None}
+                for image_id, path in self._images.get(row["id"], ())
+            ],
+            "short_descriptions": self._short_descriptions.get(row["id"], []),
+            "slug": row["slug"],
+            "gender": row["gender"],
+        }
+
+
+class ProductSearchValuesSerializer(ProductSearchSerializer):
+    """Быстрый read-only путь ProductSearchSerializer (см. ProductCatalogValuesSerializer)."""
+
+    values = (
+        "id",
+        "title_uz",
+        "title_ru",
+        "price",
+        "sales",
+        "slug",
+        "gender",
+        "category_id",
+        "category__title_uz",
+        "category__title_ru",
+        "sub_category_id",
+        "sub_category__title_uz",
+        "sub_category__title_ru",
+    )
+
+    class Meta(ProductSearchSerializer.Meta):
+        list_serializer_class = ValuesListSerializer
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        return queryset.values(*cls.values)
+
+    def load_related(self, rows):
+        self._media_url = media_url_builder(self.context.get("request"))
+        self._images = product_images([row["id"] for row in rows])
+
+    def to_representation(self, row):
+        if not hasattr(self, "_images"):
+            self.load_related([row])
+        images = self._images.get(row["id"])
+        if images:
+            image_id, path = images[0]
+            image = {"id": image_id, "image": self._media_url(path) if path else None}
+        else:
+            image = {"id": None, "image": None}
+        return {
+            "id": row["id"],
+            "title_uz": row["title_uz"],
+            "title_ru": row["title_ru"],
+            "price": row["price"],
+            "sales": row["sales"],
+            "categories": {
+                "id": row["category_id"],
+                "title_uz": row["category__title_uz"],
+                "title_ru": row["category__title_ru"],
+            }
+            if row["category_id"]
+            else None,
+            "sub_categories": {
+                "id": row["sub_category_id"],
+                "title_uz": row["sub_category__title_uz"],
+                "title_ru": row["sub_category__title_ru"],
+            }
+            if row["sub_category_id"]
+            else None,
+            "image": image,
+            "slug": row["slug"],
+            "gender": row["gender"],
+        }
+
+
+def media_url_builder(request):
+    """
+    Возвращает функцию path -> абсолютный URL файла. Для локального хранилища
+    префикс считается один раз на страницу, а не build_absolute_uri на картинку.
+    """
+    if isinstance(default_storage, FileSystemStorage):
+        prefix = default_storage.base_url
+        if request is not None:
+            prefix = request.build_absolute_uri(prefix)
+        return lambda path: prefix + filepath_to_uri(path)
+
+    if request is None:
+        return default_storage.url
+    return lambda path: request.build_absolute_uri(default_storage.url(path))
+
+
+def product_images(product_ids):
+    """{product_id: [(image_id, path), ...]} по возрастанию id картинки, одним запросом."""
+    images = {}
+    for product_id, image_id, path in (
+        Product.images.through.objects.filter(product_id__in=product_ids)
+        .order_by("images_id")
+        .values_list("product_id", "images_id", "images__image")
+    ):
+        images.setdefault(product_id, []).append((image_id, path))
+    return images
+
+
+class ProductPriceBulkListSerializer(serializers.ListSerializer):
+    """
+    Массовое изменение цен: продукты читаются двумя запросами (по id и по
+    slug), правила Product.clean проверяются в памяти, запись — один
+    bulk_update в транзакции и одна инвалидация кэша (prices_changed).
+    """
+
+    max_items = 5000
+
+    def __init__(self, *args, **kwargs):
+        # Длина списка проверяется до валидации элементов
+        kwargs.setdefault("max_length", self.max_items)
+        kwargs.setdefault("allow_empty", False)
+        super().__init__(*args, **kwargs)
+
+    def to_internal_value(self, data):
+        # Ошибки по строкам — тем же списком, что и ошибки полей элементов
+        attrs = super().to_internal_value(data)
+
+        fields = ("id", "slug", "price", "sales", "is_available", "updated_at")
+        by_id = Product.objects.only(*fields).in_bulk(
+            [item["id"] for item in attrs if "id" in item]
+        )
+        by_slug = Product.objects.only(*fields).in_bulk(
+            [item["slug"] for item in attrs if "slug" in item], field_name="slug"
+        )
+
+        errors, products, seen = [], {}, set()
+        for item in attrs:
+            product = by_id.get(item["id"]) if "id" in item else by_slug.get(item["slug"])
+            if product is None:
+                errors.append({api_settings.NON_FIELD_ERRORS_KEY: ["Product not found."]})
+                continue
+            if product.pk in seen:
+                errors.append({api_settings.NON_FIELD_ERRORS_KEY: ["Duplicate product in the same request."]})
+                continue
+            seen.add(product.pk)
+
+            for field in PRICE_BULK_FIELDS:
+                if field in item:
+                    setattr(product, field, item[field])
+            try:
+                product.clean()
+            except serializers.ValidationError as error:
+                errors.append({api_settings.NON_FIELD_ERRORS_KEY: error.detail})
+                continue
+            errors.append({})
+            products[product.pk] = (product, [field for field in PRICE_BULK_FIELDS if field in item])
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        self.products = products
+        return attrs
+
+    def save(self, **kwargs):
+        # bulk_update обходит auto_now и сигналы
+        now = timezone.now()
+        changed = set()
+        for product, fields in self.products.values():
+            product.updated_at = now
+            changed.update(fields)
+
+        with transaction.atomic():
+            Product.objects.bulk_update(
+                [product for product, _ in self.products.values()],
+                [*sorted(changed), "updated_at"],
+                batch_size=1000,
+            )
+            prices_changed(product for product, _ in self.products.values())
+        return [product for product, _ in self.products.values()]
+
+
+class ProductPriceBulkSerializer(serializers.Serializer):
+    id = serializers.IntegerField(required=False)
+    slug = serializers.SlugField(required=False)
+    price = serializers.IntegerField(min_value=0, required=False)
+    sales = serializers.IntegerField(min_value=0, required=False, allow_null=True)
+    is_available = serializers.BooleanField(required=False)
+
+    class Meta:
+        list_serializer_class = ProductPriceBulkListSerializer
+
+    def validate(self, attrs):
+        if ("id" in attrs) == ("slug" in attrs):
+            raise serializers.ValidationError("Exactly one of id or slug is required.")
+        if not any(field in attrs for field in PRICE_BULK_FIELDS):
+            raise serializers.ValidationError(
+                f"At least one of {', '.join(PRICE_BULK_FIELDS)} is required."
+            )
+        return attrs
+
+
 class BannerSerializer(ModelSerializer):
     class Meta:
         model = Banner
@@ -775,7 +1169,7 @@ class OrderUserSerializer(serializers.ModelSerializer):
         return representation
 
 
-class OrderUserGetSerializer(serializers.ModelSerializer):
+class OrderUserGetSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     order = OrderSerializer(many=True, required=False)
     total_price = serializers.SerializerMethodField()
 
@@ -790,6 +1184,10 @@ class OrderUserGetSerializer(serializers.ModelSerializer):
             "total_price",
             "created_at",
         )
+        # OrderSerializer.get_product_title обращается к product_id
+        prefetch_related = (
+            Prefetch("user_orders", queryset=Order.objects.select_related("product_id")),
+        )
 
     def create(self, validated_data):
         order_data = validated_data.pop("order", [])
@@ -0,0 +1,163 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_migrate,
+                                      post_save, pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.product.cache import (bump_catalog_generation, bump_product_versions,
+                                bump_reference_version)
+from apps.product.filters import invalidate_title_id_map
+from apps.product.models import (Category, Images, IndexCategory, Product,
+                                 ProductCatalogRow, RelatedProduct,
+                                 ShortDescription, Stock, SubCategory)
+from apps.product.recommendations import schedule_related_refresh
+from apps.product.search import clear_search_backend_cache, update_search_index
+
+
+def products_changed(product_ids):
+    """
+    Единая точка обновления производных данных после изменения продуктов.
+
+    Вызывается сигналами и путями массовой записи (bulk_create/update),
+    которые сигналы обходят. Работа выполняется после коммита транзакции.
+    """
+    product_ids = {pk for pk in product_ids if pk is not None}
+    if not product_ids:
+        return
+
+    def refresh():
+        update_search_index(product_ids)
+        ProductCatalogRow.sync(product_ids)
+        bump_product_versions(product_ids)
+        # Поколение сдвигается после пересборки строк, чтобы в кэш не попали старые
+        bump_catalog_generation()
+        # Связанные пересчитываются вне запроса и сбрасывают кэш сами
+        schedule_related_refresh(product_ids)
+
+    transaction.on_commit(refresh)
+
+
+def prices_changed(products):
+    """
+    Облегчённый products_changed для массового изменения цен и наличия
+    (ProductPriceBulkListSerializer): поисковый индекс от них не зависит,
+    строки каталога обновляются только по этим полям, а детали продуктов
+    сбрасываются одним сдвигом версии справочников вместо счётчика на
+    каждый продукт.
+    """
+    products = list(products)
+    if not products:
+        return
+
+    def refresh():
+        ProductCatalogRow.sync_prices(products)
+        bump_reference_version()
+        bump_catalog_generation()
+        # Ценовой диапазон входит в оценку похожести
+        schedule_related_refresh([product.pk for product in products])
+
+    transaction.on_commit(refresh)
+
+
+def products_touched(product_ids):
+    """
+    Картинки и описания хранятся не в строке Product, и их изменение не
+    сдвигает updated_at. Сдвигаем явно: по нему работают инкрементальные
+    фиды и ETag детали продукта.
+    """
+    product_ids = {pk for pk in product_ids if pk is not None}
+    if not product_ids:
+        return
+    Product.objects.filter(pk__in=product_ids).update(updated_at=timezone.now())
+    products_changed(product_ids)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    products_changed([instance.pk])
+
+
+@receiver(pre_delete, sender=Product)
+def product_deleting(sender, instance, **kwargs):
+    # Ссылки RelatedProduct удаляются каскадом до post_delete: запоминаем,
+    # у кого продукт был в списке, чтобы пересчитать их после коммита
+    instance._related_referrer_ids = list(
+        RelatedProduct.objects.filter(related_id=instance.pk).values_list("product_id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    products_changed([instance.pk, *getattr(instance, "_related_referrer_ids", [])])
+
+
+@receiver(m2m_changed, sender=Product.images.through)
+def product_images_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # image.product_images.add/remove/clear: pk_set содержит id продуктов
+        if action == "pre_clear":
+            instance._catalog_product_ids = list(
+                instance.product_images.values_list("pk", flat=True)
+            )
+        elif action == "post_clear":
+            products_touched(getattr(instance, "_catalog_product_ids", []))
+        elif action in ("post_add", "post_remove"):
+            products_touched(pk_set or [])
+    elif action in ("post_add", "post_remove", "post_clear"):
+        products_touched([instance.pk])
+
+
+@receiver(post_save, sender=Images)
+def image_saved(sender, instance, created, **kwargs):
+    if not created:
+        products_touched(instance.product_images.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Images)
+def image_deleting(sender, instance, **kwargs):
+    # Связи through удаляются каскадом без m2m_changed, запоминаем продукты заранее
+    instance._catalog_product_ids = list(
+        instance.product_images.values_list("pk", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Images)
+def image_deleted(sender, instance, **kwargs):
+    products_touched(getattr(instance, "_catalog_product_ids", []))
+
+
+@receiver(post_save, sender=ShortDescription)
+@receiver(post_delete, sender=ShortDescription)
+def short_description_changed(sender, instance, **kwargs):
+    products_touched([instance.product_id])
+
+
+@receiver(post_save, sender=Stock)
+def stock_saved(sender, instance, created, **kwargs):
+    if not created:
+        ProductCatalogRow.objects.filter(stock=instance).update(
+            stock_title_uz=instance.title_uz, stock_title_ru=instance.title_ru
+        )
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+@receiver(post_save, sender=IndexCategory)
+@receiver(post_delete, sender=IndexCategory)
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+def catalog_reference_changed(sender, **kwargs):
+    # После коммита: иначе параллельный читатель закэширует карту до изменения
+    transaction.on_commit(partial(invalidate_title_id_map, sender))
+    transaction.on_commit(bump_reference_version)
+    transaction.on_commit(bump_catalog_generation)
+
+
+@receiver(post_migrate)
+def migrated(sender, **kwargs):
+    # Миграции создают и пересоздают таблицу FTS5
+    clear_search_backend_cache()
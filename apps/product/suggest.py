@@ -0,0 +1,90 @@
+import heapq
+from bisect import bisect_left
+
+from apps.product.cache import CatalogMemoryCache
+from apps.product.models import Category, Product, SubCategory
+from apps.product.normalize import normalize_search_text
+
+SUGGEST_LIMIT = 10
+SUGGEST_MAX_LIMIT = 20
+# Для префиксов короче этого ответы собираются заранее: у них больше всего совпадений
+SUGGEST_PRECOMPUTED_LENGTH = 2
+
+# Порядок типов при равенстве остального: сначала категории, потом продукты
+SUGGEST_KINDS = ("category", "sub_category", "product")
+
+
+class SuggestIndex:
+    """
+    Отсортированный массив ключей (название с начала каждого слова) и
+    bisect по префиксу. Подсказки ранжируются: совпадение с начала названия,
+    тип, длина названия, более новые выше.
+    """
+
+    def __init__(self, entries):
+        # entries: (тип, id, название, slug или None)
+        self.entries = []
+        keys = []
+        seen = set()
+        for kind, pk, title, slug in entries:
+            normalized = normalize_search_text(title)
+            if not normalized or (kind, pk, normalized) in seen:
+                continue
+            seen.add((kind, pk, normalized))
+            index = len(self.entries)
+            self.entries.append(
+                (
+                    (SUGGEST_KINDS.index(kind), len(normalized), -pk),
+                    (kind, pk),
+                    {"type": kind, "id": pk, "title": title, "slug": slug},
+                )
+            )
+            start = 0
+            for word in normalized.split(" "):
+                keys.append((normalized[start:], start > 0, index))
+                start += len(word) + 1
+        keys.sort()
+        self.keys = [key for key, _, _ in keys]
+        self.matches = [(inner, index) for _, inner, index in keys]
+        self.precomputed = {}
+        for length in range(1, SUGGEST_PRECOMPUTED_LENGTH + 1):
+            for prefix in {key[:length] for key in self.keys if len(key) >= length}:
+                self.precomputed[prefix] = self.rank(prefix, SUGGEST_MAX_LIMIT)
+
+    def rank(self, prefix, limit):
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + "\U0010ffff", start)
+        best = {}
+        for inner, index in self.matches[start:end]:
+            order, target, _ = self.entries[index]
+            rank = (inner, *order)
+            # Один результат на объект: название на uz и ru может совпасть дважды
+            if target not in best or rank < best[target][0]:
+                best[target] = (rank, index)
+        return [index for _, index in heapq.nsmallest(limit, best.values())]
+
+    def suggest(self, text, limit=SUGGEST_LIMIT):
+        prefix = normalize_search_text(text)
+        if not prefix:
+            return []
+        indexes = self.precomputed.get(prefix)
+        if indexes is None:
+            indexes = self.rank(prefix, limit)
+        return [self.entries[index][2] for index in indexes[:limit]]
+
+
+def suggest_entries(using):
+    for model, kind in ((Category, "category"), (SubCategory, "sub_category")):
+        for pk, title_uz, title_ru in model.objects.using(using).values_list(
+            "pk", "title_uz", "title_ru"
+        ):
+            yield from ((kind, pk, title, None) for title in (title_uz, title_ru))
+    for pk, slug, title_uz, title_ru in (
+        Product.objects.using(using)
+        .values_list("pk", "slug", "title_uz", "title_ru")
+        .iterator(chunk_size=2000)
+    ):
+        yield from (("product", pk, title, slug) for title in (title_uz, title_ru))
+
+
+suggest_index = CatalogMemoryCache(lambda using: SuggestIndex(suggest_entries(using)))
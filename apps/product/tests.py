@@ -1,3 +1,1657 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import tempfile
+from io import StringIO
+from unittest import mock
+from importlib import import_module
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import QueryDict
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.product.cache import CatalogMemoryCache, bump_catalog_generation
+from apps.product.checks import check_catalog_cache_backend
+from apps.product.feeds import feed_path, generate_feeds
+from apps.product.filters import TITLE_ID_MAP_TIMEOUT, ProductFilter, resolve_ids
+from apps.product.fuzzy import TrigramIndex, trigrams
+from apps.product.histogram import price_arrays
+from apps.product.normalize import normalize_search_text
+from apps.product.importer import ProductImporter
+from apps.product.models import (Category, Images, IndexCategory, Order,
+                                 OrderUser, Product, ProductCatalogRow,
+                                 RelatedProduct, ShortDescription, Stock,
+                                 SubCategory, allocate_slugs)
+from apps.product.recommendations import (drain_related_refresh,
+                                          rebuild_companions,
+                                          rebuild_related_products,
+                                          refresh_related_products,
+                                          schedule_related_refresh)
+from apps.product.search import (FTS_TABLE, fts_match, full_text_available,
+                                 search_backend, search_query, update_search_index)
+from apps.product.signals import products_changed
+from apps.product.suggest import SuggestIndex, suggest_index
+from apps.product.views import ProductListCreateView
+
+
+class CatalogQueryPlanTests(TestCase):
+    """
+    EXPLAIN фильтров и сортировок каталога. Каждый фильтр должен читать
+    product_product по индексу с условием на свой столбец (SQLite: SEARCH,
+    PostgreSQL: Index Cond) или по своему частичному индексу; сочетания,
+    под которые заведены составные индексы, — по этому индексу без сортировки.
+    Обход индекса сортировки с фильтрацией строк проверку не проходит.
+    """
+
+    # фильтр -> (параметры, столбец с условием или частичный индекс)
+    FILTERS = {
+        "category": ({"category": "Parfyum"}, "category_id"),
+        "category_ids": ({"category": "1,2"}, "category_id"),
+        "sub_category": ({"sub_category": "Yuz"}, "sub_category_id"),
+        "index_category": ({"index_category": "Top"}, "index_category_id"),
+        "stock": ({"stock": "Aksiya"}, "stock_id"),
+        "has_sale": ({"has_sale": "true"}, "product_on_sale_id_idx"),
+        "no_sale": ({"has_sale": "false"}, "product_no_sale_id_idx"),
+        "price_range": ({"min_price": "2000", "max_price": "5000"}, "price"),
+        "gender": ({"gender": "male"}, "gender"),
+    }
+    # (фильтр, сортировка) -> индекс, отдающий страницу без сортировки
+    ORDERED_INDEXES = {
+        (None, "-id"): None,
+        (None, "price"): "product_price_id_idx",
+        (None, "title_ru"): "product_title_ru_id_idx",
+        (None, "title_uz"): "product_title_uz_id_idx",
+        ("category", "-id"): "product_category_id_idx",
+        ("category", "price"): "product_category_price_idx",
+        ("sub_category", "-id"): "product_subcat_id_idx",
+        ("sub_category", "price"): "product_subcat_price_idx",
+        ("index_category", "-id"): "product_indexcat_id_idx",
+        ("stock", "-id"): "product_stock_id_idx",
+        ("gender", "-id"): "product_gender_id_idx",
+        ("has_sale", "-id"): "product_on_sale_id_idx",
+        ("no_sale", "-id"): "product_no_sale_id_idx",
+        ("price_range", "price"): "product_price_id_idx",
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = [
+            Category.objects.create(title=title, title_uz=title, title_ru=title)
+            for title in ("Parfyum", "Krem", "Shampun")
+        ]
+        sub_categories = [
+            SubCategory.objects.create(
+                title=title, title_uz=title, title_ru=title, category=category
+            )
+            for title, category in zip(("Erkak", "Yuz", "Soch"), categories)
+        ]
+        stock = Stock.objects.create(title="Aksiya", title_uz="Aksiya", title_ru="Aksiya")
+        index_category = IndexCategory.objects.create(
+            title="Top", title_uz="Top", title_ru="Top"
+        )
+
+        Product.objects.bulk_create(
+            Product(
+                title=f"Product {i}",
+                title_uz=f"Mahsulot {i}",
+                title_ru=f"Товар {i}",
+                slug=f"product-{i}",
+                description="",
+                price=1000 * (i % 9 + 1),
+                sales=0 if i % 3 else 100,
+                category=categories[i % 3],
+                sub_category=sub_categories[i % 3],
+                stock=stock if i % 4 == 0 else None,
+                index_category=index_category if i % 5 == 0 else None,
+                gender="MFU"[i % 3],
+            )
+            for i in range(500)
+        )
+
+    def explain(self, queryset):
+        if connection.vendor == "postgresql":
+            # На маленькой таблице планировщик и так выбрал бы seq scan;
+            # какой индекс взят, проверяют утверждения ниже
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE product_product")
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        elif connection.vendor != "sqlite":
+            self.skipTest(f"No plan checks for {connection.vendor}")
+        return queryset.explain()
+
+    def filtered(self, name, ordering=None):
+        data = QueryDict(mutable=True)
+        if name is not None:
+            data.update(self.FILTERS[name][0])
+        queryset = Product.objects.order_by(ordering) if ordering else Product.objects.order_by()
+        return ProductFilter(data=data, queryset=queryset).qs
+
+    def assertIndexCondition(self, plan, target):
+        """Условие фильтра проверяется в индексе, а не построчно."""
+        if target.endswith("_idx"):
+            # Частичный индекс содержит только подходящие строки
+            if connection.vendor == "sqlite":
+                pattern = rf"(SCAN|SEARCH) product_product USING (COVERING )?INDEX {target}\b"
+            else:
+                pattern = rf"(Index Scan|Index Only Scan|Bitmap Index Scan)( Backward)? (using|on) {target}\b"
+        elif connection.vendor == "sqlite":
+            pattern = rf"SEARCH product_product USING (COVERING )?INDEX \w+ \({target}(=|>|<| IN)"
+        else:
+            pattern = rf"Index Cond: .*\b{target}\b"
+        self.assertRegex(plan, pattern)
+
+    def assertOrderedIndex(self, plan, index):
+        """Страница читается из индекса в нужном порядке, без сортировки."""
+        if connection.vendor == "sqlite":
+            self.assertNotIn("USE TEMP B-TREE", plan)
+            if index is None:
+                # ORDER BY id DESC без фильтра — обход таблицы по rowid
+                self.assertRegex(plan, r"SCAN product_product\s*$")
+            else:
+                self.assertRegex(
+                    plan, rf"(SCAN|SEARCH) product_product USING (COVERING )?INDEX {index}\b"
+                )
+        else:
+            self.assertNotRegex(plan, r"\bSort\b")
+            self.assertRegex(
+                plan,
+                rf"Index (Only )?Scan( Backward)? using {index or 'product_product_pkey'}\b",
+            )
+
+    def test_every_filter_uses_an_index_condition(self):
+        for name, (_, target) in self.FILTERS.items():
+            with self.subTest(filter=name):
+                self.assertIndexCondition(self.explain(self.filtered(name)), target)
+
+    def test_indexed_orderings_need_no_sort(self):
+        for (name, ordering), index in self.ORDERED_INDEXES.items():
+            with self.subTest(filter=name, ordering=ordering):
+                plan = self.explain(self.filtered(name, ordering)[:10])
+                self.assertOrderedIndex(plan, index)
+                if name is not None:
+                    self.assertIndexCondition(plan, self.FILTERS[name][1])
+
+
+# Фоновый поток не видит незакоммиченную транзакцию теста: связанные
+# продукты и индексы в памяти в тестах пересчитываются сразу
+refresh_sync = override_settings(
+    RELATED_PRODUCTS_REFRESH="sync", CATALOG_MEMORY_INDEX_REFRESH="sync"
+)
+
+
+def setUpModule():
+    refresh_sync.enable()
+
+
+def tearDownModule():
+    refresh_sync.disable()
+
+
+class QueryCountAssertionsMixin:
+    """Число запросов списка не должно зависеть от размера страницы (нет N+1)."""
+
+    PAGE_SIZES = (1, 5, 20)
+
+    def count_queries(self, url, params):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, url, params=None, page_sizes=PAGE_SIZES):
+        # Первый запрос прогревает кэши процесса (есть ли таблица FTS5 и т.п.)
+        self.count_queries(url, params)
+        counts = {
+            size: self.count_queries(url, {**(params or {}), "page_size": size})
+            for size in page_sizes
+        }
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+
+def create_list_products(count=25):
+    category = Category.objects.create(title="Parfyum", title_uz="Parfyum", title_ru="Parfyum")
+    sub_category = SubCategory.objects.create(
+        title="Erkak", title_uz="Erkak", title_ru="Erkak", category=category
+    )
+    stock = Stock.objects.create(title="Aksiya", title_uz="Aksiya", title_ru="Aksiya")
+    order_user = OrderUser.objects.create(phone="998900000000", total_price=0)
+
+    for i in range(count):
+        product = Product.objects.create(
+            title=f"Product {i}",
+            title_uz=f"Mahsulot {i}",
+            title_ru=f"Товар {i}",
+            slug=f"product-{i}",
+            description="",
+            price=1000 * (i + 1),
+            category=category,
+            sub_category=sub_category,
+            stock=stock,
+        )
+        product.images.add(
+            Images.objects.create(image=f"products/{i}-a.jpg"),
+            Images.objects.create(image=f"products/{i}-b.jpg"),
+        )
+        ShortDescription.objects.create(
+            product=product, key="Hajmi", key_uz="Hajmi", key_ru="Объём",
+            value="50", value_uz="50", value_ru="50",
+        )
+        Order.objects.create(product_id=product, count=1, order=order_user)
+        if i % 2:
+            OrderUser.objects.create(phone=f"99890000{i:04d}", total_price=i)
+
+
+class ListQueryCountTests(QueryCountAssertionsMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_list_products()
+
+    def test_catalog(self):
+        self.assertConstantQueries(reverse("product-catalog"))
+
+    def test_search(self):
+        self.assertConstantQueries(reverse("catalog-search"), {"search": "Mahsulot"})
+
+    def test_order_list(self):
+        self.assertConstantQueries(reverse("order-list"))
+
+    def test_product_list(self):
+        with self.settings(RELATED_PRODUCTS_LIMIT=3):
+            rebuild_related_products()
+        ProductCatalogRow.rebuild()
+        for read_model in (False, True):
+            with self.subTest(read_model=read_model), self.settings(CATALOG_READ_MODEL=read_model):
+                self.assertConstantQueries(reverse("products-list-create"))
+                page = self.client.get(reverse("products-list-create"), {"page_size": 5}).json()
+                self.assertTrue(all(len(item["related_products"]) == 3 for item in page["results"]))
+
+
+class TitleIdMapTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.parfyum, cls.krem, cls.krem_yuz = (
+            Category.objects.create(title=title, title_uz=title, title_ru=title_ru)
+            for title, title_ru in (("Parfyum", "Парфюм"), ("Krem", "Крем"), ("Krem yuz", "Крем для лица"))
+        )
+        cls.stock = Stock.objects.create(title="Aksiya", title_uz="Aksiya", title_ru="Акция")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_resolve_ids(self):
+        self.assertEqual(resolve_ids(Category, "5, 7"), {5, 7})
+        # Точное совпадение (без регистра, на любом языке) важнее подстроки
+        self.assertEqual(resolve_ids(Category, "krem"), {self.krem.pk})
+        self.assertEqual(resolve_ids(Category, "ПАРФЮМ,3"), {self.parfyum.pk, 3})
+        self.assertEqual(resolve_ids(Category, "лица"), {self.krem_yuz.pk})
+        self.assertEqual(resolve_ids(Stock, "Акц", substring=False), set())
+        self.assertEqual(resolve_ids(Stock, "акция", substring=False), {self.stock.pk})
+
+    def test_map_is_cached_and_invalidated_after_commit(self):
+        resolve_ids(Category, "krem")
+        with self.assertNumQueries(0):
+            resolve_ids(Category, "parfyum")
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            category = Category.objects.create(title="Sovun", title_uz="Sovun", title_ru="Мыло")
+            # До коммита карта не сбрасывается: её нельзя перечитать без новой строки
+            self.assertEqual(resolve_ids(Category, "sovun"), set())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(resolve_ids(Category, "sovun"), {category.pk})
+
+    def test_map_expires_without_shared_cache(self):
+        # Сброс в другом воркере не виден: карта живёт не дольше MAX_AGE
+        for enabled, timeout in ((True, TITLE_ID_MAP_TIMEOUT), (False, 60)):
+            cache.clear()
+            with self.subTest(enabled=enabled), \
+                    override_settings(CATALOG_CACHE_ENABLED=enabled, CATALOG_MEMORY_INDEX_MAX_AGE=60), \
+                    mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+                resolve_ids(Category, "krem")
+                self.assertEqual(cache_set.call_args.args[2], timeout)
+
+
+class CatalogCursorPaginationTests(QueryCountAssertionsMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_list_products(12)
+        # Одинаковые цены: порядок внутри них держит id
+        products = list(Product.objects.order_by("id"))
+        for product in products[:8]:
+            Product.objects.filter(pk=product.pk).update(price=5000)
+
+    def get_page(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        return [row["id"] for row in data["results"]], data["next"], data["previous"]
+
+    def walk(self, params):
+        ids, url, query = [], reverse("product-catalog"), {"pagination": "cursor", "page_size": 5, **params}
+        while url:
+            page, url, _ = self.get_page(url, query)
+            ids += page
+            query = None
+        return ids
+
+    def test_tied_prices_pages_are_stable(self):
+        expected = list(Product.objects.order_by("price", "id").values_list("id", flat=True))
+        self.assertEqual(self.walk({"ordering": "price"}), expected)
+        expected = list(Product.objects.order_by("-price", "-id").values_list("id", flat=True))
+        self.assertEqual(self.walk({"order_by": "-price"}), expected)
+
+    def test_next_previous_round_trip(self):
+        params = {"pagination": "cursor", "page_size": 5, "ordering": "price"}
+        first, next_url, previous = self.get_page(reverse("product-catalog"), params)
+        self.assertIsNone(previous)
+        second, _, previous_url = self.get_page(next_url)
+        self.assertFalse(set(first) & set(second))
+        back, back_next, _ = self.get_page(previous_url)
+        self.assertEqual(back, first)
+        self.assertEqual(self.get_page(back_next)[0], second)
+
+    def test_deep_page_costs_as_much_as_first(self):
+        url = reverse("product-catalog")
+        params = {"pagination": "cursor", "page_size": 2, "ordering": "price"}
+        first_page = self.count_queries(url, params)
+        next_url = self.get_page(url, params)[1]
+        for _ in range(4):
+            next_url = self.get_page(next_url)[1]
+        self.assertEqual(self.count_queries(next_url, None), first_page)
+
+    def test_filter_orderings_are_mapped_or_rejected(self):
+        newest = list(Product.objects.order_by("-id").values_list("id", flat=True))
+        self.assertEqual(self.walk({"is_new": "new", "ordering": "price"}), newest)
+        for params in ({"order_by": "gender"}, {"order_by": "price,title_ru"}, {"ordering": "slug"}):
+            with self.subTest(params=params):
+                response = self.client.get(
+                    reverse("product-catalog"), {"pagination": "cursor", **params}
+                )
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CATALOG_FAST_SERIALIZATION=True)
+class FastSerializationTests(QueryCountAssertionsMixin, TestCase):
+    """values()-сериализаторы отдают тот же JSON, что и DRF-сериализаторы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_list_products()
+
+    def get_json(self, url, params, fast):
+        cache.clear()
+        with override_settings(CATALOG_FAST_SERIALIZATION=fast):
+            return self.client.get(url, params).json()
+
+    def assertSameResponse(self, url, params=None):
+        params = {"page_size": 20, **(params or {})}
+        self.assertEqual(
+            self.get_json(url, params, fast=False), self.get_json(url, params, fast=True)
+        )
+
+    def test_catalog_json(self):
+        self.assertSameResponse(reverse("product-catalog"))
+        self.assertSameResponse(reverse("product-catalog"), {"ordering": "price"})
+        self.assertSameResponse(
+            reverse("product-catalog"), {"pagination": "cursor", "ordering": "title_ru"}
+        )
+
+    def test_search_json(self):
+        self.assertSameResponse(reverse("catalog-search"), {"search": "Mahsulot"})
+
+    def test_constant_queries(self):
+        self.assertConstantQueries(reverse("product-catalog"))
+        self.assertConstantQueries(reverse("catalog-search"), {"search": "Mahsulot"})
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command("benchmark_catalog_serializers", size=20, repeat=1, stdout=out)
+        self.assertIn("catalog: 20 rows", out.getvalue())
+        self.assertIn("search: 20 rows", out.getvalue())
+
+
+class ProductCatalogRowTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Сигналы откладывают синхронизацию до коммита: строк пока нет
+        create_list_products(3)
+
+    def assertConsistent(self):
+        self.assertEqual(ProductCatalogRow.check_consistency(), {"missing": [], "stale": []})
+
+    def catalog(self, read_model, **params):
+        cache.clear()
+        with override_settings(CATALOG_READ_MODEL=read_model):
+            response = self.client.get(reverse("product-catalog"), {"page_size": 20, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_filter_ordering_applies_to_read_model(self):
+        ProductCatalogRow.rebuild()
+        for params in (
+            {"order_by": "price"},
+            {"order_by": "-price", "ordering": "title_ru"},
+            {"is_new": "new", "ordering": "price"},
+            {"ordering": "price"},
+            {},
+        ):
+            with self.subTest(params=params):
+                results = {
+                    read_model: self.catalog(read_model, **params)["results"]
+                    for read_model in (False, True)
+                }
+                self.assertEqual(
+                    [row["id"] for row in results[True]], [row["id"] for row in results[False]]
+                )
+        prices = [row["price"] for row in self.catalog(True, order_by="-price")["results"]]
+        self.assertEqual(prices, sorted(prices, reverse=True))
+        prices = [row["price"] for row in self.catalog(True, order_by="price")["results"]]
+        self.assertEqual(prices, sorted(prices))
+
+    def test_backfill_migration(self):
+        migration = import_module("apps.product.migrations.0015_backfill_productcatalogrow")
+        self.assertFalse(ProductCatalogRow.objects.exists())
+        migration.backfill_catalog_rows(django_apps, connection.schema_editor())
+        self.assertEqual(ProductCatalogRow.objects.count(), 3)
+        self.assertConsistent()
+        self.assertEqual(self.catalog(read_model=True), self.catalog(read_model=False))
+
+    def test_rows_follow_writes(self):
+        ProductCatalogRow.rebuild()
+        product, moved, deleted = Product.objects.order_by("id")
+        category = Category.objects.create(title="Krem", title_uz="Krem", title_ru="Krem")
+        sub_category = SubCategory.objects.create(
+            title="Yuz", title_uz="Yuz", title_ru="Yuz", category=category
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.price = 777
+            product.save()
+        self.assertEqual(ProductCatalogRow.objects.get(pk=product.pk).price, 777)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.images.add(Images.objects.create(image="products/new.jpg"))
+            ShortDescription.objects.create(
+                product=product, key="Rang", key_uz="Rang", key_ru="Цвет",
+                value="Qora", value_uz="Qora", value_ru="Чёрный",
+            )
+        row = ProductCatalogRow.objects.get(pk=product.pk)
+        self.assertEqual(row.images[-1][1], "products/new.jpg")
+        self.assertEqual(row.short_descriptions[-1]["value_ru"], "Чёрный")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.category, moved.sub_category = category, sub_category
+            moved.save()
+            Stock.objects.update(title_ru="Скидка")
+            stock = Stock.objects.get()
+            stock.save()
+        row = ProductCatalogRow.objects.get(pk=moved.pk)
+        self.assertEqual((row.category_id, row.sub_category_id), (category.pk, sub_category.pk))
+        self.assertEqual(row.stock_title_ru, "Скидка")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            deleted.delete()
+        self.assertFalse(ProductCatalogRow.objects.filter(pk=deleted.pk).exists())
+        self.assertConsistent()
+
+    def test_check_command(self):
+        ProductCatalogRow.rebuild()
+        stale, missing, _ = Product.objects.order_by("id")
+        ProductCatalogRow.objects.filter(pk=stale.pk).update(price=1)
+        ProductCatalogRow.objects.filter(pk=missing.pk).delete()
+        self.assertEqual(
+            ProductCatalogRow.check_consistency(), {"missing": [missing.pk], "stale": [stale.pk]}
+        )
+
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command("check_catalog_rows", stdout=out)
+        self.assertIn(f"Missing rows: 1 [{missing.pk}]", out.getvalue())
+        call_command("check_catalog_rows", fix=True, stdout=out)
+        self.assertIn("Resynced 2 rows", out.getvalue())
+        self.assertConsistent()
+
+
+class ProductFacetsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = [
+            Category.objects.create(title=title, title_uz=title, title_ru=title)
+            for title in ("Parfyum", "Krem")
+        ]
+        sub_categories = [
+            SubCategory.objects.create(title=title, title_uz=title, title_ru=title, category=category)
+            for title, category in zip(("Erkak", "Yuz"), cls.categories)
+        ]
+        cls.stock = Stock.objects.create(title="Aksiya", title_uz="Aksiya", title_ru="Aksiya")
+        Product.objects.bulk_create(
+            Product(
+                title=f"Product {i}",
+                title_uz=f"Mahsulot {i}",
+                title_ru=f"Товар {i}",
+                slug=f"product-{i}",
+                description="",
+                price=30000 * (i % 5 + 1),
+                sales=0 if i % 3 else 100,
+                category=cls.categories[i % 2],
+                sub_category=sub_categories[i % 2],
+                stock=cls.stock if i % 4 == 0 else None,
+                gender="MFU"[i % 3],
+            )
+            for i in range(30)
+        )
+
+    def facets(self, **params):
+        response = self.client.get(reverse("product-catalog-facets"), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_facets_apply_other_filters_but_not_their_own(self):
+        data = self.facets(category="Parfyum", gender="male", has_sale="true")
+        parfyum = Product.objects.filter(category=self.categories[0])
+        male = Product.objects.filter(gender="M")
+        on_sale = Product.objects.exclude(sales=0)
+
+        # Категория: все категории, посчитанные с фильтрами gender и has_sale
+        self.assertEqual(
+            {row["id"]: row["count"] for row in data["category"]},
+            {
+                category.pk: (male & on_sale).filter(category=category).count()
+                for category in self.categories
+                if (male & on_sale).filter(category=category).exists()
+            },
+        )
+        # Пол: все значения, посчитанные с фильтрами категории и has_sale
+        self.assertEqual(
+            {row["code"]: row["count"] for row in data["gender"]},
+            {
+                code: (parfyum & on_sale).filter(gender=code).count()
+                for code in "MFU"
+                if (parfyum & on_sale).filter(gender=code).exists()
+            },
+        )
+        self.assertEqual(
+            {row["value"]: row["count"] for row in data["has_sale"]},
+            {
+                "true": (parfyum & male).exclude(sales=0).count(),
+                "false": (parfyum & male).filter(sales=0).count(),
+            },
+        )
+        self.assertEqual(
+            sum(row["count"] for row in data["price"]), (parfyum & male & on_sale).count()
+        )
+        self.assertEqual(
+            [row["count"] for row in data["stock"]],
+            [(parfyum & male & on_sale).filter(stock=self.stock).count()],
+        )
+
+    def test_price_facet_ignores_price_range(self):
+        data = self.facets(min_price="60000", max_price="90000", gender="female")
+        female = Product.objects.filter(gender="F")
+        self.assertEqual(sum(row["count"] for row in data["price"]), female.count())
+        self.assertEqual(
+            sum(row["count"] for row in data["category"]),
+            female.filter(price__gte=60000, price__lte=90000).count(),
+        )
+
+
+class PriceHistogramTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_list_products()
+        Product.objects.filter(pk__in=Product.objects.order_by("id")[:5]).update(sales=500)
+
+    def get_histogram(self, params):
+        cache.clear()
+        response = self.client.get(reverse("product-catalog-price-histogram"), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_buckets_match_filtered_products(self):
+        data = self.get_histogram({"buckets": 4, "min_price": 5000, "max_price": 9000})
+        prices = {
+            "price": [product.price for product in Product.objects.all()],
+            "effective_price": [product.discounted_price for product in Product.objects.all()],
+        }
+
+        for name, values in prices.items():
+            with self.subTest(field=name):
+                histogram = data[name]
+                self.assertEqual(histogram["min_price"], min(values))
+                self.assertEqual(histogram["max_price"], max(values))
+                self.assertEqual(len(histogram["buckets"]), 4)
+
+                expected = [0] * 4
+                width = (max(values) - min(values)) / 4
+                for value in values:
+                    expected[min(int((value - min(values)) / width), 3)] += 1
+                self.assertEqual([b["count"] for b in histogram["buckets"]], expected)
+
+    def test_empty_selection(self):
+        data = self.get_histogram({"category": "0"})
+        self.assertEqual(data["price"], {"min_price": None, "max_price": None, "buckets": []})
+
+    def test_arrays_expire_without_shared_cache(self):
+        for enabled, timeout in ((True, 3600), (False, 60)):
+            cache.clear()
+            with self.subTest(enabled=enabled), override_settings(
+                CATALOG_CACHE_ENABLED=enabled, CATALOG_CACHE_TIMEOUT=3600, CATALOG_MEMORY_INDEX_MAX_AGE=60
+            ), mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+                price_arrays(Product.objects.all())
+                self.assertEqual(cache_set.call_args.args[2], timeout)
+
+
+class RelatedProductsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_list_products()
+        category = Category.objects.get()
+        sub_category = SubCategory.objects.get()
+        for index, (title, volume) in enumerate(
+            (("Atir Rose Noir", "50"), ("Atir Rose Blanc", "50"), ("Krem Aloe", "200"))
+        ):
+            product = Product.objects.create(
+                title=title, title_uz=title, title_ru=title, description="",
+                price=150000 + index, category=category, sub_category=sub_category,
+            )
+            ShortDescription.objects.create(
+                product=product, key="Hajmi", key_uz="Hajmi", key_ru="Объём",
+                value=volume, value_uz=volume, value_ru=volume,
+            )
+        ProductCatalogRow.rebuild()
+
+    @staticmethod
+    def product(title):
+        return Product.objects.get(title_uz=title)
+
+    def related_ids(self, product):
+        return list(product.related_links.order_by("rank").values_list("related_id", flat=True))
+
+    def test_rebuild_is_bounded_and_ranked(self):
+        with self.settings(RELATED_PRODUCTS_LIMIT=5):
+            rebuild_related_products()
+
+        product = self.product("Atir Rose Noir")
+        links = list(product.related_links.order_by("rank"))
+        self.assertEqual([link.rank for link in links], [1, 2, 3, 4, 5])
+        self.assertNotIn(product.pk, [link.related_id for link in links])
+        self.assertEqual(
+            [link.score for link in links], sorted((link.score for link in links), reverse=True)
+        )
+        # Общие слова названия и атрибуты важнее общей категории
+        self.assertEqual(links[0].related_id, self.product("Atir Rose Blanc").pk)
+
+    def test_refresh_updates_changed_product_and_referrers(self):
+        with self.settings(RELATED_PRODUCTS_LIMIT=5):
+            rebuild_related_products()
+            blanc = self.product("Atir Rose Blanc")
+            referrers = set(
+                RelatedProduct.objects.filter(related=blanc).values_list("product_id", flat=True)
+            )
+            self.assertTrue(referrers)
+            Product.objects.filter(pk=blanc.pk).update(title_uz="Krem Blanc")
+            with CaptureQueriesContext(connection) as context:
+                refreshed = refresh_related_products([blanc.pk])
+            self.assertEqual(set(refreshed), {blanc.pk, *referrers})
+            before = {pk: self.related_ids(Product(pk=pk)) for pk in refreshed}
+
+            rebuild_related_products()
+            self.assertEqual(before, {pk: self.related_ids(Product(pk=pk)) for pk in refreshed})
+        # Без перебора порогов по всей категории: чтение связей, продуктов,
+        # признаков категории и запись
+        self.assertLessEqual(len(context.captured_queries), 8)
+
+    def test_background_refresh_is_debounced(self):
+        products = [self.product("Atir Rose Noir").pk, self.product("Krem Aloe").pk]
+        with self.settings(RELATED_PRODUCTS_REFRESH="background", RELATED_PRODUCTS_REFRESH_DELAY=0), \
+                mock.patch("apps.product.recommendations.run_in_background") as run_in_background, \
+                mock.patch("apps.product.recommendations.refresh_related_and_invalidate") as refresh:
+            for pk in products:
+                schedule_related_refresh([pk])
+            # Один поток на все правки, пока он не отработал
+            run_in_background.assert_called_once_with(drain_related_refresh)
+            refresh.assert_not_called()
+
+            drain_related_refresh()
+            refresh.assert_called_once_with(set(products))
+            schedule_related_refresh(products)
+            self.assertEqual(run_in_background.call_count, 2)
+            drain_related_refresh()
+
+    def test_detail_serves_related_in_one_query(self):
+        with self.settings(RELATED_PRODUCTS_LIMIT=5):
+            rebuild_related_products()
+        url = reverse("product-retrieve-update-destroy", kwargs={"slug": self.product("Atir Rose Noir").slug})
+
+        with self.settings(CATALOG_READ_MODEL=True), CaptureQueriesContext(connection) as context:
+            data = self.client.get(url).json()
+        related_queries = [
+            query for query in context.captured_queries if "product_relatedproduct" in query["sql"]
+        ]
+        self.assertEqual(len(related_queries), 1)
+        self.assertEqual(len(data["related_products"]), 5)
+        self.assertEqual(
+            set(data["related_products"][0]),
+            {"id", "title_uz", "title_ru", "images", "price", "sales", "slug", "short_descriptions"},
+        )
+
+        # Без read-модели то же самое читается из Product, а не из устаревших строк
+        ProductCatalogRow.objects.update(price=0)
+        with self.settings(CATALOG_READ_MODEL=False):
+            fallback = self.client.get(url).json()
+        self.assertEqual(
+            [item["id"] for item in fallback["related_products"]],
+            [item["id"] for item in data["related_products"]],
+        )
+        self.assertEqual(fallback["related_products"], data["related_products"])
+
+    def test_delete_refreshes_referrers(self):
+        with self.settings(RELATED_PRODUCTS_LIMIT=5):
+            rebuild_related_products()
+            blanc = self.product("Atir Rose Blanc")
+            noir = self.product("Atir Rose Noir")
+            self.assertIn(blanc.pk, self.related_ids(noir))
+            with self.captureOnCommitCallbacks(execute=True):
+                blanc.delete()
+            self.assertEqual(len(self.related_ids(noir)), 5)
+
+
+class CompanionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_list_products(6)
+        ProductCatalogRow.rebuild()
+        Order.objects.all().delete()
+        cls.products = list(Product.objects.order_by("id"))
+        first, second, third, fourth = cls.products[:4]
+        baskets = [
+            (first, second, third),
+            (first, second),
+            (first, second),
+            (first, third),
+            (first, third),
+            (third, fourth),
+        ]
+        for basket in baskets:
+            order_user = OrderUser.objects.create(phone="998901111111", total_price=0)
+            for product in basket:
+                Order.objects.create(product_id=product, count=1, order=order_user)
+
+    def test_rank_by_confidence(self):
+        rebuild_companions(min_support=2, chunk_size=2)
+        first, second, third, fourth = self.products[:4]
+
+        links = list(first.companion_links.order_by("rank"))
+        self.assertEqual([link.companion_id for link in links], [second.pk, third.pk])
+        self.assertEqual(links[0].support, 3)
+        self.assertAlmostEqual(links[0].confidence, 3 / 5, places=4)
+        # При равной confidence выше пара с большим lift
+        self.assertAlmostEqual(links[1].confidence, 3 / 5, places=4)
+        self.assertGreater(links[0].lift, links[1].lift)
+        # Пара (third, fourth) встречается один раз — ниже min_support
+        self.assertFalse(fourth.companion_links.exists())
+
+    def test_endpoint_excludes_cart_items(self):
+        rebuild_companions(min_support=2)
+        first, second, third, _ = self.products[:4]
+        url = reverse("product-bought-together")
+
+        data = self.client.get(url, {"products": first.pk}).json()
+        self.assertEqual([item["id"] for item in data], [second.pk, third.pk])
+
+        data = self.client.get(url, {"products": f"{first.pk},{second.pk}"}).json()
+        self.assertEqual([item["id"] for item in data], [third.pk])
+
+        self.assertEqual(self.client.get(url, {"products": "x"}).status_code, 400)
+
+
+@override_settings(CATALOG_CACHE_ENABLED=True)
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_list_products(3)
+        cls.product = Product.objects.order_by("id").first()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_second_read_served_from_cache(self):
+        for url, params in (
+            (reverse("product-catalog"), {}),
+            (reverse("catalog-search"), {"search": "Mahsulot"}),
+        ):
+            first = self.client.get(url, params).json()
+            with CaptureQueriesContext(connection) as context:
+                second = self.client.get(url, params).json()
+            self.assertEqual(first, second)
+            self.assertEqual(len(context.captured_queries), 0, url)
+
+    def test_product_save_invalidates(self):
+        url = reverse("product-catalog")
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 777
+            self.product.save()
+        prices = {item["id"]: item["price"] for item in self.client.get(url).json()["results"]}
+        self.assertEqual(prices[self.product.pk], 777)
+
+    @override_settings(CATALOG_CACHE_ENABLED=False)
+    def test_disabled_reads_database(self):
+        url = reverse("product-catalog")
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertGreater(len(context.captured_queries), 0)
+        self.assertNotIn("ETag", response)
+
+    def test_local_memory_backend_rejected(self):
+        locmem = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        redis = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache"}}
+        with override_settings(CACHES=locmem):
+            self.assertEqual([e.id for e in check_catalog_cache_backend(None)], ["product.E001"])
+            with override_settings(CATALOG_CACHE_ENABLED=False):
+                self.assertEqual(check_catalog_cache_backend(None), [])
+        with override_settings(CACHES=redis):
+            self.assertEqual(check_catalog_cache_backend(None), [])
+
+
+@override_settings(CATALOG_CACHE_ENABLED=True)
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_list_products(3)
+        ProductCatalogRow.rebuild()
+        cls.product = Product.objects.order_by("id").first()
+
+    def setUp(self):
+        cache.clear()
+        self.urls = (
+            reverse("product-retrieve-update-destroy", kwargs={"slug": self.product.slug}),
+            reverse("product-catalog"),
+            reverse("category-count"),
+        )
+
+    def test_if_none_match_answers_304(self):
+        for url in self.urls:
+            etag = self.client.get(url)["ETag"]
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response.content, b"")
+            # Для детали — только updated_at, без выборки и сериализации
+            self.assertLessEqual(len(context.captured_queries), 1, url)
+
+    def test_if_modified_since_answers_304(self):
+        for url in self.urls:
+            last_modified = self.client.get(url)["Last-Modified"]
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 304, url)
+
+    def test_product_save_changes_etag(self):
+        etags = [self.client.get(url)["ETag"] for url in self.urls]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 777
+            self.product.save()
+        for url, etag in zip(self.urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNotEqual(response["ETag"], etag)
+
+
+@override_settings(CATALOG_CACHE_ENABLED=True)
+class ProductDetailCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_list_products(3)
+        ProductCatalogRow.rebuild()
+        cls.product = Product.objects.order_by("id").first()
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("product-retrieve-update-destroy", kwargs={"slug": self.product.slug})
+
+    def test_second_read_served_from_cache(self):
+        first = self.client.get(self.url).json()
+        with CaptureQueriesContext(connection) as context:
+            second = self.client.get(self.url).json()
+        self.assertEqual(first, second)
+        # Остаётся только запрос updated_at для ETag
+        self.assertEqual(len(context.captured_queries), 1)
+
+    def test_product_write_invalidates(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            ShortDescription.objects.filter(product=self.product).update(value_ru="75")
+            ShortDescription.objects.get(product=self.product).save()
+        data = self.client.get(self.url).json()
+        self.assertEqual(data["short_descriptions"][0]["value_ru"], "75")
+
+    def test_category_write_invalidates(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.filter(pk=self.product.category_id).update(title_ru="Духи")
+            Category.objects.get(pk=self.product.category_id).save()
+        self.assertEqual(self.client.get(self.url).json()["categories"]["title_ru"], "Духи")
+
+    @mock.patch("apps.product.cache.run_in_background")
+    def test_stale_entry_served_and_refreshed_in_background(self, run_in_background):
+        first = self.client.get(self.url).json()
+        bump_catalog_generation()
+
+        self.assertEqual(self.client.get(self.url).json(), first)
+        run_in_background.assert_called_once()
+        # Повторное чтение не запускает второе обновление
+        self.client.get(self.url)
+        run_in_background.assert_called_once()
+
+
+@override_settings(DEBUG=True)
+class ProductUpdateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_list_products(2)
+        cls.product = Product.objects.order_by("id").first()
+        cls.index_category = IndexCategory.objects.create(title="Top", title_uz="Top", title_ru="Top")
+        Product.objects.filter(pk=cls.product.pk).update(index_category=cls.index_category)
+
+    def patch(self, data):
+        url = reverse("product-retrieve-update-destroy", kwargs={"slug": self.product.slug})
+        response = self.client.patch(url, data, content_type="application/json")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def test_price_edit_writes_one_row(self):
+        image_ids = set(self.product.images.values_list("pk", flat=True))
+        response = self.patch({"price": 777})
+
+        self.assertEqual(response["X-Rows-Written"], "1")
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.price, 777)
+        # Частичное обновление без image_ids не трогает картинки и индекс-категорию
+        self.assertEqual(set(self.product.images.values_list("pk", flat=True)), image_ids)
+        self.assertEqual(self.product.index_category, self.index_category)
+
+    def test_unchanged_nested_data_writes_nothing(self):
+        descriptions = list(
+            self.product.short_descriptions.values("key_uz", "key_ru", "value_uz", "value_ru")
+        )
+        response = self.patch(
+            {
+                "short_descriptions": descriptions,
+                "image_ids": list(self.product.images.values_list("pk", flat=True)),
+            }
+        )
+        self.assertEqual(response["X-Rows-Written"], "0")
+
+    def test_short_descriptions_diff(self):
+        original = self.product.short_descriptions.get()
+        response = self.patch(
+            {
+                "short_descriptions": [
+                    {"key_uz": "Hajmi", "key_ru": "Объём", "value_uz": "75", "value_ru": "75"},
+                    {"key_uz": "Rang", "key_ru": "Цвет", "value_uz": "Qizil", "value_ru": "Красный"},
+                ]
+            }
+        )
+        # Одна строка обновлена на месте, одна добавлена, плюс updated_at продукта
+        self.assertEqual(response["X-Rows-Written"], "3")
+        self.assertEqual(self.product.short_descriptions.get(key_uz="Hajmi").pk, original.pk)
+        self.assertEqual(self.product.short_descriptions.count(), 2)
+        self.assertTrue(IndexCategory.objects.filter(pk=self.index_category.pk).exists())
+
+
+class SlugAllocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_list_products(1)
+        cls.category = Category.objects.get()
+        cls.sub_category = SubCategory.objects.get()
+
+    def create(self, title):
+        return Product.objects.create(
+            title=title, title_uz=title, title_ru=title, description="", price=1000,
+            category=self.category, sub_category=self.sub_category,
+        )
+
+    def test_duplicates_get_next_suffix_with_one_lookup(self):
+        for _ in range(5):
+            self.create("Krem")
+
+        with CaptureQueriesContext(connection) as context:
+            product = self.create("Krem")
+        lookups = [
+            query for query in context.captured_queries
+            if query["sql"].startswith("SELECT") and "slug" in query["sql"]
+        ]
+        self.assertEqual(product.slug, "krem-5")
+        self.assertEqual(len(lookups), 1)
+
+    def test_allocate_slugs_for_bulk_paths(self):
+        self.create("Krem")
+        self.create("Krem 1")
+        self.assertEqual(
+            allocate_slugs(["Krem", "Krem", "Krem 1", "Shampun", ""]),
+            ["krem-2", "krem-3", "krem-1-1", "shampun", "product"],
+        )
+
+    def test_retries_when_concurrent_writer_takes_slug(self):
+        self.create("Krem")
+        # Первое распределение "не видит" параллельно созданный krem
+        with mock.patch(
+            "apps.product.models.allocate_slugs", side_effect=[["krem"], allocate_slugs(["Krem"])]
+        ) as allocate:
+            product = self.create("Krem")
+        self.assertEqual(product.slug, "krem-1")
+        self.assertEqual(allocate.call_count, 2)
+
+
+class ProductImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_list_products(1)
+        cls.product = Product.objects.get()
+        cls.category = Category.objects.get()
+        cls.sub_category = SubCategory.objects.get()
+        cls.image_ids = list(Images.objects.values_list("pk", flat=True))
+
+    def record(self, index, **overrides):
+        record = {
+            "title_uz": f"Krem {index}",
+            "title_ru": f"Крем {index}",
+            "price": 1000 + index,
+            "sales": 100,
+            "category": self.category.pk,
+            "sub_category": self.sub_category.pk,
+            "image_ids": self.image_ids[:1],
+            "short_descriptions": [
+                {"key_uz": "Hajmi", "key_ru": "Объём", "value_uz": "30", "value_ru": "30"}
+            ],
+            "brand ": "ignored",
+        }
+        record.update(overrides)
+        return record
+
+    def test_ndjson_command_creates_upserts_and_reports(self):
+        records = [self.record(index) for index in range(20)]
+        records.append(self.record(20, slug=self.product.slug, price=5, sales=0, image_ids=[]))
+        records.append(self.record(21, sales=5000))
+        records.append(self.record(22, category=999))
+        stream = StringIO("\n".join(json.dumps(record) for record in records))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as context:
+                report = ProductImporter(batch_size=100).run(stream)
+        # Количество запросов записи не зависит от числа строк
+        self.assertLess(len(context.captured_queries), 30)
+
+        self.assertEqual(report["created"], 20)
+        self.assertEqual(report["updated"], 1)
+        self.assertEqual([error["row"] for error in report["errors"]], [22, 23])
+        self.assertIn("category", report["errors"][1]["errors"])
+
+        created = Product.objects.get(title_uz="Krem 3")
+        self.assertEqual(created.slug, "krem-3")
+        self.assertEqual(list(created.images.values_list("pk", flat=True)), self.image_ids[:1])
+        self.assertEqual(created.short_descriptions.get().value_ru, "30")
+        self.assertTrue(ProductCatalogRow.objects.filter(pk=created.pk).exists())
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.price, self.product.title_uz), (5, "Krem 20"))
+        self.assertFalse(self.product.images.exists())
+        self.assertEqual(self.product.short_descriptions.count(), 1)
+
+    def test_explicit_slugs_reserved_validated_and_unique(self):
+        records = [
+            self.record(0, slug="krem-5"),
+            self.record(5),
+            self.record(6, slug="krem-5"),
+            self.record(7, slug="krem 7!"),
+        ]
+        stream = StringIO("\n".join(json.dumps(record) for record in records))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            report = ProductImporter().run(stream)
+
+        self.assertEqual(report["created"], 2)
+        self.assertEqual(
+            [(error["row"], list(error["errors"])) for error in report["errors"]],
+            [(3, ["slug"]), (4, ["slug"])],
+        )
+        self.assertEqual(Product.objects.get(title_uz="Krem 0").slug, "krem-5")
+        # Свободный slug выбран с учётом явного slug той же пачки
+        self.assertEqual(Product.objects.get(title_uz="Krem 5").slug, "krem-5-1")
+
+    def test_concurrent_slug_retried_then_reported(self):
+        taken = self.product.slug
+        records = [self.record(1), self.record(2, slug="krem-explicit")]
+        # Первое распределение "не видит" параллельно созданный продукт
+        with mock.patch(
+            "apps.product.importer.allocate_slugs", side_effect=[[taken], ["krem-1"]]
+        ), self.captureOnCommitCallbacks(execute=True):
+            report = ProductImporter().run(StringIO(json.dumps(records)))
+        self.assertEqual(report, {"created": 2, "updated": 0, "errors": []})
+        self.assertEqual(Product.objects.get(title_uz="Krem 1").slug, "krem-1")
+
+        records = [self.record(3), self.record(4)]
+        with mock.patch(
+            "apps.product.importer.allocate_slugs", return_value=[taken, "krem-4"]
+        ), self.captureOnCommitCallbacks(execute=True):
+            report = ProductImporter().run(StringIO(json.dumps(records)))
+        # Вся пачка откатилась, строки — в отчёте
+        self.assertEqual(report["created"], 0)
+        self.assertEqual([error["row"] for error in report["errors"]], [1, 2])
+        self.assertFalse(Product.objects.filter(title_uz="Krem 4").exists())
+
+    def test_admin_endpoint_reads_json_array(self):
+        url = reverse("product-import")
+        upload = SimpleUploadedFile(
+            "products.json", json.dumps([self.record(1), self.record(2)]).encode("utf-8")
+        )
+        self.assertEqual(self.client.post(url, {"file": upload}).status_code, 403)
+
+        admin = get_user_model().objects.create(username="admin", is_staff=True)
+        self.client.force_login(admin)
+        upload.seek(0)
+        response = self.client.post(url, {"file": upload})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json(), {"created": 2, "updated": 0, "errors": []})
+
+
+class ProductPriceBulkUpdateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_list_products(30)
+        cls.products = list(Product.objects.order_by("id"))
+        cls.admin = get_user_model().objects.create(username="admin", is_staff=True)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def patch(self, data):
+        return self.client.patch(
+            reverse("product-bulk-update"), data, content_type="application/json"
+        )
+
+    def test_updates_all_rows_with_one_write(self):
+        items = [{"id": product.pk, "price": 500, "sales": 50} for product in self.products[:25]]
+        items.append({"slug": self.products[25].slug, "is_available": False})
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with CaptureQueriesContext(connection) as context:
+                response = self.patch(items)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json(), {"updated": 26})
+
+        updates = [query for query in context.captured_queries if query["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        # Одна инвалидация на весь запрос
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(Product.objects.filter(price=500, sales=50).count(), 25)
+        self.assertFalse(Product.objects.get(pk=self.products[25].pk).is_available)
+        self.assertEqual(ProductCatalogRow.objects.get(pk=self.products[0].pk).price, 500)
+
+    @override_settings(CATALOG_CACHE_ENABLED=True)
+    def test_price_only_refresh(self):
+        product, missing = self.products[:2]
+        ProductCatalogRow.sync([product.pk])
+        ProductCatalogRow.objects.filter(pk=missing.pk).delete()
+        url = reverse("product-retrieve-update-destroy", kwargs={"slug": product.slug})
+        self.client.get(url)
+
+        with mock.patch("apps.product.signals.update_search_index") as update_search_index, \
+                mock.patch("apps.product.signals.bump_product_versions") as bump_product_versions, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.patch(
+                [{"id": product.pk, "price": 700, "sales": 70}, {"id": missing.pk, "is_available": False}]
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        # Поиск от цен не зависит, детали сбрасываются одним сдвигом версии
+        update_search_index.assert_not_called()
+        bump_product_versions.assert_not_called()
+        self.assertEqual(self.client.get(url).json()["price"], 700)
+
+        row = ProductCatalogRow.objects.get(pk=product.pk)
+        self.assertEqual((row.price, row.sales), (700, 70))
+        # Продукт без строки получает её целиком
+        self.assertFalse(ProductCatalogRow.objects.get(pk=missing.pk).is_available)
+        consistency = ProductCatalogRow.check_consistency()
+        self.assertFalse({product.pk, missing.pk} & {*consistency["missing"], *consistency["stale"]})
+
+    def test_clean_errors_reject_whole_request(self):
+        first, second = self.products[:2]
+        response = self.patch(
+            [
+                {"id": first.pk, "price": 10},
+                {"id": second.pk, "sales": second.price + 1},
+                {"slug": "missing", "price": 1},
+            ]
+        )
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()
+        self.assertEqual(errors[0], {})
+        self.assertIn("greater than the price", errors[1]["error"][0])
+        self.assertEqual(errors[2], {"error": ["Product not found."]})
+        self.assertEqual(Product.objects.get(pk=first.pk).price, first.price)
+
+        response = self.patch([{"price": 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("id or slug", response.json()[0]["error"][0])
+
+    def test_list_length_checked_before_items(self):
+        with mock.patch(
+            "apps.product.serializers.ProductPriceBulkListSerializer.max_items", 3
+        ), mock.patch(
+            "apps.product.serializers.ProductPriceBulkSerializer.run_validation"
+        ) as run_validation:
+            response = self.patch([{"id": product.pk, "price": 1} for product in self.products[:4]])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("3", response.json()["error"][0])
+        run_validation.assert_not_called()
+
+        self.assertEqual(self.patch([]).status_code, 400)
+
+    def test_requires_admin(self):
+        self.client.logout()
+        self.assertEqual(self.patch([{"id": self.products[0].pk, "price": 1}]).status_code, 403)
+
+
+class ProductListExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_list_products(12)
+
+    def get(self, **params):
+        return self.client.get(reverse("products-list-create"), params)
+
+    def test_list_is_paginated(self):
+        response = self.get(page_size=5)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 12)
+        self.assertEqual(len(response.json()["results"]), 5)
+
+    def test_json_export_round_trips_through_import(self):
+        response = self.get(export="json")
+        self.assertTrue(response.streaming)
+        records = json.loads(b"".join(response.streaming_content))
+
+        self.assertEqual(len(records), 12)
+        first = records[-1]
+        self.assertEqual(first["title_uz"], "Mahsulot 0")
+        self.assertEqual(len(first["image_ids"]), 2)
+        self.assertEqual(first["short_descriptions"][0]["key_ru"], "Объём")
+
+        report = ProductImporter().run(StringIO(json.dumps(records)))
+        self.assertEqual(report, {"created": 0, "updated": 12, "errors": []})
+
+    def test_ndjson_export_reads_in_chunks(self):
+        with mock.patch.object(ProductListCreateView, "export_chunk_size", 5):
+            with CaptureQueriesContext(connection) as context:
+                response = self.get(export="ndjson")
+                lines = b"".join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(len(lines), 12)
+        self.assertEqual(json.loads(lines[0])["title_uz"], "Mahsulot 11")
+        # Выборка продуктов + картинки и описания на каждую из 3 пачек
+        self.assertEqual(len(context.captured_queries), 1 + 2 * 3)
+
+    def test_unknown_export_format(self):
+        self.assertEqual(self.get(export="csv").status_code, 400)
+
+
+class ProductFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_list_products(5)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def read(self, feed_format):
+        with gzip.open(feed_path(feed_format), "rt", encoding="utf-8") as stream:
+            return stream.read()
+
+    def test_incremental_run_rebuilds_changed_rows_only(self):
+        self.assertEqual(generate_feeds(), {"total": 5, "rebuilt": 5, "reused": 0})
+
+        changed, deleted = Product.objects.order_by("id")[:2]
+        changed.price = 123
+        changed.save()
+        deleted.delete()
+        self.assertEqual(generate_feeds(), {"total": 4, "rebuilt": 1, "reused": 3})
+
+        records = [json.loads(line) for line in self.read("ndjson").splitlines()]
+        self.assertEqual([record["id"] for record in records], sorted(record["id"] for record in records))
+        self.assertEqual(records[0]["price"], 123)
+        self.assertNotIn(deleted.pk, [record["id"] for record in records])
+
+        rows = list(csv.DictReader(StringIO(self.read("csv"))))
+        self.assertEqual(len(rows), 4)
+        self.assertTrue(rows[0]["image_link"].endswith("/media/products/0-a.jpg"))
+        self.assertEqual(len(ElementTree.fromstring(self.read("xml")).findall("product")), 4)
+
+        self.assertEqual(generate_feeds(full=True)["rebuilt"], 4)
+
+    def test_image_and_description_edits_are_picked_up(self):
+        generate_feeds()
+        first, second, third = Product.objects.order_by("id")[:3]
+        first.images.remove(first.images.order_by("id").first())
+        second.images.first().save()
+        description = third.short_descriptions.get()
+        description.value_ru = "75"
+        description.save()
+
+        self.assertEqual(generate_feeds(), {"total": 5, "rebuilt": 3, "reused": 2})
+        records = [json.loads(line) for line in self.read("ndjson").splitlines()]
+        self.assertTrue(records[0]["image_link"].endswith("/media/products/0-b.jpg"))
+
+    def test_feed_is_served_with_cache_headers(self):
+        url = reverse("product-feed", kwargs={"feed_format": "csv"})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        generate_feeds()
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("max-age=", response["Cache-Control"])
+        self.assertTrue(response["ETag"])
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)).decode()[:2], "id")
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(
+            self.client.get(reverse("product-feed", kwargs={"feed_format": "yml"})).status_code, 404
+        )
+
+
+class FullTextSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_list_products(3)
+        cls.title_match, cls.value_match, cls.other = Product.objects.order_by("id")
+        Product.objects.filter(pk=cls.title_match.pk).update(title_ru="Крем для рук")
+        ShortDescription.objects.filter(product=cls.value_match).update(value_ru="Крем-основа")
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            products_changed([self.title_match.pk, self.value_match.pk])
+
+    def search(self, term):
+        response = self.client.get(reverse("catalog-search"), {"search": term})
+        self.assertEqual(response.status_code, 200)
+        return [row["id"] for row in response.json()["results"]]
+
+    def test_queries_are_prefix_and_of_words(self):
+        self.assertIsNone(search_query(" -- "))
+        self.assertIn("Value('крем & для & ру:*')", repr(search_query("крем  для ру")))
+        self.assertEqual(fts_match('крем "OR ру'), '("крем" "OR" "ру"*) OR ("krem" "or" "ru"*)')
+        self.assertEqual(fts_match("krem"), '"krem"*')
+
+    def require_full_text(self):
+        if not full_text_available(Product.objects.all()):
+            self.skipTest("needs PostgreSQL or SQLite FTS5")
+
+    def test_ranked_by_field_weight(self):
+        self.require_full_text()
+        # Совпадение в названии весит больше совпадения в характеристике
+        self.assertEqual(self.search("крем"), [self.title_match.pk, self.value_match.pk])
+        self.assertEqual(self.search("КРЕ"), [self.title_match.pk, self.value_match.pk])
+        self.assertEqual(self.search("крем рук"), [self.title_match.pk])
+
+    def test_index_follows_product_changes(self):
+        self.require_full_text()
+        self.other.title_ru = "Крем для ног"
+        self.other.save()
+        self.value_match.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            products_changed([self.other.pk, self.value_match.pk])
+        self.assertEqual(self.search("крем"), [self.other.pk, self.title_match.pk])
+
+    def test_index_updates_are_chunked(self):
+        if search_backend(Product.objects.all()) != "sqlite":
+            self.skipTest("needs SQLite FTS5")
+        ids = list(Product.objects.values_list("pk", flat=True))
+        Product.objects.update(title_ru="Крем")
+        with mock.patch("apps.product.search.FTS_CHUNK_SIZE", 2), \
+                CaptureQueriesContext(connection) as context:
+            update_search_index(ids)
+        deletes = [query for query in context.captured_queries if query["sql"].startswith("DELETE")]
+        self.assertEqual(len(deletes), 2)
+        self.assertEqual(sorted(self.search("крем")), sorted(ids))
+
+    def test_falls_back_to_search_filter(self):
+        with mock.patch("apps.product.filters.full_text_available", return_value=False):
+            self.assertEqual(self.search("Крем"), [self.title_match.pk])
+
+
+class FuzzySearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_list_products(3)
+        cls.phone, cls.shoes, cls.other = Product.objects.order_by("id")
+        Product.objects.filter(pk=cls.phone.pk).update(title_uz="Samsung Galaxy telefon")
+        Product.objects.filter(pk=cls.shoes.pk).update(title_ru="Кроссовки Nike Air")
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            products_changed([self.phone.pk, self.shoes.pk])
+
+    def search(self, term, **params):
+        response = self.client.get(reverse("catalog-search"), {"search": term, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row["id"] for row in response.json()["results"]]
+
+    def test_trigrams_match_pg_trgm(self):
+        self.assertEqual(trigrams("Cat"), {"  c", " ca", "cat", "at "})
+        self.assertEqual(trigrams(" -- "), set())
+
+    def test_misspellings_found_only_in_fuzzy_mode(self):
+        for term, product in (
+            ("samsnug", self.phone),
+            ("galaxi telefon", self.phone),
+            ("кросовки", self.shoes),
+            ("КРОСОВКИ", self.shoes),
+        ):
+            with self.subTest(term=term):
+                self.assertEqual(self.search(term), [])
+                self.assertEqual(self.search(term, fuzzy="true"), [product.pk])
+
+    def test_ranked_by_similarity(self):
+        index = TrigramIndex([(1, "nike air"), (2, "nike air max"), (3, "nika")])
+        ranked = index.search("nike air", threshold=0.3)
+        # При равной оценке — более новый продукт
+        self.assertEqual([product_id for product_id, _ in ranked], [2, 1, 3])
+        self.assertEqual(ranked[0][1], 1.0)
+        self.assertEqual(index.search("nike air", threshold=0.9), [(2, 1.0), (1, 1.0)])
+
+    def test_index_follows_catalog_changes(self):
+        self.assertEqual(self.search("adidas", fuzzy="true"), [])
+        Product.objects.filter(pk=self.other.pk).update(title_uz="Adidas krossovka")
+        with self.captureOnCommitCallbacks(execute=True):
+            products_changed([self.other.pk])
+        self.assertEqual(self.search("addidas", fuzzy="true"), [self.other.pk])
+
+    def test_threshold_not_left_on_connection(self):
+        if connection.vendor != "postgresql":
+            self.skipTest("needs PostgreSQL pg_trgm")
+
+        # TestCase держит внешнюю транзакцию, поэтому проверяем сам вызов:
+        # is_local=true действует до конца транзакции, а не сессии
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.search("samsnug", fuzzy="true"), [self.phone.pk])
+        calls = [query["sql"] for query in context.captured_queries if "set_config" in query["sql"]]
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(calls[0].rstrip().endswith("true)"), calls[0])
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command("benchmark_fuzzy_search", samples=3, stdout=out)
+        self.assertIn("exact: recall@10", out.getvalue())
+        self.assertIn("fuzzy: recall@10", out.getvalue())
+
+
+class ProductSuggestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_list_products(3)
+        cls.phone, cls.case, cls.other = Product.objects.order_by("id")
+        Product.objects.filter(pk=cls.phone.pk).update(title_uz="Samsung Galaxy", title_ru="Samsung Galaxy")
+        Product.objects.filter(pk=cls.case.pk).update(title_ru="Чехол для Samsung")
+        cls.category = Category.objects.get()
+
+    def suggest(self, term, **params):
+        response = self.client.get(reverse("product-suggest"), {"q": term, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(row["type"], row["id"]) for row in response.json()]
+
+    def test_prefix_of_any_word_ranked(self):
+        # С начала названия выше, чем с начала другого слова; uz и ru дают один результат
+        self.assertEqual(
+            self.suggest("SAMS"), [("product", self.phone.pk), ("product", self.case.pk)]
+        )
+        self.assertEqual(self.suggest("galaxy"), [("product", self.phone.pk)])
+        self.assertEqual(self.suggest("samsung  gal"), [("product", self.phone.pk)])
+        self.assertEqual(self.suggest("-"), [])
+
+    def test_categories_before_products(self):
+        index = SuggestIndex(
+            [("product", 5, "Parfyum set", "parfyum-set"), ("category", 1, "Parfyum", None)]
+        )
+        self.assertEqual(
+            [(row["type"], row["id"]) for row in index.suggest("p")],
+            [("category", 1), ("product", 5)],
+        )
+        self.assertEqual(index.suggest("parfyum s", limit=1)[0]["slug"], "parfyum-set")
+        self.assertEqual(len(index.suggest("pa", limit=1)), 1)
+
+    def test_served_without_database(self):
+        self.suggest("sam")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest("parf", limit=1), [("category", self.category.pk)])
+
+    def test_rebuilt_on_catalog_change(self):
+        self.assertEqual(self.suggest("iphone"), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.other.pk).update(title_uz="iPhone 15")
+            products_changed([self.other.pk])
+        self.assertEqual(self.suggest("iphone"), [("product", self.other.pk)])
+        self.assertIs(suggest_index.get(), suggest_index.get())
+
+    @override_settings(CATALOG_MEMORY_INDEX_REFRESH="background")
+    @mock.patch("apps.product.cache.run_in_background")
+    def test_previous_index_served_while_rebuilding(self, run_in_background):
+        index = CatalogMemoryCache(mock.Mock(side_effect=["first", "second"]))
+        self.assertEqual(index.get(), "first")
+        bump_catalog_generation()
+
+        self.assertEqual(index.get(), "first")
+        self.assertEqual(index.get(), "first")
+        run_in_background.assert_called_once()
+        function, *args = run_in_background.call_args.args
+        function(*args)
+        self.assertEqual(index.get(), "second")
+
+    @override_settings(CATALOG_CACHE_ENABLED=False, CATALOG_MEMORY_INDEX_MAX_AGE=60)
+    def test_expires_without_shared_generation(self):
+        index = CatalogMemoryCache(mock.Mock(side_effect=["first", "second"]))
+        with mock.patch("apps.product.cache.time.time", return_value=600):
+            self.assertEqual(index.get(), "first")
+        with mock.patch("apps.product.cache.time.time", return_value=659):
+            self.assertEqual(index.get(), "first")
+        with mock.patch("apps.product.cache.time.time", return_value=660):
+            self.assertEqual(index.get(), "second")
+
+    def test_invalid_limit(self):
+        response = self.client.get(reverse("product-suggest"), {"q": "sam", "limit": "x"})
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchNormalizationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_list_products(3)
+        cls.flag, cls.shoes, cls.other = Product.objects.order_by("id")
+        cls.flag.title_uz = "O‘zbekiston bayrog‘i"
+        cls.flag.title_ru = "Флаг Узбекистана"
+        cls.flag.save()
+        Product.objects.filter(pk=cls.shoes.pk).update(title_ru="Кроссовки Ёлка")
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            products_changed([self.flag.pk, self.shoes.pk])
+
+    def search(self, term, **params):
+        response = self.client.get(reverse("catalog-search"), {"search": term, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row["id"] for row in response.json()["results"]]
+
+    def test_normalize(self):
+        for text in ("O‘zbekiston", "Oʻzbekiston", "O'ZBEKISTON", "Ўзбекистон", "o’zbekiston"):
+            with self.subTest(text=text):
+                self.assertEqual(normalize_search_text(text), "ozbekiston")
+        self.assertEqual(normalize_search_text("Ғалаба, маълумот"), "galaba malumot")
+        self.assertEqual(normalize_search_text("Crème  brûlée!"), "creme brulee")
+        self.assertEqual(normalize_search_text("Йогурт Ёлка"), "yogurt yolka")
+        self.assertEqual(normalize_search_text(None), "")
+
+    def test_search_text_persisted(self):
+        self.flag.refresh_from_db()
+        self.assertEqual(self.flag.search_text, "ozbekiston bayrogi flag uzbekistana")
+        # Запись через update() обходит save(): search_text пересчитан в products_changed
+        self.shoes.refresh_from_db()
+        self.assertEqual(self.shoes.search_text, "mahsulot 1 krossovki yolka")
+
+    def test_any_script_matches(self):
+        for term, product in (
+            ("Ўзбекистон", self.flag),
+            ("ozbekiston bayrog'i", self.flag),
+            ("krossovki", self.shoes),
+            ("ёлка", self.shoes),
+            ("yolka", self.shoes),
+        ):
+            with self.subTest(term=term):
+                self.assertEqual(self.search(term), [product.pk])
+                with mock.patch("apps.product.filters.full_text_available", return_value=False):
+                    self.assertEqual(self.search(term), [product.pk])
+
+    def test_search_text_backfilled_by_command(self):
+        Product.objects.update(search_text="")
+        out = StringIO()
+        with mock.patch(
+            "apps.product.management.commands.rebuild_search_index.full_text_available",
+            return_value=False,
+        ), mock.patch("apps.product.search.search_backend", return_value=None):
+            call_command("rebuild_search_index", stdout=out)
+        self.assertIn("only search_text", out.getvalue())
+        self.assertFalse(Product.objects.filter(search_text="").exists())
+
+    def test_backfill_migration(self):
+        migration = import_module("apps.product.migrations.0016_backfill_search_index")
+        Product.objects.update(search_text="")
+        if search_backend(Product.objects.all()) == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        self.assertEqual(self.search("ozbekiston"), [])
+        migration.backfill_search_index(django_apps, connection.schema_editor())
+        self.assertFalse(Product.objects.filter(search_text="").exists())
+        self.flag.refresh_from_db()
+        self.assertEqual(self.flag.search_text, "ozbekiston bayrogi flag uzbekistana")
+        self.assertEqual(self.search("Ўзбекистон"), [self.flag.pk])
+        self.assertEqual(self.search("кросовки", fuzzy="true"), [self.shoes.pk])
+
+    def test_fuzzy_and_suggest_use_normalized_text(self):
+        self.assertEqual(self.search("кросовки", fuzzy="true"), [self.shoes.pk])
+        response = self.client.get(reverse("product-suggest"), {"q": "Ўзб"})
+        self.assertEqual([row["id"] for row in response.json()], [self.flag.pk])
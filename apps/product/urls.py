@@ -2,8 +2,14 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from apps.product import views
-from apps.product.views import (AllCategoryViewSet, ProductCatalogView,
-                                SearchListApiView, StatisticsAPIView,
+from apps.product.views import (AllCategoryViewSet, ProductBoughtTogetherView,
+                                ProductCatalogView,
+                                ProductFacetsView, ProductFeedView,
+                                ProductImportView,
+                                ProductPriceBulkUpdateView,
+                                ProductPriceHistogramView,
+                                ProductSuggestView, SearchListApiView,
+                                StatisticsAPIView,
                                 UserSalesStatisticsAPIView,
                                 CategoryStatisticsAPIView,
                                 ProductStatisticsAPIView
@@ -52,12 +58,42 @@ urlpatterns = [
         views.ProductListCreateView.as_view(),
         name="products-list-create",
     ),
+    path(
+        "products/import",
+        ProductImportView.as_view(),
+        name="product-import",
+    ),
+    path(
+        "products/bulk-update",
+        ProductPriceBulkUpdateView.as_view(),
+        name="product-bulk-update",
+    ),
     path(
         "products/<slug:slug>/",
         views.ProductDetailUpdateDestroyView.as_view(),
         name="product-retrieve-update-destroy",
     ),
     path("products-catalog", ProductCatalogView.as_view(), name="product-catalog"),
+    path(
+        "products-catalog/facets",
+        ProductFacetsView.as_view(),
+        name="product-catalog-facets",
+    ),
+    path(
+        "products-catalog/price-histogram",
+        ProductPriceHistogramView.as_view(),
+        name="product-catalog-price-histogram",
+    ),
+    path(
+        "products-feed/<str:feed_format>",
+        ProductFeedView.as_view(),
+        name="product-feed",
+    ),
+    path(
+        "products-bought-together",
+        ProductBoughtTogetherView.as_view(),
+        name="product-bought-together",
+    ),
     path(
         "short-description/",
         views.ShortDescriptionListCreateView.as_view(),
@@ -70,6 +106,7 @@ urlpatterns = [
     ),
 
     path("product-search", SearchListApiView.as_view(), name="catalog-search"),
+    path("product-suggest", ProductSuggestView.as_view(), name="product-suggest"),
     path(
         "banners/",
         views.BannerListCreateView.as_view(),
@@ -1,21 +1,27 @@
+import io
+import json
 import os
+from datetime import datetime, timezone
 from django.db.models.functions import TruncDay, Coalesce
 import requests
 from rest_framework import generics
 from django.db import transaction
-from django.db.models import Sum, Avg, Count, Max, Min
-from django.http import Http404
+from django.db.models import Sum, Avg, Count, Max, Min, Q
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django_filters.rest_framework import DjangoFilterBackend
-from drf_spectacular.utils import extend_schema, OpenApiParameter
+from drf_spectacular.utils import extend_schema, inline_serializer, OpenApiParameter
 from requests import Request
-from rest_framework import mixins, status
-from rest_framework.filters import SearchFilter
+from rest_framework import mixins, serializers, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import (CreateAPIView, ListAPIView,
                                      ListCreateAPIView, RetrieveAPIView,
                                      RetrieveUpdateDestroyAPIView,
                                      UpdateAPIView, get_object_or_404)
 from rest_framework.parsers import FormParser, MultiPartParser
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.status import (HTTP_200_OK, HTTP_201_CREATED,
@@ -28,7 +34,8 @@ load_dotenv()
 
 from apps.product.models import (Banner, Category, 
                                  IndexCategory, Order, OrderUser,
-                                 ShortDescription, Stock, SubCategory)
+                                 ProductCatalogRow, ShortDescription, Stock,
+                                 SubCategory)
 from apps.product.serializers import (AllCategorySerializer, BannerSerializer,
                                       CategoryCountSerializer,
                                       CategorySerializer,
@@ -36,8 +43,12 @@ from apps.product.serializers import (AllCategorySerializer, BannerSerializer,
                                       IndexCategorySerializer,
                                       MainPageCategorySerializer,
                                       OrderUserGetSerializer,
+                                      ProductCatalogRowSerializer,
                                       ProductCatalogSerializer,
+                                      ProductCatalogValuesSerializer,
                                       ProductSearchSerializer,
+                                      ProductPriceBulkSerializer,
+                                      ProductSearchValuesSerializer,
                                       ProductSerializer,
                                       OrderUserAnalyticsSerializer,
                                       ShortDescriptionSerializer,
@@ -45,29 +56,78 @@ from apps.product.serializers import (AllCategorySerializer, BannerSerializer,
                                       UserSalesStatisticsSerializer,
                                       CategoryStatisticsSerializer,
                                       ProductStatisticsSerializer)
+from django.conf import settings
 from config.settings import MEDIA_ROOT
 
-from .filters import ProductFilter, ProductSearchFilter, OrderUserFilter
+from .cache import (CatalogCacheMixin, ProductDetailCacheMixin,
+                    catalog_conditional, product_conditional)
+from .filters import (PRICE_FACET_BUCKETS, OrderUserFilter, ProductFilter,
+                      ProductFullTextSearchFilter, ProductSearchFilter)
+from .importer import (EXPORT_CHUNK_SIZE, IMPORT_BATCH_SIZE, ProductImporter,
+                       stream_export)
+from .feeds import FEED_FORMATS, feed_path
+from .histogram import (MAX_PRICE_HISTOGRAM_BUCKETS, PRICE_HISTOGRAM_BUCKETS,
+                        price_histogram)
 from .models import Images, Product
-from .pagination import CustomPagination
+from .pagination import CatalogCursorPagination, CustomPagination
+from .recommendations import companion_ids
 from .serializers import OrderUserSerializer
+from .suggest import SUGGEST_LIMIT, SUGGEST_MAX_LIMIT, suggest_index
+from apps.utils import EagerLoadingViewMixin
 
 
 
-class SearchListApiView(ListAPIView):
+class SearchListApiView(CatalogCacheMixin, EagerLoadingViewMixin, ListAPIView):
+    cache_prefix = "search"
     queryset = Product.objects.all().order_by("-id")
     renderer_classes = [JSONRenderer]
     serializer_class = ProductSearchSerializer
-    filter_backends = (SearchFilter, DjangoFilterBackend)
+    filter_backends = (ProductFullTextSearchFilter, DjangoFilterBackend)
     filterset_class = ProductSearchFilter
-    search_fields = ("title_uz", "title_ru")
     pagination_class = CustomPagination
 
+    def get_serializer_class(self):
+        if settings.CATALOG_FAST_SERIALIZATION:
+            return ProductSearchValuesSerializer
+        return super().get_serializer_class()
+
     @extend_schema(tags=["catalog-search"])
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
 
+class ProductSuggestView(APIView):
+    """
+    Подсказки для поля поиска (?q=) из индекса в памяти процесса: названия
+    продуктов, категорий и подкатегорий. База не читается, индекс
+    пересобирается при смене поколения каталога.
+    """
+
+    # Без аутентификации: сессия и JWT читали бы пользователя из базы
+    authentication_classes = ()
+    renderer_classes = [JSONRenderer]
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.query_params.get("limit", SUGGEST_LIMIT))
+        except ValueError:
+            raise ValidationError({"limit": "A valid integer is required"})
+        return min(max(limit, 1), SUGGEST_MAX_LIMIT)
+
+    @extend_schema(
+        tags=["catalog-search"],
+        parameters=[
+            OpenApiParameter(name="q", description="Typed prefix", required=True, type=str),
+            OpenApiParameter(
+                name="limit", description=f"Suggestions to return (max {SUGGEST_MAX_LIMIT})", type=int
+            ),
+        ],
+    )
+    def get(self, request, *args, **kwargs):
+        limit = self.get_limit()
+        return Response(suggest_index.get().suggest(request.query_params.get("q", ""), limit))
+
+
 # Image API
 class ImageListCreateView(ListCreateAPIView):
     queryset = Images.objects.all().order_by("-id")
@@ -160,6 +220,7 @@ class CategoryCountAPIView(APIView):
     serializer_class = CategoryCountSerializer
 
     @extend_schema(tags=["category"])
+    @catalog_conditional("category-count")
     def get(self, request, *args, **kwargs):
         count = Category.objects.filter(is_index=True).count()
         data = {"count": count}
@@ -177,6 +238,7 @@ class AllCategoryViewSet(mixins.ListModelMixin, GenericViewSet):
         tags=["category"],
         operation_id="listAllCategories",
     )
+    @catalog_conditional("all-categories")
     def list(self, request, *args, **kwargs):
         all_categories = Category.objects.all()
 
@@ -227,6 +289,7 @@ class CategoryListCreateView(ListCreateAPIView):
     parser_classes = (MultiPartParser, FormParser)
 
     @extend_schema(tags=["category"])
+    @catalog_conditional("categories")
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
@@ -242,6 +305,7 @@ class CategoryDetailUpdateDestroyView(RetrieveUpdateDestroyAPIView):
     lookup_field = "id"
 
     @extend_schema(tags=["category"])
+    @catalog_conditional("category")
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
@@ -264,6 +328,7 @@ class MainPageCategoryView(ListAPIView):
     parser_classes = (MultiPartParser, FormParser)
 
     @extend_schema(tags=["category"])
+    @catalog_conditional("main-page-categories")
     def get(self, request, *args, **kwargs):
         return super().get(request, *args, **kwargs)
 
@@ -376,16 +441,43 @@ class IndexCategoryDetailUpdateDestroyView(RetrieveUpdateDestroyAPIView):
         return super().delete(request, *args, **kwargs)
 
 
-class ProductListCreateView(ListCreateAPIView):
+class ProductListCreateView(EagerLoadingViewMixin, ListCreateAPIView):
     queryset = Product.objects.all().order_by("-id")
     serializer_class = ProductSerializer
+    pagination_class = CustomPagination
+    export_chunk_size = EXPORT_CHUNK_SIZE
+    export_content_types = {
+        "json": "application/json",
+        "ndjson": "application/x-ndjson",
+    }
+
+    def export(self, export_format):
+        # Поток без пагинации: плоский формат импорта, чтение пачками
+        response = StreamingHttpResponse(
+            stream_export(Product.objects.order_by("-id"), export_format, self.export_chunk_size),
+            content_type=self.export_content_types[export_format],
+        )
+        response["Content-Disposition"] = f'attachment; filename="products.{export_format}"'
+        return response
 
-    @extend_schema(tags=["products"])
+    @extend_schema(
+        tags=["products"],
+        parameters=[
+            OpenApiParameter(
+                name="export",
+                description="'json' or 'ndjson' streams the whole catalog in the import format instead of a page",
+                required=False,
+                type=str,
+            ),
+        ],
+    )
     def get(self, request, *args, **kwargs):
-        serializer = self.get_serializer(
-            self.get_queryset(), context={"request": request}, many=True
-        )
-        return Response(serializer.data)
+        export_format = request.query_params.get("export")
+        if export_format is not None:
+            if export_format not in self.export_content_types:
+                raise ValidationError({"export": "Expected 'json' or 'ndjson'"})
+            return self.export(export_format)
+        return self.list(request, *args, **kwargs)
 
     @extend_schema(tags=["products"])
     def post(self, request, *args, **kwargs):
@@ -397,52 +489,426 @@ class ProductListCreateView(ListCreateAPIView):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+class ProductImportView(APIView):
+    """
+    Импорт продуктов из JSON-массива или NDJSON (поле file): пачками через
+    bulk_create, upsert по slug. Возвращает отчёт с ошибками по строкам.
+    """
+
+    permission_classes = (IsAdminUser,)
+    parser_classes = (MultiPartParser,)
+
+    @extend_schema(
+        tags=["products"],
+        parameters=[
+            OpenApiParameter(
+                name="batch_size",
+                description=f"Rows validated and written per transaction (default {IMPORT_BATCH_SIZE})",
+                required=False,
+                type=int,
+            ),
+        ],
+    )
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get("file")
+        if upload is None:
+            raise ValidationError({"file": "This field is required"})
+        try:
+            batch_size = max(int(request.query_params.get("batch_size", IMPORT_BATCH_SIZE)), 1)
+        except ValueError:
+            raise ValidationError({"batch_size": "A valid integer is required"})
+
+        stream = io.TextIOWrapper(upload.file, encoding="utf-8")
+        try:
+            report = ProductImporter(batch_size).run(stream)
+        except (json.JSONDecodeError, UnicodeDecodeError) as error:
+            raise ValidationError({"file": f"Invalid JSON: {error}"})
+        return Response(report, status=status.HTTP_200_OK)
+
+
+class ProductPriceBulkUpdateView(APIView):
+    """
+    Массовое изменение price/sales/is_available (акции): список
+    {id|slug, price, sales, is_available}. Всё или ничего — при ошибке
+    в любой строке ничего не записывается.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    @extend_schema(
+        tags=["products"],
+        request=ProductPriceBulkSerializer(many=True),
+        responses=inline_serializer(
+            "ProductPriceBulkUpdateResponse", {"updated": serializers.IntegerField()}
+        ),
+    )
+    def patch(self, request, *args, **kwargs):
+        serializer = ProductPriceBulkSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        products = serializer.save()
+        return Response({"updated": len(products)}, status=status.HTTP_200_OK)
+
+
+def feed_etag(request, feed_format):
+    path = feed_path(feed_format)
+    if feed_format in FEED_FORMATS and path.exists():
+        stat = path.stat()
+        return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    return None
+
+
+def feed_last_modified(request, feed_format):
+    path = feed_path(feed_format)
+    if feed_format in FEED_FORMATS and path.exists():
+        return datetime.fromtimestamp(path.stat().st_mtime, tz=timezone.utc)
+    return None
+
+
+class ProductFeedView(APIView):
+    """
+    Готовый фид (gzip) для маркетплейсов: файл из MEDIA_ROOT/feeds, который
+    собирает generate_product_feeds. База при отдаче не читается.
+    """
+
+    @extend_schema(tags=["products"], responses={(200, "application/gzip"): bytes})
+    @method_decorator(condition(etag_func=feed_etag, last_modified_func=feed_last_modified))
+    def get(self, request, feed_format, *args, **kwargs):
+        path = feed_path(feed_format)
+        if feed_format not in FEED_FORMATS or not path.exists():
+            raise Http404("Feed not found")
+        response = FileResponse(path.open("rb"), filename=path.name)
+        patch_cache_control(response, public=True, max_age=settings.PRODUCT_FEED_MAX_AGE)
+        return response
 
 
-class ProductCatalogView(ListAPIView):
+class ProductCatalogView(CatalogCacheMixin, EagerLoadingViewMixin, ListAPIView):
+    cache_prefix = "catalog"
+    queryset = Product.objects.all()
     serializer_class = ProductCatalogSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = ProductFilter
     ordering_fields = ("price", "title_ru", "title_uz")
     pagination_class = CustomPagination
 
-    def get_queryset(self):
+    @property
+    def paginator(self):
+        # ?pagination=cursor (или наличие cursor) включает keyset-пагинацию без COUNT(*)
+        if not hasattr(self, "_paginator"):
+            params = self.request.query_params if self.request is not None else {}
+            if params.get("pagination") == "cursor" or "cursor" in params:
+                self._paginator = CatalogCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def get_ordering(self):
+        if isinstance(self.paginator, CatalogCursorPagination):
+            return self.get_cursor_ordering()
+
         ordering = self.request.query_params.get("ordering", "-id")
 
         # Очистка параметра сортировки для проверки его корректности
 
         if ordering not in self.ordering_fields:
             ordering = "-id"
+        return ordering
 
-        queryset = Product.objects.all().order_by(ordering)
+    def get_filter_ordering(self):
+        """
+        (параметр, сортировка) с приоритетом, как у ProductFilter поверх
+        ordering: order_by, затем is_new=new, затем ordering.
+        """
+        params = self.request.query_params
+        if params.get("order_by"):
+            return "order_by", params["order_by"]
+        if params.get("is_new", "").lower() == "new":
+            return "is_new", "-id"
+        return "ordering", params.get("ordering", "-id")
+
+    def get_cursor_ordering(self):
+        """
+        Сортировка для keyset-пагинации с тем же приоритетом, что и без неё.
+        Неподдерживаемая сортировка — 400, а не молчаливая подмена.
+        """
+        param, ordering = self.get_filter_ordering()
+        if ordering not in CatalogCursorPagination.keysets:
+            raise ValidationError(
+                {param: f"Unsupported ordering for cursor pagination: {ordering}"}
+            )
+        return ordering
 
-        # Использовать select_related для загрузки связанных объектов одним запросом
+    def get_row_ordering(self):
+        """
+        Сортировка read-модели. ProductFilter попадает в строки только
+        подзапросом, поэтому его order_by/is_new применяются здесь; при
+        равенстве — по pk в ту же сторону (индексы (поле, product)).
+        """
+        if isinstance(self.paginator, CatalogCursorPagination):
+            ordering = self.get_cursor_ordering()
+        else:
+            param, ordering = self.get_filter_ordering()
+            if param == "ordering":
+                ordering = self.get_ordering()
+            elif ordering != "-id" and ordering.lstrip("-") not in self.ordering_fields:
+                ordering = "-id"
+        if ordering == "-id":
+            return ("-pk",)
+        return (ordering, "-pk" if ordering.startswith("-") else "pk")
+
+    def get_queryset(self):
+        if settings.CATALOG_READ_MODEL:
+            # Плоская таблица: один индексированный SELECT без JOIN и prefetch
+            return ProductCatalogRow.objects.order_by(*self.get_row_ordering())
+
+        # select_related/prefetch_related/only (или values()) объявлены в сериализаторе
+        return super().get_queryset().order_by(self.get_ordering())
+
+    def get_serializer_class(self):
+        if settings.CATALOG_READ_MODEL:
+            return ProductCatalogRowSerializer
+        if settings.CATALOG_FAST_SERIALIZATION:
+            return ProductCatalogValuesSerializer
+        return super().get_serializer_class()
+
+    def filter_queryset(self, queryset):
+        if queryset.model is not ProductCatalogRow:
+            return super().filter_queryset(queryset)
+
+        # ProductFilter работает с Product; в read-модель он попадает подзапросом
+        products = super().filter_queryset(Product.objects.all())
+        if products.query.has_filters():
+            queryset = queryset.filter(product__in=products.order_by().values("pk"))
+        return queryset
+
+    @extend_schema(
+        tags=["catalog-product"],
+        parameters=[
+            OpenApiParameter(
+                name="pagination",
+                description="'cursor' switches to keyset pagination (next/previous cursors, no count)",
+                required=False,
+                type=str,
+            ),
+            OpenApiParameter(
+                name="cursor",
+                description="Opaque cursor from a previous cursor-paginated response",
+                required=False,
+                type=str,
+            ),
+        ],
+    )
+    @catalog_conditional("catalog")
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
 
-        queryset = queryset.select_related("stock", "sub_category", "category")
 
-        # Использовать prefetch_related для оптимизации многих-ко-многим и обратных связей
 
-        queryset = queryset.prefetch_related("images")
 
-        return queryset
+class ProductFacetsView(APIView):
+    """
+    Количество продуктов для каждого значения фасета с учётом остальных
+    активных фильтров ProductFilter (фильтр самого фасета не применяется).
+    Один сгруппированный запрос на фасет.
+    """
+
+    def facet_queryset(self, *exclude):
+        return ProductFilter.facet_queryset(
+            self.request.query_params, exclude=exclude, request=self.request
+        )
+
+    def group_counts(self, facet, *fields):
+        return list(
+            self.facet_queryset(facet)
+            .values(*fields)
+            .annotate(count=Count("id"))
+            .order_by(fields[0])
+        )
+
+    def category_facet(self):
+        return [
+            {
+                "id": row["category_id"],
+                "title_uz": row["category__title_uz"],
+                "title_ru": row["category__title_ru"],
+                "count": row["count"],
+            }
+            for row in self.group_counts(
+                "category", "category_id", "category__title_uz", "category__title_ru"
+            )
+        ]
+
+    def sub_category_facet(self):
+        return [
+            {
+                "id": row["sub_category_id"],
+                "title_uz": row["sub_category__title_uz"],
+                "title_ru": row["sub_category__title_ru"],
+                "count": row["count"],
+            }
+            for row in self.group_counts(
+                "sub_category",
+                "sub_category_id",
+                "sub_category__title_uz",
+                "sub_category__title_ru",
+            )
+        ]
+
+    def stock_facet(self):
+        return [
+            {
+                "id": row["stock_id"],
+                "title": row["stock__title"],
+                "title_uz": row["stock__title_uz"],
+                "title_ru": row["stock__title_ru"],
+                "count": row["count"],
+            }
+            for row in self.group_counts(
+                "stock", "stock_id", "stock__title", "stock__title_uz", "stock__title_ru"
+            )
+            if row["stock_id"] is not None
+        ]
+
+    def gender_facet(self):
+        names = {"M": "male", "F": "female", "U": "unisex"}
+        return [
+            {"value": names.get(row["gender"]), "code": row["gender"], "count": row["count"]}
+            for row in self.group_counts("gender", "gender")
+        ]
+
+    def has_sale_facet(self):
+        counts = self.facet_queryset("has_sale").aggregate(
+            total=Count("id"), without_sale=Count("id", filter=Q(sales=0))
+        )
+        return [
+            {"value": "true", "count": counts["total"] - counts["without_sale"]},
+            {"value": "false", "count": counts["without_sale"]},
+        ]
+
+    def price_facet(self):
+        buckets = {}
+        for index, (low, high) in enumerate(PRICE_FACET_BUCKETS):
+            condition = Q(price__gte=low)
+            if high is not None:
+                condition &= Q(price__lt=high)
+            buckets[f"bucket_{index}"] = Count("id", filter=condition)
+
+        counts = self.facet_queryset("min_price", "max_price").aggregate(**buckets)
+        return [
+            {"min_price": low, "max_price": high, "count": counts[f"bucket_{index}"]}
+            for index, (low, high) in enumerate(PRICE_FACET_BUCKETS)
+        ]
 
     @extend_schema(tags=["catalog-product"])
     def get(self, request, *args, **kwargs):
-        return self.list(request, *args, **kwargs)
+        return Response(
+            {
+                "category": self.category_facet(),
+                "sub_category": self.sub_category_facet(),
+                "stock": self.stock_facet(),
+                "gender": self.gender_facet(),
+                "has_sale": self.has_sale_facet(),
+                "price": self.price_facet(),
+            }
+        )
 
 
+class ProductPriceHistogramView(APIView):
+    """
+    Гистограмма price и effective_price (с учётом sales) для слайдера цены.
+    Учитываются все фильтры ProductFilter, кроме самих min_price/max_price.
+    """
 
+    def get_buckets(self):
+        try:
+            buckets = int(self.request.query_params["buckets"])
+        except (KeyError, ValueError):
+            return PRICE_HISTOGRAM_BUCKETS
+        return min(max(buckets, 1), MAX_PRICE_HISTOGRAM_BUCKETS)
 
-class ProductDetailUpdateDestroyView(RetrieveUpdateDestroyAPIView):
-    queryset = Product.objects.all().select_related("stock", "sub_category", "category")
+    @extend_schema(
+        tags=["catalog-product"],
+        parameters=[
+            OpenApiParameter(
+                name="buckets",
+                description=f"Number of equal-width buckets (1-{MAX_PRICE_HISTOGRAM_BUCKETS})",
+                required=False,
+                type=int,
+            ),
+        ],
+    )
+    @catalog_conditional("price-histogram")
+    def get(self, request, *args, **kwargs):
+        queryset = ProductFilter.facet_queryset(
+            request.query_params, exclude=("min_price", "max_price"), request=request
+        )
+        return Response(price_histogram(queryset, self.get_buckets()))
+
+
+class ProductBoughtTogetherView(APIView):
+    """
+    "Часто покупают вместе" для корзины или детали продукта:
+    ?products=1,2,3 — компаньоны по истории заказов (ProductCompanion).
+    """
+
+    max_products = 50
+
+    def get_product_ids(self):
+        raw = self.request.query_params.get("products", "")
+        try:
+            product_ids = {int(value) for value in raw.split(",") if value.strip()}
+        except ValueError:
+            raise ValidationError({"products": "Comma-separated product IDs expected"})
+        if not product_ids:
+            raise ValidationError({"products": "This parameter is required"})
+        return sorted(product_ids)[: self.max_products]
+
+    @extend_schema(
+        tags=["catalog-product"],
+        parameters=[
+            OpenApiParameter(
+                name="products",
+                description="Comma-separated product IDs (cart contents or a single product)",
+                required=True,
+                type=str,
+            ),
+        ],
+        responses=ProductCatalogRowSerializer(many=True),
+    )
+    @catalog_conditional("bought-together")
+    def get(self, request, *args, **kwargs):
+        ids = companion_ids(self.get_product_ids())
+        rows = ProductCatalogRow.objects.in_bulk(ids)
+        serializer = ProductCatalogRowSerializer(
+            [rows[pk] for pk in ids if pk in rows],
+            many=True,
+            context={"request": request},
+        )
+        return Response(serializer.data)
+
+
+class ProductDetailUpdateDestroyView(ProductDetailCacheMixin, RetrieveUpdateDestroyAPIView):
+    queryset = Product.objects.all().select_related(
+        "stock", "sub_category", "category", "index_category"
+    )
     serializer_class = ProductSerializer
     lookup_field = "slug"
 
     @extend_schema(tags=["products"])
+    @product_conditional
     def get(self, request, *args, **kwargs):
         # Обрабатывает GET-запросы для получения деталей продукта.
         return super().get(request, *args, **kwargs)
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.rows_written = getattr(serializer, "rows_written", None)
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        if settings.DEBUG and getattr(self, "rows_written", None) is not None:
+            response["X-Rows-Written"] = self.rows_written
+        return response
+
     @extend_schema(tags=["products"])
     def put(self, request, *args, **kwargs):
         # Обрабатывает PUT-запросы для обновления продукта.
@@ -688,7 +1154,8 @@ class SubmitOrderView(CreateAPIView):
 # added filter
 
 
-class OrderListView(ListAPIView):
+class OrderListView(EagerLoadingViewMixin, ListAPIView):
+    queryset = OrderUser.objects.all()
     serializer_class = OrderUserGetSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = OrderUserFilter
@@ -699,7 +1166,7 @@ class OrderListView(ListAPIView):
         Возвращает queryset объектов OrderUser, упорядоченных по дате создания,
         с предварительной загрузкой связанных объектов Order.
         """
-        return OrderUser.objects.prefetch_related("user_orders").order_by("-created_at")
+        return super().get_queryset().order_by("-created_at")
 
     @extend_schema(tags=["orders"])
     def get(self, request, *args, **kwargs):
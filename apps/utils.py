@@ -1,5 +1,6 @@
 import uuid
 
+from django.db import connection
 from rest_framework.exceptions import ValidationError
 
 
@@ -27,3 +28,82 @@ class SymbolValidationMixin:
     def validate(self, data):
         self.validate_symbols(data)
         return data
+
+
+class EagerLoadingMixin:
+    """
+    Сериализатор объявляет в Meta, какие связи ему нужны:
+
+        class Meta:
+            select_related = ("stock",)
+            prefetch_related = ("images",)
+            only = ("id", "title_uz", "stock__title_uz")
+
+    EagerLoadingViewMixin применяет объявления к queryset списка.
+    """
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        meta = getattr(cls, "Meta", None)
+        select_related = getattr(meta, "select_related", ())
+        prefetch_related = getattr(meta, "prefetch_related", ())
+        only = getattr(meta, "only", ())
+
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        if only:
+            queryset = queryset.only(*only)
+        return queryset
+
+
+class EagerLoadingViewMixin:
+    """Применяет объявления EagerLoadingMixin сериализатора к get_queryset()."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        setup_eager_loading = getattr(
+            self.get_serializer_class(), "setup_eager_loading", None
+        )
+        if setup_eager_loading is not None:
+            queryset = setup_eager_loading(queryset)
+        return queryset
+
+
+class RowsWrittenCounter:
+    """
+    Считает строки, записанные INSERT/UPDATE/DELETE внутри блока with
+    (для отладочного заголовка X-Rows-Written).
+    """
+
+    WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE")
+
+    def __init__(self):
+        self.counted = 0
+        self.returning_cursors = []
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        statement = sql.lstrip().upper()
+        if statement.startswith(self.WRITE_STATEMENTS):
+            if " RETURNING " in statement:
+                # rowcount известен только после чтения RETURNING (SQLite)
+                self.returning_cursors.append(context["cursor"])
+            else:
+                self.counted += max(context["cursor"].rowcount, 0)
+        return result
+
+    @property
+    def rows(self):
+        return self.counted + sum(
+            max(cursor.rowcount, 0) for cursor in self.returning_cursors
+        )
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._wrapper.__exit__(*exc_info)
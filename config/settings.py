@@ -151,6 +151,65 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Cache (в проде — общий для всех воркеров, например RedisCache)
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Кэш каталога, поиска и деталей продукта и ответы 304 держатся на счётчике
+# поколения каталога в кэше. Он должен быть общим для всех воркеров, поэтому
+# с LocMemCache и DummyCache кэш по умолчанию выключен (включение проверяет product.E001)
+CATALOG_CACHE_ENABLED = os.getenv(
+    "CATALOG_CACHE_ENABLED",
+    str(CACHES["default"]["BACKEND"] not in (
+        "django.core.cache.backends.locmem.LocMemCache",
+        "django.core.cache.backends.dummy.DummyCache",
+    )),
+).lower() == "true"
+
+# Индексы в памяти процесса (подсказки, нечёткий поиск без PostgreSQL) при
+# смене поколения каталога: "background" — пересборка в фоне, пока отдаётся
+# прежний индекс; "sync" — сразу в запросе. Без общего кэша поколение других
+# воркеров не видно, и индекс пересобирается не реже чем раз в MAX_AGE секунд
+# (столько же живут карты названий фильтров и ценовые массивы гистограммы)
+CATALOG_MEMORY_INDEX_REFRESH = os.getenv("CATALOG_MEMORY_INDEX_REFRESH", "background")
+CATALOG_MEMORY_INDEX_MAX_AGE = int(os.getenv("CATALOG_MEMORY_INDEX_MAX_AGE", 5 * 60))
+
+# Время жизни закэшированных страниц каталога и поиска (секунды)
+CATALOG_CACHE_TIMEOUT = int(os.getenv("CATALOG_CACHE_TIMEOUT", 60 * 60))
+
+# Деталь продукта: сколько хранить и сколько считать свежей (потом — обновление в фоне)
+PRODUCT_DETAIL_CACHE_TIMEOUT = int(os.getenv("PRODUCT_DETAIL_CACHE_TIMEOUT", 24 * 60 * 60))
+PRODUCT_DETAIL_CACHE_FRESH = int(os.getenv("PRODUCT_DETAIL_CACHE_FRESH", 5 * 60))
+
+# Каталог: отдавать ProductCatalogView из плоской таблицы ProductCatalogRow
+CATALOG_READ_MODEL = bool(os.environ.get("CATALOG_READ_MODEL", default="False").lower() == "true")
+
+# Каталог и поиск: сериализация values()-строк без полей DRF (тот же JSON)
+CATALOG_FAST_SERIALIZATION = bool(os.environ.get("CATALOG_FAST_SERIALIZATION", default="False").lower() == "true")
+
+# Сколько связанных продуктов хранить и отдавать в детали продукта
+RELATED_PRODUCTS_LIMIT = int(os.getenv("RELATED_PRODUCTS_LIMIT", 12))
+# Пересчёт связанных после изменения продуктов: "background" — фоновым потоком,
+# изменения за RELATED_PRODUCTS_REFRESH_DELAY секунд объединяются в один проход;
+# "sync" — сразу после коммита; "off" — только командой rebuild_related_products
+RELATED_PRODUCTS_REFRESH = os.getenv("RELATED_PRODUCTS_REFRESH", "background")
+RELATED_PRODUCTS_REFRESH_DELAY = float(os.getenv("RELATED_PRODUCTS_REFRESH_DELAY", 5))
+
+# "Часто покупают вместе": сколько хранить и минимум общих заказов для пары
+COMPANIONS_LIMIT = int(os.getenv("COMPANIONS_LIMIT", 8))
+COMPANIONS_MIN_SUPPORT = int(os.getenv("COMPANIONS_MIN_SUPPORT", 2))
+
+# Фиды для маркетплейсов: ссылка на продукт на сайте и Cache-Control max-age отдачи
+PRODUCT_FEED_LINK = os.getenv("PRODUCT_FEED_LINK", PROD_BASE_URL.rstrip("/") + "/product/{slug}")
+PRODUCT_FEED_MAX_AGE = int(os.getenv("PRODUCT_FEED_MAX_AGE", 60 * 60))
+
+# Поиск с опечатками (?fuzzy=true): минимальная доля совпавших триграмм запроса
+PRODUCT_FUZZY_SEARCH_THRESHOLD = float(os.getenv("PRODUCT_FUZZY_SEARCH_THRESHOLD", 0.5))
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 